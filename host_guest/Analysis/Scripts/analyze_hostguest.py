@@ -6,18 +6,24 @@
 
 import os
 import copy
+import json
+import hashlib
 import collections
 import pickle
+import concurrent.futures
 
 import numpy as np
 import pandas as pd
 import seaborn as sns
 from matplotlib import pyplot as plt
 
-from pkganalysis.submission import (SamplSubmission, IgnoredSubmissionError,
-                                    load_submissions, plot_correlation)
-from pkganalysis.stats import (compute_bootstrap_statistics, rmse, mae,
-                               me, r2, slope, kendall_tau)
+from pkganalysis.submission import (SamplSubmission, IgnoredSubmissionError, UserMap,
+                                    load_submissions, build_prediction_table, build_group_index, plot_correlation,
+                                    fingerprint_submission_files, read_submission_fingerprints,
+                                    write_submission_fingerprints, compare_submission_fingerprints)
+from pkganalysis.stats import (compute_bootstrap_statistics, bootstrap_random_state,
+                               compute_paired_bootstrap_statistics, compare_paired_bootstrap_statistics,
+                               rmse, mae, me, r2, slope, kendall_tau)
 
 
 # =============================================================================
@@ -60,6 +66,51 @@ HOST_GUEST_CB8_SUBMISSIONS_DIR_PATH = '/mnt/c/users/marty/desktop/SAMPL8_test/ho
 #HOST_GUEST_CD_SUBMISSIONS_DIR_PATH = '../Submissions/CD/'
 EXPERIMENTAL_DATA_FILE_PATH = '/mnt/c/users/marty/desktop/SAMPL8_test/host_guest/Analysis/ExperimentalMeasurements/experimental_measurements.csv'
 
+# Number of threads used to parse the submission files concurrently.
+N_LOAD_WORKERS = 4
+
+# Directory where the parsed submission files are cached between runs
+# (None disables the cache). It is next to this script's directory so
+# that the cache does not depend on the working directory.
+SUBMISSIONS_CACHE_DIR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'SubmissionsCache')
+
+# Content hashes of the submission files analyzed by the last complete run.
+# Used to report the submissions added, changed, or deleted since then
+# (see also watch_hostguest.py).
+SUBMISSIONS_FINGERPRINTS_FILE_PATH = '../submissions_fingerprints.json'
+
+# Number of worker processes used to compute the bootstrap statistics of
+# the groups in parallel (1 computes them serially in the main process).
+N_BOOTSTRAP_WORKERS = 1
+
+# Root seed of the bootstrap random number streams. Each group of each
+# collection gets its own independent stream so that the bootstrap
+# distributions are reproducible. Set to None to use fresh entropy.
+BOOTSTRAP_SEED = 8
+
+# Number of bootstrap samples used to compute the confidence intervals.
+N_BOOTSTRAP_SAMPLES = 10000
+
+# If True, the bootstrap distributions are summarized by mergeable quantile
+# sketches and histograms instead of storing all the bootstrap statistics.
+# This keeps memory and bootstrap_distributions.p small for large N_BOOTSTRAP_SAMPLES.
+STREAMING_BOOTSTRAP = False
+
+# If not None, the bootstrap of each group stops as soon as the bounds of the
+# confidence interval of each statistic differ by less than this fraction of
+# its width (e.g., 0.01) from those obtained with half the samples, and
+# N_BOOTSTRAP_SAMPLES is the maximum number of bootstrap samples. The
+# convergence is checked after the first 2000 samples.
+BOOTSTRAP_CI_TOLERANCE = None
+
+# The paired comparison only uses the systems predicted by all the groups.
+# A warning is printed if more than this fraction of the systems is dropped.
+PAIRED_COMPARISON_MAX_DROPPED_FRACTION = 0.1
+
+# If True, all pairs of methods are also compared with a paired bootstrap
+# (see HostGuestSubmissionCollection.generate_paired_comparison()).
+PAIRED_COMPARISON = False
+
 # Host color scheme.
 HOST_PALETTE = {
     'TEMOA': '#FFBE0C',
@@ -92,6 +143,9 @@ class HostGuestSubmission(SamplSubmission):
     ----------
     file_path : str
         The path to the submission file.
+    lazy : bool, optional
+        If True, the predictions are parsed only when self.data is first
+        accessed. Default is False.
 
     Raises
     ------
@@ -118,6 +172,15 @@ class HostGuestSubmission(SamplSubmission):
                         'index_col': 'System ID'}
     }
 
+    NUMERIC_CSV_COLUMNS = {
+        'Predictions': ('$\Delta$G', 'SEM $\Delta$G', 'd$\Delta$G', '$\Delta$H', 'SEM $\Delta$H', 'd$\Delta$H')
+    }
+
+    PREDICTION_QUANTITIES = {
+        '$\Delta$G': ('$\Delta$G', 'SEM $\Delta$G', 'd$\Delta$G'),
+        '$\Delta$H': ('$\Delta$H', 'SEM $\Delta$H', 'd$\Delta$H'),
+    }
+
     # Acceptable host names (in filenames) and the host IDs they correspond to
     #HOST_NAMES = { 'CLIP': ['CLIP'], 'CD':['bCD', 'MGLab_8', 'MGLab_9', 'MGLab_19', 'MGLab_23', 'MGLab_24', 'MGLab_34', 'MGLab_35', 'MGLab_36'],
     #            'GDCC':['OA', 'exoOA'] }
@@ -126,53 +189,47 @@ class HostGuestSubmission(SamplSubmission):
 
     RENAME_METHODS = {}
 
-    def __init__(self, file_path, user_map):
+    # Required system System IDs
+    CB8_guests = ['G1', 'G2', 'G3', 'G5', 'G6', 'G7']
+    #CD_guests = ['g1','g2']
+    GDCC_guests = ['G1', 'G2', 'G3', 'G4', 'G5']
+    #GDCC_hosts = copy.copy(HOST_NAMES['GDCC'])
+    #CD_hosts = copy.copy(HOST_NAMES['CD'])
+    #CD_hosts.remove('bCD')
+
+    REQUIRED_SYSTEM_IDs = {'CB8':[f'CB8-{guest}' for guest in CB8_guests],
+                           'GDCC':['TEMOA-G1', 'TEMOA-G2', 'TEMOA-G4', 'TEMOA-G5'] + ['TEETOA-G1', 'TEETOA-G2','TEETOA-G3',
+                               'TEETOA-G4', 'TEETOA-G5']}
+    #REQUIRED_SYSTEM_IDs = {'CB8':[f'CB8-{guest}' for guest in CB8_guests],
+    #                        'CD':[f'{host}-{guest}' for guest in CD_guests for host in CD_hosts],
+    #                         'GDCC':[f'exoOA-{guest}' for guest in GDCC_guests] + ['OA-g7', 'OA-g8']}
+
+    SECTIONS_CACHE_DIR_PATH = SUBMISSIONS_CACHE_DIR_PATH
+
+    def __init__(self, file_path, user_map, lazy=False):
         super().__init__(file_path, user_map)
 
         file_name = os.path.splitext(os.path.basename(file_path))[0]
         self.file_name = file_name
 
-        #TO DO:  Not sure if I'm going to use the immediately following for anything
-        file_name_simple = file_name.replace('_','-')
-        file_data = file_name_simple.split('-')
-        self.host_name = file_data[0]
+        self.host_name = self._parse_host_name(file_path)
+        assert self.host_name in self.HOST_NAMES
 
-        # Load predictions.
-        sections = self._load_sections(file_path)  # From parent-class.
-        self.data = sections['Predictions']  # This is a list
-        self.data = pd.DataFrame(data=self.data) # Now a DataFrame
+        # Load predictions. In lazy mode, only the metadata is parsed now.
+        sections = self._load_sections(file_path, metadata_only=lazy)  # From parent-class.
+        if not lazy:
+            self.data = self._build_data(sections)
         try:
             self.name = self.RENAME_METHODS[sections['Name'][0]]
         except KeyError:
             self.name = sections['Name'][0]
 
-
-        # Add host name column to predictions.
-        self.host_name = file_data[0].upper()
-        self.data['host_name'] = self.host_name
-        assert self.host_name in self.HOST_NAMES
-
         # Store participant name, organization, method category
         self.participant = sections['Participant name'][0].strip()
         self.category = sections['Category'][0].strip()
         self.organization = sections['Participant organization'][0].strip()
         self.ranked = sections['Ranked'][0].strip() =='True'
 
-        # Required system System IDs
-        CB8_guests = ['G1', 'G2', 'G3', 'G5', 'G6', 'G7']
-        #CD_guests = ['g1','g2']
-        GDCC_guests = ['G1', 'G2', 'G3', 'G4', 'G5']
-        #GDCC_hosts = copy.copy(self.HOST_NAMES['GDCC'])
-        #CD_hosts = copy.copy(self.HOST_NAMES['CD'])
-        #CD_hosts.remove('bCD')
-
-        self.REQUIRED_SYSTEM_IDs = {'CB8':[f'CB8-{guest}' for guest in CB8_guests], 
-                                    'GDCC':['TEMOA-G1', 'TEMOA-G2', 'TEMOA-G4', 'TEMOA-G5'] + ['TEETOA-G1', 'TEETOA-G2','TEETOA-G3', 
-                                        'TEETOA-G4', 'TEETOA-G5']}
-        #self.REQUIRED_SYSTEM_IDs = {'CB8':[f'CB8-{guest}' for guest in CB8_guests],
-        #                        'CD':[f'{host}-{guest}' for guest in CD_guests for host in CD_hosts],
-        #                         'GDCC':[f'exoOA-{guest}' for guest in GDCC_guests] + ['OA-g7', 'OA-g8']}
-
         # Check if this is a test submission.
         if self.sid in self.TEST_SUBMISSION_SIDS:
             raise IgnoredSubmissionError('This submission has been used for tests.')
@@ -182,18 +239,78 @@ class HostGuestSubmission(SamplSubmission):
         if self.sid in self.REF_SUBMISSION_SIDS:
             self.reference_submission = True
 
+    @staticmethod
+    def _parse_host_name(file_path):
+        """Return the host name encoded in the prefix of the file name."""
+        file_name = os.path.splitext(os.path.basename(file_path))[0]
+        #TO DO:  Not sure if I'm going to use the immediately following for anything
+        file_name_simple = file_name.replace('_','-')
+        file_data = file_name_simple.split('-')
+        return file_data[0].upper()
+
+    @classmethod
+    def _validate_sections(cls, file_path, sections):
+        """Check the host name and the predictions of the required systems."""
+        errors = super()._validate_sections(file_path, sections)
+        host_name = cls._parse_host_name(file_path)
+        if host_name not in cls.HOST_NAMES:
+            errors.append('In file {}, unknown host name {} (expected one of {}).'.format(
+                file_path, host_name, ', '.join(cls.HOST_NAMES)))
+        else:
+            system_ids = set(sections['Predictions'].index)
+            missing_system_ids = [system_id for system_id in cls.REQUIRED_SYSTEM_IDs[host_name]
+                                  if system_id not in system_ids]
+            if len(missing_system_ids) > 0:
+                errors.append('In file {}, missing predictions for required systems: {}.'.format(
+                    file_path, ', '.join(missing_system_ids)))
+        return errors
+
+    def _get_prediction_metadata(self):
+        return {
+            'sid': self.sid,
+            'participant': self.participant,
+            'method': self.name,
+            'host_name': self.host_name,
+            'category': self.category,
+            'ranked': self.ranked,
+            'reference_submission': self.reference_submission,
+        }
+
+    def _build_data(self, sections):
+        data = sections['Predictions']  # This is a list
+        data = pd.DataFrame(data=data) # Now a DataFrame
+        # Add host name column to predictions.
+        data['host_name'] = self.host_name
+        return data
+
     def __add__(self, other):
         """Merge the data of the two submission."""
-        merged_submission = copy.deepcopy(self)
-        merged_submission.sid = '{} + {}'.format(*sorted([self.sid, other.sid]))
-        merged_submission.host_name = '{} + {}'.format(*sorted([self.host_name, other.host_name]))
+        return self.merge([self, other])
 
-        # Check if this is already a merged submission.
-        if isinstance(merged_submission.file_name, list):
-            merged_submission.file_name = sorted([*merged_submission.file_name, other.file_name])
-        else:
-            merged_submission.file_name = sorted([merged_submission.file_name, other.file_name])
-        merged_submission.data = pd.concat([merged_submission.data, other.data])
+    @classmethod
+    def merge(cls, submissions):
+        """Merge the data of several submissions (e.g., the same method applied to different hosts).
+
+        The merged submission shares the metadata of the first submission. Its
+        sid and host_name join the sorted sids and host names of the submissions
+        with ' + ', its file_name is the sorted list of all the file names, and
+        its data are the data of all the submissions concatenated in order.
+        """
+        merged_submission = copy.copy(submissions[0])
+        merged_submission.sid = ' + '.join(sorted(submission.sid for submission in submissions))
+        merged_submission.host_name = ' + '.join(sorted(submission.host_name for submission in submissions))
+
+        # Some of the submissions may already be merged submissions.
+        file_names = []
+        for submission in submissions:
+            if isinstance(submission.file_name, list):
+                file_names.extend(submission.file_name)
+            else:
+                file_names.append(submission.file_name)
+        merged_submission.file_name = sorted(file_names)
+
+        # Concatenate the data once.
+        merged_submission.data = pd.concat([submission.data for submission in submissions])
         return merged_submission
 
     def split(self, names_to_separate):
@@ -202,27 +319,21 @@ class HostGuestSubmission(SamplSubmission):
 
         Takes a list of host names (as used for the individual data points) to separate based on.
 
-        Returns a list of the new HostGuestSubmission objects, of length equal to `names_to_separate`"""
+        Returns a list of the new HostGuestSubmission objects, of length equal to `names_to_separate`.
+        The new submissions share the metadata of this submission (they are shallow copies)
+        and their data are row selections of self.data, so splitting does not copy the metadata."""
 
-        # Find how many submissions we're making and make new submissions, duplicating old
-        n_submissions = len(names_to_separate)
-        new_submissions = [copy.deepcopy(self) for i in range(n_submissions)]
+        # Compute the host prefix of each system ID once and find the rows of each host.
+        host_prefixes = self.data.index.str.split('-', n=1).str[0]
+        host_rows = pd.RangeIndex(len(self.data)).groupby(host_prefixes)
 
-
-
-        # Build list of system IDs we want
-        for (idx, submission) in enumerate(new_submissions):
-            desired_IDs = []
-            for system_id, series in submission.data[['$\Delta$G', 'd$\Delta$G', '$\Delta$H']].iterrows():
-                tmp = system_id.split('-')
-                if tmp[0] == names_to_separate[idx]:
-                    desired_IDs.append( system_id )
-
-            # Grab just that data and store
-            new_submissions[idx].data = submission.data.loc[desired_IDs]
-            # Change the host name to what's correct for this host
-            new_submissions[idx].data.host_name = names_to_separate[idx]
-            new_submissions[idx].host_name = names_to_separate[idx]
+        new_submissions = []
+        for host_name in names_to_separate:
+            new_submission = copy.copy(self)
+            # Grab just that data and change the host name to what's correct for this host.
+            new_submission.data = self.data.iloc[host_rows.get(host_name, [])].assign(host_name=host_name)
+            new_submission.host_name = host_name
+            new_submissions.append(new_submission)
 
         return new_submissions
 
@@ -239,72 +350,226 @@ class HostGuestSubmissionCollection:
     ENTHALPIES_CORRELATION_PLOT_DIR = 'EnthalpiesCorrelationPlots'
     MOLECULE_CORRELATION_PLOT_PATH = 'molecules_error.pdf'
 
+    # Columns of self.data stored as categoricals.
+    IDENTIFIER_COLUMNS = ['sid', 'participant', 'name', 'method', 'system_id', 'host_name']
+
     _ROW_HEIGHT = 0.25
 
 
-    def __init__(self, submissions, experimental_data, output_directory_path, ignore_refcalcs = True, ranked_only = True, allow_multiple = False):
+    def __init__(self, submissions, experimental_data, output_directory_path, ignore_refcalcs = True, ranked_only = True, allow_multiple = False,
+                 host_names=None, excluded_system_ids=None,
+                 n_bootstrap_workers=None, bootstrap_seed=None, n_bootstrap_samples=None,
+                 streaming_bootstrap=None, bootstrap_ci_tolerance=None):
         # Use "allow_multiple" if we're using a submission collection which is aggregated across several hosts
         # in which case participants may have a ranked submission in each separate host.
+        # Use "host_names" and "excluded_system_ids" to select only some hosts and systems (see also view()).
+
+        # Number of processes used to bootstrap the groups (default is N_BOOTSTRAP_WORKERS).
+        if n_bootstrap_workers is None:
+            n_bootstrap_workers = N_BOOTSTRAP_WORKERS
+        self.n_bootstrap_workers = n_bootstrap_workers
+
+        # Root seed of the bootstrap random streams (default is BOOTSTRAP_SEED).
+        if bootstrap_seed is None:
+            bootstrap_seed = BOOTSTRAP_SEED
+        self.bootstrap_seed = bootstrap_seed
+
+        # Number of bootstrap samples (default is N_BOOTSTRAP_SAMPLES) and whether to
+        # summarize the bootstrap distributions with sketches (default is STREAMING_BOOTSTRAP).
+        if n_bootstrap_samples is None:
+            n_bootstrap_samples = N_BOOTSTRAP_SAMPLES
+        self.n_bootstrap_samples = n_bootstrap_samples
+        if streaming_bootstrap is None:
+            streaming_bootstrap = STREAMING_BOOTSTRAP
+        self.streaming_bootstrap = streaming_bootstrap
+
+        # Tolerance of the adaptive bootstrap (default is BOOTSTRAP_CI_TOLERANCE).
+        if bootstrap_ci_tolerance is None:
+            bootstrap_ci_tolerance = BOOTSTRAP_CI_TOLERANCE
+        self.bootstrap_ci_tolerance = bootstrap_ci_tolerance
+
+        # The predictions of all the submissions in a single table. The prediction table
+        # can be built once with build_prediction_table() and shared by several collections.
+        if isinstance(submissions, pd.DataFrame):
+            prediction_table = submissions
+        else:
+            prediction_table = build_prediction_table(submissions)
 
-        # Build full free energy table.
-        data = []
+        # Join the predictions of all the submissions to the experimental data once.
+        # The collection data is a selection of these rows (see view()).
+        self._submissions_table = prediction_table.drop_duplicates('submission_index')
+        self._joined_data = self._join_experimental_data(prediction_table, experimental_data)
 
-        # Participant names we've found so far; tracked to ensure no one has more than one
-        # ranked submission
-        self.participant_names_ranked = []
+        # Bootstrap statistics computed by this collection and its views,
+        # indexed by group data (see _get_bootstrap_statistics()).
+        self._bootstrap_statistics_memo = {}
 
-        # Submissions free energies and enthalpies.
-        for submission in submissions:
-            # Ignore reference calculations, if applicable
-            if submission.reference_submission and ignore_refcalcs:
-                continue
+        self.output_directory_path = output_directory_path
+        self.data, self.participant_names_ranked = self._select_data(
+            host_names, ignore_refcalcs, ranked_only, allow_multiple, excluded_system_ids)
 
-            if ranked_only and not submission.ranked:
-                continue
+        # Create general output directory. A collection without output directory
+        # is only used to derive views (see view()).
+        if self.output_directory_path is not None:
+            os.makedirs(self.output_directory_path, exist_ok=True)
 
-            # Store names associated with ranked submission, skip if they submitted multiple (only if we need to check for duplicate authors)
-            if submission.ranked and not allow_multiple:
-                if not submission.participant in self.participant_names_ranked:
-                    self.participant_names_ranked.append(submission.participant)
-                else:
-                    print(f"Error: {submission.participant} submitted multiple ranked submissions.")
-                    continue
+    def view(self, output_directory_path=None, host_names=None, ignore_refcalcs=True, ranked_only=True,
+             allow_multiple=False, excluded_system_ids=None):
+        """Return a collection with a subset of the submissions and systems.
 
-            for system_id, series in submission.data[['$\Delta$G', 'd$\Delta$G', '$\Delta$H']].iterrows():
-                try: #Load experimental data
-                    free_energy_expt = experimental_data.loc[system_id, '$\Delta$G']
-                    enthalpy_expt = experimental_data.loc[system_id, '$\Delta$H']
-                except KeyError: #But if there's no data for this one, skip
-                    continue
-                free_energy_calc = series['$\Delta$G']
-                free_energy_calc_sem = series['d$\Delta$G']
-                enthalpy_calc = series['$\Delta$H']
-                ranked = submission.ranked
-
-
-                data.append({
-                    'sid': submission.sid,
-                    'participant': submission.participant,
-                    'name': submission.name,
-                    #'method': self._assign_paper_method_name(submission.name),
-                    'method': submission.name, # Make this duplicate name for now, as right now name does somewhat describe method. TO DO
-                    'system_id': system_id,
-                    'host_name': submission.host_name,
-                    '$\Delta$G (calc) [kcal/mol]': free_energy_calc,
-                    'd$\Delta$G (calc) [kcal/mol]': free_energy_calc_sem,
-                    '$\Delta$G (expt) [kcal/mol]': free_energy_expt,
-                    '$\Delta\Delta$G error (calc - expt)  [kcal/mol]': free_energy_calc - free_energy_expt,
-                    '$\Delta$H (calc) [kcal/mol]': enthalpy_calc,
-                    '$\Delta$H (expt) [kcal/mol]': enthalpy_expt,
-                    '$\Delta\Delta$H error (calc - expt)  [kcal/mol]': enthalpy_calc - enthalpy_expt
-                })
-
-        # Transform into Pandas DataFrame.
-        self.data = pd.DataFrame(data=data)
-        self.output_directory_path = output_directory_path
+        The view is selected among all the submissions given to the constructor,
+        not only those in self.data, with the same criteria used by the constructor.
+        The joined table is not rebuilt. The view shares the bootstrap
+        statistics of the groups whose data is identical with this collection
+        and all its other views.
 
-        # Create general output directory.
-        os.makedirs(self.output_directory_path, exist_ok=True)
+        Parameters
+        ----------
+        output_directory_path : str, optional
+            The output directory of the view. Default is the same as this collection.
+        host_names : iterable of str, optional
+            If given, only the submissions for these hosts are selected.
+        excluded_system_ids : iterable of str, optional
+            The systems to exclude (e.g., optional host-guest systems).
+
+        Returns
+        -------
+        view : HostGuestSubmissionCollection
+            The new collection.
+        """
+        view = copy.copy(self)
+        if output_directory_path is not None:
+            view.output_directory_path = output_directory_path
+            os.makedirs(view.output_directory_path, exist_ok=True)
+        view.data, view.participant_names_ranked = self._select_data(
+            host_names, ignore_refcalcs, ranked_only, allow_multiple, excluded_system_ids)
+        return view
+
+    @property
+    def data(self):
+        """The table with the predictions and experimental data of the collection.
+
+        The rows of each group are indexed lazily (see _get_group_index()).
+        Assign a new table rather than adding or removing rows in place so
+        that the group indices are rebuilt.
+        """
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+        # Do not clear the dictionary, which may be shared with other views.
+        self._group_indices = {}
+
+    def _get_group_index(self, groupby):
+        """Return the positions of the rows of each group of self.data.
+
+        The index (see build_group_index()) is built the first time it is
+        needed for each groupby column and discarded when self.data is replaced.
+
+        Returns
+        -------
+        group_index : collections.OrderedDict
+            group -> numpy.ndarray with the positions of the rows of the group
+            in self.data. The groups are in order of first appearance.
+        """
+        try:
+            return self._group_indices[groupby]
+        except KeyError:
+            group_index = build_group_index(self.data[groupby])
+            self._group_indices[groupby] = group_index
+            return group_index
+
+    @staticmethod
+    def _join_experimental_data(prediction_table, experimental_data):
+        """Build the table of all the free energy predictions joined to the experimental data.
+
+        Systems without experimental data are skipped.
+        """
+        # Submissions free energies and enthalpies (rows are in the same order for both quantities).
+        free_energies = prediction_table[prediction_table.quantity == '$\Delta$G']
+        enthalpies = prediction_table[prediction_table.quantity == '$\Delta$H']
+
+        # Join the experimental data on the system ID. Skip the systems without experimental data.
+        expt_indices = experimental_data.index.get_indexer(free_energies.system_id)
+        has_expt = expt_indices != -1
+        expt_indices = expt_indices[has_expt]
+        free_energies = free_energies[has_expt]
+        enthalpies = enthalpies[has_expt]
+        free_energy_calc = free_energies.value.to_numpy()
+        enthalpy_calc = enthalpies.value.to_numpy()
+        free_energy_expt = experimental_data['$\Delta$G'].to_numpy()[expt_indices]
+        enthalpy_expt = experimental_data['$\Delta$H'].to_numpy()[expt_indices]
+
+        # Build full free energy table. The identifier columns are kept as categoricals.
+        return pd.DataFrame({
+            'submission_index': free_energies.submission_index.to_numpy(),
+            'sid': free_energies.sid.values,
+            'participant': free_energies.participant.values,
+            'name': free_energies.method.values,
+            #'method': self._assign_paper_method_name(name),
+            'method': free_energies.method.values, # Make this duplicate name for now, as right now name does somewhat describe method. TO DO
+            'system_id': free_energies.system_id.values,
+            'host_name': free_energies.host_name.values,
+            '$\Delta$G (calc) [kcal/mol]': free_energy_calc,
+            'd$\Delta$G (calc) [kcal/mol]': free_energies.model_uncertainty.to_numpy(),
+            '$\Delta$G (expt) [kcal/mol]': free_energy_expt,
+            '$\Delta\Delta$G error (calc - expt)  [kcal/mol]': free_energy_calc - free_energy_expt,
+            '$\Delta$H (calc) [kcal/mol]': enthalpy_calc,
+            '$\Delta$H (expt) [kcal/mol]': enthalpy_expt,
+            '$\Delta\Delta$H error (calc - expt)  [kcal/mol]': enthalpy_calc - enthalpy_expt
+        })
+
+    def _select_data(self, host_names, ignore_refcalcs, ranked_only, allow_multiple, excluded_system_ids):
+        """Select the rows of the joined table satisfying the criteria.
+
+        Returns
+        -------
+        data : pandas.DataFrame
+            The collection data.
+        participant_names_ranked : list of str
+            The participants with a ranked submission (only if allow_multiple is False).
+        """
+        # Select the submissions (one row per submission).
+        submissions_table = self._submissions_table
+        is_ranked = submissions_table.ranked.to_numpy(dtype=bool)
+        is_selected = np.ones(len(submissions_table), dtype=bool)
+        if host_names is not None:
+            is_selected &= submissions_table.host_name.isin(host_names).to_numpy()
+        # Ignore reference calculations, if applicable
+        if ignore_refcalcs:
+            is_selected &= ~submissions_table.reference_submission.to_numpy(dtype=bool)
+        if ranked_only:
+            is_selected &= is_ranked
+
+        # Participant names we've found so far; tracked to ensure no one has more than one
+        # ranked submission
+        participant_names_ranked = []
+
+        # Store names associated with ranked submission, skip if they submitted multiple (only if we need to check for duplicate authors)
+        if not allow_multiple:
+            ranked_indices = np.flatnonzero(is_selected & is_ranked)
+            participants = submissions_table.participant.iloc[ranked_indices]
+            is_duplicated = participants.duplicated().to_numpy()
+            for participant in participants[is_duplicated]:
+                print(f"Error: {participant} submitted multiple ranked submissions.")
+            is_selected[ranked_indices[is_duplicated]] = False
+            participant_names_ranked = list(participants[~is_duplicated])
+
+        # Select the rows of the joined table. With pandas copy-on-write, the
+        # columns are shared with the joined table if all the rows are selected.
+        joined_data = self._joined_data
+        selected_submissions = submissions_table.submission_index[is_selected]
+        is_selected = joined_data.submission_index.isin(selected_submissions).to_numpy()
+        if excluded_system_ids is not None:
+            is_selected = is_selected & ~joined_data.system_id.isin(excluded_system_ids).to_numpy()
+        data = joined_data.drop(columns='submission_index')
+        if not is_selected.all():
+            data = data[is_selected].reset_index(drop=True)
+        # Keep only the identifiers of the selected rows in the categories.
+        for column in self.IDENTIFIER_COLUMNS:
+            data[column] = data[column].cat.remove_unused_categories()
+        return data, participant_names_ranked
 
     @staticmethod
     def _assign_method_class(name):
@@ -421,10 +686,25 @@ class HostGuestSubmissionCollection:
                                          directory_path=self.ENTHALPIES_CORRELATION_PLOT_DIR)
 
     def _generate_correlation_plots(self, x, y, directory_path):
+        """Generate the correlation plot of each submission.
+
+        A fingerprint of the data of each plot is saved in the output directory,
+        and only the plots of the submissions that were added or changed since
+        the last run are generated again. The plots of deleted submissions are removed.
+        """
         output_dir_path = os.path.join(self.output_directory_path, directory_path)
         os.makedirs(output_dir_path, exist_ok=True)
-        for sid in self.data.sid.unique():
-            data = self.data[self.data.sid == sid]
+
+        fingerprints_file_path = os.path.join(output_dir_path, 'fingerprints.json')
+        try:
+            with open(fingerprints_file_path, 'r') as f:
+                cached_fingerprints = json.load(f)
+        except FileNotFoundError:
+            cached_fingerprints = {}
+        fingerprints = {}
+
+        for sid, rows in self._get_group_index('sid').items():
+            data = self.data.iloc[rows]
 
             # If this is a merged submission, we need a hue.
             host_names = data.host_name.unique()
@@ -439,13 +719,27 @@ class HostGuestSubmissionCollection:
             if data[y].isnull().any():
                 continue
 
+            # Skip the plot if its data did not change since the last run.
+            output_path = os.path.join(output_dir_path, '{}.pdf'.format(sid))
+            fingerprints[sid] = hashlib.sha256((title + data.to_csv(index=False)).encode()).hexdigest()
+            if cached_fingerprints.get(sid) == fingerprints[sid] and os.path.isfile(output_path):
+                continue
+
             plt.close('all')
             plot_correlation(x=x, y=y, data=data, title=title, hue=hue)
             plt.tight_layout(pad=0.2)
             # plt.show()
-            output_path = os.path.join(output_dir_path, '{}.pdf'.format(sid))
             plt.savefig(output_path)
 
+        # Remove the plots of the submissions that are not in the collection anymore.
+        for sid in set(cached_fingerprints) - set(fingerprints):
+            try:
+                os.remove(os.path.join(output_dir_path, '{}.pdf'.format(sid)))
+            except FileNotFoundError:
+                pass
+        with open(fingerprints_file_path, 'w') as f:
+            json.dump(fingerprints, f, indent=4, sort_keys=True)
+
 
     def generate_molecules_plot(self):
         # Correlation plot by molecules.
@@ -453,7 +747,7 @@ class HostGuestSubmissionCollection:
         n_rows = len(self.data.system_id.unique())
         fig, ax = plt.subplots(figsize=(6, 0.4*n_rows))
         sns.violinplot(y='system_id', x='$\Delta\Delta$G error (calc - expt)  [kcal/mol]',
-                       data=self.data, linewidth=1.0, inner='point', cut=0, ax=ax)
+                       data=self.data, order=self.data.system_id.unique(), linewidth=1.0, inner='point', cut=0, ax=ax)
         plt.tight_layout(pad=0.2)
         # plt.show()
         plt.savefig(os.path.join(self.output_directory_path, self.MOLECULE_CORRELATION_PLOT_PATH))
@@ -498,16 +792,16 @@ class HostGuestSubmissionCollection:
         statistics_csv = []
         statistics_latex = []
 
-        groups = self.data[groupby].unique()
-        for i, group in enumerate(groups):
+        group_index = self._get_group_index(groupby)
+        for i, (group, rows) in enumerate(group_index.items()):
             print('\rGenerating bootstrap statistics tables for {} {} ({}/{})'
-                  ''.format(groupby, group, i+1, len(groups)), end='')
+                  ''.format(groupby, group, i+1, len(group_index)), end='')
 
             # Isolate bootstrap statistics.
             bootstrap_statistics = all_bootstrap_statistics[group]
 
             # Select the group.
-            data = self.data[self.data[groupby] == group]
+            data = self.data.iloc[rows]
 
             # Isolate the extra field.
             group_fields = {}
@@ -520,15 +814,21 @@ class HostGuestSubmissionCollection:
 
             record_csv = {}
             record_latex = {}
+            n_bootstrap_samples = 0
             for stats_name, (stats, (lower_bound, upper_bound), bootstrap_samples) in bootstrap_statistics.items():
                 # For CSV and JSON we put confidence interval in separate columns.
                 for suffix, info in zip(ci_suffixes, [stats, lower_bound, upper_bound]):
                     record_csv[stats_name + suffix] = info
 
+                # The adaptive bootstrap may have stopped before self.n_bootstrap_samples,
+                # and the exact bootstrap evaluates a different number of samples.
+                n_bootstrap_samples = max(n_bootstrap_samples, len(bootstrap_samples))
+
                 # For the PDF, print bootstrap CI in the same column.
                 stats_name_latex = latex_header_conversions.get(stats_name, stats_name)
                 record_latex[stats_name_latex] = '{:.2f} [{:.2f}, {:.2f}]'.format(stats, lower_bound, upper_bound)
 
+            record_csv['n_bootstrap_samples'] = n_bootstrap_samples
             statistics_csv.append({'ID': group, **group_fields, **record_csv})
             statistics_latex.append({'ID': escape(group), **latex_group_fields,
                                      **record_latex})
@@ -553,7 +853,7 @@ class HostGuestSubmissionCollection:
         # Reorder columns that were scrambled by going through a dictionaries.
         stats_names_csv = [name + suffix for name in stats_names for suffix in ci_suffixes]
         stats_names_latex = [latex_header_conversions.get(name, name) for name in stats_names]
-        statistics_csv = statistics_csv[extra_fields + stats_names_csv]
+        statistics_csv = statistics_csv[extra_fields + stats_names_csv + ['n_bootstrap_samples']]
         statistics_latex = statistics_latex[['ID'] + extra_fields_latex + stats_names_latex]
 
         # Create CSV and JSON tables (correct LaTex syntax in column names).
@@ -583,6 +883,117 @@ class HostGuestSubmissionCollection:
             f.write(caption + '\n')
             f.write('\end{document}\n')
 
+    def generate_paired_comparison(self, stats_funcs, subdirectory_path, groupby='name',
+                                   ordering_functions=None, percentile=0.95):
+        """Compare all pairs of groups (e.g. methods) with a paired bootstrap.
+
+        All groups are bootstrapped in a single pass over the same system_id
+        re-sampling indices so that, for each pair of groups, the distribution
+        of the difference of the statistics and the probability that one group
+        is better than the other can be estimated. Only the systems for which
+        all groups have a prediction are used.
+
+        The CSV table paired_comparison.csv reports, for each pair of groups and
+        statistic, the difference (group1 - group2) with its confidence interval
+        and the probability that group1 is better than group2. The matrices of
+        these probabilities are also saved as statisticname_probability_better.csv.
+
+        Parameters
+        ----------
+        groupby : str
+            The name of the data column identifying the groups to compare.
+        ordering_functions : dict
+            Dictionary statistic_name -> ordering_function(stats), where
+            a group is better than another if ordering_function(stats) is
+            smaller. By default, smaller statistics are better.
+        """
+        if ordering_functions is None:
+            ordering_functions = {}
+        stats_names, stats_funcs = zip(*stats_funcs.items())
+        directory_path = os.path.join(self.output_directory_path, subdirectory_path)
+
+        # Build the (n_groups, n_systems) tables of predictions shared by all groups.
+        calc = self.data.pivot(index='system_id', columns=groupby, values='$\Delta$G (calc) [kcal/mol]')
+        sems = self.data.pivot(index='system_id', columns=groupby, values='d$\Delta$G (calc) [kcal/mol]')
+        expt = self.data.groupby('system_id')['$\Delta$G (expt) [kcal/mol]'].first()
+        system_ids = calc.index[calc.notna().all(axis=1)]
+        groups = list(calc.columns)
+        if len(groups) < 2 or len(system_ids) == 0:
+            print('Paired comparison: skipped, {} {} with {} systems predicted by all of them.'
+                  ''.format(len(groups), groupby, len(system_ids)))
+            return
+        if len(system_ids) < len(calc.index):
+            dropped_system_ids = calc.index.difference(system_ids)
+            print('Paired comparison: ignoring systems without predictions from all groups: {}'
+                  ''.format(', '.join(str(s) for s in dropped_system_ids)))
+            if len(dropped_system_ids) > PAIRED_COMPARISON_MAX_DROPPED_FRACTION * len(calc.index):
+                incomplete_groups = calc.columns[calc.loc[dropped_system_ids].isna().any(axis=0)]
+                print('Warning: the paired comparison uses only {} of {} systems because of the '
+                      'incomplete {}: {}'.format(len(system_ids), len(calc.index), groupby,
+                                                 ', '.join(str(g) for g in incomplete_groups)))
+        # As in _get_bootstrap_statistics(), the predictions of a group are re-sampled
+        # only if it reports the SEMs of all its predictions. Experimental values are
+        # never re-sampled.
+        groups_without_sems = self.data.groupby(groupby)['d$\Delta$G (calc) [kcal/mol]'].apply(
+            lambda group_sems: group_sems.isna().any())
+        sems.loc[:, groups_without_sems[groups].values] = 0.0
+        calc = calc.loc[system_ids].values.T
+        sems = sems.loc[system_ids].values.T
+        expt = expt.loc[system_ids].values
+
+        samples = np.stack([np.broadcast_to(expt, calc.shape), calc], axis=-1)
+        sems = np.stack([np.zeros(sems.shape), sems], axis=-1)
+        if np.all(sems == 0.0):
+            sems = None
+
+        # Skip the comparison if the data and the settings did not change since the last run.
+        fingerprint = hashlib.sha256(repr((self._get_bootstrap_fingerprint(samples, sems),
+                                           groups, stats_names, percentile)).encode()).hexdigest()
+        fingerprint_file_path = os.path.join(directory_path, 'fingerprint.json')
+        try:
+            with open(fingerprint_file_path, 'r') as f:
+                if json.load(f)['fingerprint'] == fingerprint:
+                    print('Paired comparison: {} {} unchanged since the last run.'.format(len(groups), groupby))
+                    return
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+
+        print('Generating paired bootstrap statistics for {} {}'.format(len(groups), groupby))
+        statistics, bootstrap_samples_statistics = compute_paired_bootstrap_statistics(
+            samples, stats_funcs, n_bootstrap_samples=self.n_bootstrap_samples, sems=sems,
+            random_state=self._get_bootstrap_random_state(groupby, 'paired comparison', fingerprint))
+
+        # Collect the records for the DataFrame.
+        comparison_csv = []
+        os.makedirs(directory_path, exist_ok=True)
+        for stats_idx, stats_name in enumerate(stats_names):
+            comparison = compare_paired_bootstrap_statistics(
+                statistics[stats_idx], bootstrap_samples_statistics[stats_idx], percentile=percentile,
+                ordering_function=ordering_functions.get(stats_name, None))
+            for i, group1 in enumerate(groups):
+                for j, group2 in enumerate(groups):
+                    if i == j:
+                        continue
+                    comparison_csv.append({
+                        groupby + '1': group1,
+                        groupby + '2': group2,
+                        'statistic': stats_name,
+                        'delta': comparison['delta'][i][j],
+                        'delta_lower_bound': comparison['delta_lower_bound'][i][j],
+                        'delta_upper_bound': comparison['delta_upper_bound'][i][j],
+                        'probability_better': comparison['probability_better'][i][j],
+                    })
+
+            probability_better = pd.DataFrame(comparison['probability_better'], index=groups, columns=groups)
+            probability_better.to_csv(os.path.join(directory_path, stats_name + '_probability_better.csv'))
+
+        comparison_csv = pd.DataFrame(comparison_csv)
+        comparison_csv.to_csv(os.path.join(directory_path, 'paired_comparison.csv'), index=False)
+
+        # Write the fingerprint last so that an interrupted run is repeated.
+        with open(fingerprint_file_path, 'w') as f:
+            json.dump({'fingerprint': fingerprint}, f, indent=4)
+
     def plot_bootstrap_distributions(self, stats_funcs, subdirectory_path, groupby,
                                      ordering_functions=None, latex_header_conversions=None,
                                      stats_limits=None, exclusions=frozenset(),
@@ -702,7 +1113,7 @@ class HostGuestSubmissionCollection:
         ordering_data = []
         statistics_plot = []
 
-        groups = self.data[groupby].unique()
+        groups = list(self._get_group_index(groupby))
         for i, group in enumerate(groups):
             print('\rCollecting bootstrap statistics for {} {} ({}/{})'
                   ''.format(groupby, group, i+1, len(groups)), end='')
@@ -732,16 +1143,27 @@ class HostGuestSubmissionCollection:
         """Generate the bootstrap distributions of all groups and cache them.
 
         If cached values are found on disk, the distributions are not recomputed.
+        The cache also records a fingerprint of the data and of the bootstrap
+        settings of each group so that, when submissions are added, changed,
+        or deleted, only the groups whose data changed are bootstrapped again.
+        If self.n_bootstrap_workers is greater than 1, the groups are distributed
+        among a pool of worker processes. Each group is bootstrapped with its own
+        random stream (see _get_bootstrap_random_state()) so the result does not
+        depend on the number of workers.
 
         Returns
         -------
         all_bootstrap_statistics : collections.OrderedDict
             group -> {stats_name -> (statistics, confidence_interval, bootstrap_samples)}
             confidence_interval is a pair (lower_bound, upper_bound), and bootstrap_samples
-            are the (ordered) bootstrap statistics used to compute the confidence interval.
+            are the (ordered) bootstrap statistics used to compute the confidence interval,
+            a BootstrapDistributionSketch if self.streaming_bootstrap is True, or an
+            ExactBootstrapDistribution for the groups small enough to enumerate all
+            their bootstrap samples (see compute_bootstrap_statistics()).
         """
-        # Identify all the groups (e.g. methods/molecules).
-        groups = self.data[groupby].unique()
+        # Identify all the groups (e.g. methods/molecules) and their rows.
+        group_index = self._get_group_index(groupby)
+        groups = list(group_index)
 
         # Initialize returned value. The OrderedDict maintains the order of statistics.
         all_bootstrap_statistics = collections.OrderedDict([(name, None) for name in stats_names])
@@ -757,6 +1179,18 @@ class HostGuestSubmissionCollection:
         except FileNotFoundError:
             cached_bootstrap_statistics = None
 
+        # Load the fingerprints of the cached groups. Groups without a
+        # fingerprint (e.g., cached by older versions) are recomputed.
+        fingerprints_file_path = os.path.splitext(cache_file_path)[0] + '_fingerprints.json'
+        try:
+            with open(fingerprints_file_path, 'r') as f:
+                all_fingerprints = json.load(f)
+        except FileNotFoundError:
+            all_fingerprints = {}
+        cached_fingerprints = all_fingerprints.get(groupby, {})
+        fingerprints = {}
+        memo_updated = False
+
         # Create a map from paper method name to submission method name.
         try:
             paper_to_submission_name = {self._assign_paper_method_name(submission_name): submission_name
@@ -765,10 +1199,26 @@ class HostGuestSubmissionCollection:
             # cached_bootstrap_statistics is None or group is not a method.
             paper_to_submission_name = {}
 
-        cache_updated = False
-        for i, (group, group_bootstrap_statistics) in enumerate(all_bootstrap_statistics.items()):
+        # Collect the bootstrap calculations that must be performed.
+        # Each group is independent so they can be computed in parallel.
+        bootstrap_tasks = collections.OrderedDict()
+        for group in groups:
+            # Select the group data.
+            data = self.data.iloc[group_index[group]]
+
+            # Check if SEMs for the free energies are reported.
+            sems = data['d$\Delta$G (calc) [kcal/mol]'].values
+            if np.any(np.isnan(sems)):
+                sems = None
+            else:  # Add a column of SEMs = 0.0 for the experimental values.
+                sems = np.array([(0.0, sem) for sem in sems])
+            data = data[['$\Delta$G (expt) [kcal/mol]', '$\Delta$G (calc) [kcal/mol]']].values
+            fingerprints[group] = self._get_bootstrap_fingerprint(data, sems)
+
             # Check which statistics we still need to compute for this group.
-            if cached_bootstrap_statistics is not None:
+            # If the data of the group changed, the cached statistics are stale.
+            if (cached_bootstrap_statistics is not None and
+                    cached_fingerprints.get(group) == fingerprints[group]):
                 group_stats_names = []
                 group_stats_funcs = []
                 for stats_name, stats_func in zip(stats_names, stats_funcs):
@@ -787,41 +1237,113 @@ class HostGuestSubmissionCollection:
                 group_stats_names = stats_names
                 group_stats_funcs = stats_funcs
 
+            # Re-use the statistics computed by other views of the collection for the same data.
+            memo = self._bootstrap_statistics_memo.get((groupby, group, fingerprints[group]), {})
+            memo_stats_names = [stats_name for stats_name in group_stats_names if stats_name in memo]
+            if len(memo_stats_names) > 0:
+                memo_updated = True
+                self._update_group_bootstrap_statistics(all_bootstrap_statistics[group], memo_stats_names,
+                                                        [memo[stats_name] for stats_name in memo_stats_names])
+                group_stats_funcs = [stats_func for stats_name, stats_func in zip(group_stats_names, group_stats_funcs)
+                                     if stats_name not in memo]
+                group_stats_names = [stats_name for stats_name in group_stats_names if stats_name not in memo]
+
             if len(group_stats_names) == 0:
                 continue
-            cache_updated = True  # Update the cache on disk later.
-
-            print('\rGenerating bootstrap statistics for {} {} ({}/{})'
-                  ''.format(groupby, group, i+1, len(groups)), end='')
-
-            # Select the group data.
-            data = self.data[self.data[groupby] == group]
-
-            # Check if SEMs for the free energies are reported.
-            sems = data['d$\Delta$G (calc) [kcal/mol]'].values
-            if np.any(np.isnan(sems)):
-                sems = None
-            else:  # Add a column of SEMs = 0.0 for the experimental values.
-                sems = np.array([(0.0, sem) for sem in sems])
-
-            # Compute bootstrap statistics.
-            data = data[['$\Delta$G (expt) [kcal/mol]', '$\Delta$G (calc) [kcal/mol]']]
-            new_bootstrap_statistics = compute_bootstrap_statistics(data.as_matrix(), group_stats_funcs, sems=sems,
-                                                                    n_bootstrap_samples=10000)
-
-            # Update the returned value with the statistics just computed.
-            new_boostrap_statistics = {group_stats_names[i]: new_bootstrap_statistics[i]
-                                       for i in range(len(group_stats_funcs))}
-            group_bootstrap_statistics.update(new_boostrap_statistics)
+            bootstrap_tasks[group] = (group_stats_names, group_stats_funcs, data, sems)
+
+        # Update the cache on disk later. Fingerprints of the deleted groups are discarded.
+        cache_updated = memo_updated or len(bootstrap_tasks) > 0 or fingerprints != cached_fingerprints
+        if len(bootstrap_tasks) > 0 and cached_bootstrap_statistics is not None:
+            print('Updating the bootstrap statistics of {}/{} {} groups'.format(
+                len(bootstrap_tasks), len(groups), groupby))
+        bootstrap_kwargs = dict(n_bootstrap_samples=self.n_bootstrap_samples, streaming=self.streaming_bootstrap,
+                                ci_tolerance=self.bootstrap_ci_tolerance)
+
+        # Compute bootstrap statistics.
+        if self.n_bootstrap_workers > 1 and len(bootstrap_tasks) > 1:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=self.n_bootstrap_workers) as executor:
+                futures = collections.OrderedDict()
+                for group, (group_stats_names, group_stats_funcs, data, sems) in bootstrap_tasks.items():
+                    futures[group] = executor.submit(compute_bootstrap_statistics, data, group_stats_funcs,
+                                                     sems=sems, **bootstrap_kwargs,
+                                                     random_state=self._get_bootstrap_random_state(
+                                                         groupby, group, fingerprints[group]))
+                for i, (group, future) in enumerate(futures.items()):
+                    print('\rGenerating bootstrap statistics for {} {} ({}/{})'
+                          ''.format(groupby, group, i+1, len(futures)), end='')
+                    new_bootstrap_statistics = future.result()
+                    self._update_group_bootstrap_statistics(all_bootstrap_statistics[group],
+                                                            bootstrap_tasks[group][0], new_bootstrap_statistics)
+        else:
+            for i, (group, (group_stats_names, group_stats_funcs, data, sems)) in enumerate(bootstrap_tasks.items()):
+                print('\rGenerating bootstrap statistics for {} {} ({}/{})'
+                      ''.format(groupby, group, i+1, len(bootstrap_tasks)), end='')
+                new_bootstrap_statistics = compute_bootstrap_statistics(
+                    data, group_stats_funcs, sems=sems, **bootstrap_kwargs,
+                    random_state=self._get_bootstrap_random_state(groupby, group, fingerprints[group]))
+                self._update_group_bootstrap_statistics(all_bootstrap_statistics[group],
+                                                        group_stats_names, new_bootstrap_statistics)
+
+        # Share the statistics with the other views of the collection.
+        for group in groups:
+            self._bootstrap_statistics_memo.setdefault((groupby, group, fingerprints[group]), {}).update(
+                all_bootstrap_statistics[group])
 
         # Cache the computed statistics on disk. Create output directory if necessary.
+        # The groups of the other groupby columns sharing the cache file are kept.
         if cache_updated:
+            if cached_bootstrap_statistics is not None:
+                for group in set(cached_fingerprints) - set(fingerprints):
+                    cached_bootstrap_statistics.pop(group, None)
+                cached_bootstrap_statistics.update(all_bootstrap_statistics)
+                all_bootstrap_statistics_to_cache = cached_bootstrap_statistics
+            else:
+                all_bootstrap_statistics_to_cache = all_bootstrap_statistics
+            all_fingerprints[groupby] = fingerprints
             os.makedirs(os.path.dirname(cache_file_path), exist_ok=True)
             with open(cache_file_path, 'wb') as f:
-                pickle.dump(all_bootstrap_statistics, f)
+                pickle.dump(all_bootstrap_statistics_to_cache, f)
+            with open(fingerprints_file_path, 'w') as f:
+                json.dump(all_fingerprints, f, indent=4)
 
         return all_bootstrap_statistics
 
+    def _get_bootstrap_fingerprint(self, data, sems):
+        """Return a hash identifying the data of a group and the bootstrap settings.
+
+        The cached bootstrap statistics of a group are re-used only if its
+        fingerprint did not change.
+        """
+        fingerprint = hashlib.sha256(repr((self.n_bootstrap_samples, self.streaming_bootstrap,
+                                           self.bootstrap_ci_tolerance, self.bootstrap_seed)).encode())
+        fingerprint.update(np.ascontiguousarray(data, dtype=np.float64).tobytes())
+        if sems is not None:
+            fingerprint.update(np.ascontiguousarray(sems, dtype=np.float64).tobytes())
+        return fingerprint.hexdigest()
+
+    def _get_bootstrap_random_state(self, groupby, group, fingerprint):
+        """Return the random stream used to bootstrap the group.
+
+        The stream is identified by the groupby column, the group, and the
+        fingerprint of its data (see _get_bootstrap_fingerprint()). The bootstrap
+        samples are shared by all the statistics of the group so the bootstrap
+        distribution of a statistic does not depend on which other statistics are
+        computed (or loaded from the cache) with it. Groups with different data in
+        different collections use independent streams, while the views in which a
+        group has the same data share its stream, and thus its bootstrap statistics.
+        """
+        if self.bootstrap_seed is None:
+            return None
+        return bootstrap_random_state(self.bootstrap_seed, groupby, group, fingerprint)
+
+    @staticmethod
+    def _update_group_bootstrap_statistics(group_bootstrap_statistics, group_stats_names, new_bootstrap_statistics):
+        """Update the returned value with the statistics just computed."""
+        new_boostrap_statistics = {group_stats_names[i]: new_bootstrap_statistics[i]
+                                   for i in range(len(group_stats_names))}
+        group_bootstrap_statistics.update(new_boostrap_statistics)
+
     def _modify_violinplot(self, ax, stats_name):
         pass
 
@@ -835,12 +1357,9 @@ def merge_submissions(submissions, discard_not_matched=True):
     host_names = set([submission.host_name for submission in submissions])
 
     # Find submissions that have the same name.
-    submissions_by_name = {}
+    submissions_by_name = collections.OrderedDict()
     for submission in submissions:
-        try:
-            submissions_by_name[submission.name].append(submission)
-        except KeyError:
-            submissions_by_name[submission.name] = [submission]
+        submissions_by_name.setdefault(submission.name, []).append(submission)
 
     # Merge TEMOA/TEETOA submissions that use the same method into a single submission object.
     merged_submissions = []
@@ -856,7 +1375,8 @@ def merge_submissions(submissions, discard_not_matched=True):
             if len(method_submissions) == 1:
                 merged_submissions.append(method_submissions[0])
             else:
-                merged_submissions.append(sum(method_submissions[1:], method_submissions[0]))
+                # Merge all the hosts at once rather than adding the submissions pairwise.
+                merged_submissions.append(method_submissions[0].merge(method_submissions))
 
     return merged_submissions
 
@@ -954,7 +1474,7 @@ class SplitBootstrapSubmissionCollection(HostGuestSubmissionCollection):
             all_bootstrap_statistics = collection._get_bootstrap_statistics(groupby, stats_names, stats_funcs,
                                                                             cache_file_path=cache_file_path)
 
-            groups = collection.data[groupby].unique()
+            groups = list(collection._get_group_index(groupby))
 
             for group_idx, group in enumerate(groups):
                 print('\rCollecting bootstrap statistics for {} {} ({}/{})'
@@ -994,7 +1514,7 @@ class SplitBootstrapSubmissionCollection(HostGuestSubmissionCollection):
         # We order using collection1 statistics (unless the group has only collection2).
         (collection1_hue, collection1), (collection2_hue, collection2) = self.collections.items()
         ordering_data = self._collections_statistics[self._collections_statistics[self.hue] == collection1_hue]
-        groups2_unique = set(collection2.data[groupby].unique()) - set(collection1.data[groupby].unique())
+        groups2_unique = set(collection2._get_group_index(groupby)) - set(collection1._get_group_index(groupby))
         if len(groups2_unique) != 0:
             groups2_data = self._collections_statistics[(self._collections_statistics[self.hue] == collection2_hue) &
                                                         (self._collections_statistics.ID.isin(groups2_unique))]
@@ -1055,8 +1575,7 @@ if __name__ == '__main__':
 
     # Import user map.
     try:
-        with open('/mnt/c/users/marty/desktop/SAMPL8_test/host_guest/Analysis/SAMPL8-user-map-HG.csv', 'r') as f:
-            user_map = pd.read_csv(f)
+        user_map = UserMap.from_csv('/mnt/c/users/marty/desktop/SAMPL8_test/host_guest/Analysis/SAMPL8-user-map-HG.csv')
     except FileNotFoundError:
         user_map=None
         print("Warning: No user map found.")
@@ -1102,11 +1621,23 @@ if __name__ == '__main__':
     # Instantiate two sets of HostGuestSubmissionCollections -- one which ignores reference calculations
     # and one which doesn't.
 
+    # Report the submissions that arrived, were resubmitted, or were withdrawn since the last run.
+    # Only the bootstrap statistics and correlation plots of the affected groups are recomputed.
+    submissions_fingerprints = fingerprint_submission_files([HOST_GUEST_CB8_SUBMISSIONS_DIR_PATH,
+                                                             HOST_GUEST_GDCC_SUBMISSIONS_DIR_PATH])
+    submissions_changes = compare_submission_fingerprints(
+        read_submission_fingerprints(SUBMISSIONS_FINGERPRINTS_FILE_PATH), submissions_fingerprints)
+    for change, file_paths in submissions_changes.items():
+        for file_path in file_paths:
+            print('Submission {} since the last run: {}'.format(change, os.path.basename(file_path)))
+
     # Load submissions data. For now only CB8 and GDCC
     print("Loading CB8 submissions")
-    submissions_cb8 = load_submissions(HostGuestSubmission, HOST_GUEST_CB8_SUBMISSIONS_DIR_PATH, user_map)
+    submissions_cb8 = load_submissions(HostGuestSubmission, HOST_GUEST_CB8_SUBMISSIONS_DIR_PATH, user_map,
+                                       n_workers=N_LOAD_WORKERS)
     print("Loading GDCC submissions")
-    submissions_temoa_teetoa = load_submissions(HostGuestSubmission, HOST_GUEST_GDCC_SUBMISSIONS_DIR_PATH, user_map)
+    submissions_temoa_teetoa = load_submissions(HostGuestSubmission, HOST_GUEST_GDCC_SUBMISSIONS_DIR_PATH, user_map,
+                                                n_workers=N_LOAD_WORKERS)
     #print("Loading CD submissions")
     #submissions_cd = load_submissions(HostGuestSubmission, HOST_GUEST_CD_SUBMISSIONS_DIR_PATH, user_map)
 
@@ -1118,8 +1649,18 @@ if __name__ == '__main__':
         submissions_temoa.append(a)
         submissions_teetoa.append(b)
 
-    # Make a set of all the submissions
-    submissions_all = submissions_cb8 + submissions_temoa + submissions_teetoa
+    # Stack the predictions of all the submissions into a columnar table and join it to
+    # the experimental data once. The GDCC submissions are included both as a whole
+    # (host name GDCC) and split by host (TEMOA and TEETOA) so that every collection
+    # below is a view of the same table selected by host names.
+    prediction_table = build_prediction_table(submissions_cb8 + submissions_temoa_teetoa +
+                                              submissions_temoa + submissions_teetoa)
+    print("Joining all submissions to the experimental data")
+    collection_base = HostGuestSubmissionCollection(prediction_table, experimental_data, output_directory_path=None,
+                                                    ignore_refcalcs=False, ranked_only=False, allow_multiple=True)
+
+    # Systems to be excluded (optionals and systems not detected).For GDCC TEMOA-G3, and CB8 CB8-G8 and CB8-G9 are optional.
+    optional_system_ids = ['TEMOA-G3', 'CB8-G8', 'CB8-G9']
 
     # Make directories for output
     if not os.path.isdir('../Ranked_Accuracy'): os.mkdir('../Ranked_Accuracy')
@@ -1130,94 +1671,65 @@ if __name__ == '__main__':
     if not os.path.isdir('../All_Accuracy/MoleculesStatistics'): os.mkdir('../All_Accuracy/MoleculesStatistics')
     if not os.path.isdir('../All_Accuracy/PaperImages'): os.mkdir('../All_Accuracy/PaperImages')
 
-    # Create submission collections
+    # Create submission collections. The optional host-guest systems are removed from
+    # the CB8 and combined collections and from the *_no_optional collections.
     print("Creating submission collection for CB8")
-    collection_cb8 = HostGuestSubmissionCollection(submissions_cb8, experimental_data,
-                                                  output_directory_path='../Ranked_Accuracy/CB8')
+    collection_cb8 = collection_base.view('../Ranked_Accuracy/CB8', host_names=['CB8'],
+                                          excluded_system_ids=optional_system_ids)
 
     print("Creating submission collection for all CB8, including non-ranked")
-    collection_cb8_nonranked = HostGuestSubmissionCollection(submissions_cb8, experimental_data,
-            output_directory_path='../All_Accuracy/CB8', 
-            ignore_refcalcs = False, ranked_only = False)
+    collection_cb8_nonranked = collection_base.view('../All_Accuracy/CB8', host_names=['CB8'],
+            ignore_refcalcs = False, ranked_only = False, excluded_system_ids=optional_system_ids)
 
     print("Creating submission collection for GDCC collectively")
-    collection_gdcc = HostGuestSubmissionCollection(submissions_temoa_teetoa, experimental_data,
-                                                   output_directory_path='../Ranked_Accuracy/GDCC')
+    collection_gdcc = collection_base.view('../Ranked_Accuracy/GDCC', host_names=['GDCC'])
 
     print("Creating submission collection for all GDCC collectively, including non-ranked")
-    collection_gdcc_nonranked = HostGuestSubmissionCollection(submissions_temoa_teetoa, experimental_data,
-            output_directory_path='../All_Accuracy/GDCC',
+    collection_gdcc_nonranked = collection_base.view('../All_Accuracy/GDCC', host_names=['GDCC'],
             ignore_refcalcs = False, ranked_only = False)
 
     print("Creating submission collection for TEMOA")
-    collection_temoa = HostGuestSubmissionCollection(submissions_temoa, experimental_data,
-                                                    output_directory_path='../Ranked_Accuracy/TEMOA')
+    collection_temoa = collection_base.view('../Ranked_Accuracy/TEMOA', host_names=['TEMOA'])
 
     print("Creating submission collection for TEMOA, including non-ranked")
-    collection_temoa_nonranked = HostGuestSubmissionCollection(submissions_temoa, experimental_data,
-            output_directory_path='../All_Accuracy/TEMOA',
+    collection_temoa_nonranked = collection_base.view('../All_Accuracy/TEMOA', host_names=['TEMOA'],
             ignore_refcalcs = False, ranked_only = False)
 
     print("Creating submission collection for TEETOA")
-    collection_teetoa = HostGuestSubmissionCollection(submissions_teetoa, experimental_data,
-                                                     output_directory_path='../Ranked_Accuracy/TEETOA')
+    collection_teetoa = collection_base.view('../Ranked_Accuracy/TEETOA', host_names=['TEETOA'])
 
     print("Creating submission collection for TEETOA, including non-ranked")
-    collection_teetoa_nonranked = HostGuestSubmissionCollection(submissions_teetoa, experimental_data,
-            output_directory_path='../All_Accuracy/TEETOA',
+    collection_teetoa_nonranked = collection_base.view('../All_Accuracy/TEETOA', host_names=['TEETOA'],
             ignore_refcalcs = False, ranked_only = False)
-    
+
     # Create ranked submission for combine set of hosts. Will be for ranked molecule statistics
     print("Creating submission collection for combined set of hosts")
-    collection_all = HostGuestSubmissionCollection(submissions_all, experimental_data,
-                                                   output_directory_path='../Ranked_Accuracy/MoleculesStatistics', allow_multiple = True)
+    collection_all = collection_base.view('../Ranked_Accuracy/MoleculesStatistics',
+            host_names=['CB8', 'TEMOA', 'TEETOA'], allow_multiple = True,
+            excluded_system_ids=optional_system_ids)
 
     # Create ranked and non-ranked submission collection for combine set of hosts (all submissions). Will be for molecule statistics of all methods. 
     print("Creating submission collection for combined set of hosts, including non-ranked")
-    collection_all_nonranked = HostGuestSubmissionCollection(submissions_all, experimental_data, 
-            output_directory_path='../All_Accuracy/MoleculesStatistics', 
-            allow_multiple = True, ignore_refcalcs = False, ranked_only = False)
-
-    # Systems to be excluded (optionals and systems not detected).For GDCC TEMOA-G3, and CB8 CB8-G8 and CB8-G9 are optional.
-    def remove_optional(submission_collection_data):
-        return submission_collection_data[(submission_collection_data.system_id != 'TEMOA-G3') &
-                (submission_collection_data.system_id != 'CB8-G8') &
-                (submission_collection_data.system_id != 'CB8-G9')]
+    collection_all_nonranked = collection_base.view('../All_Accuracy/MoleculesStatistics',
+            host_names=['CB8', 'TEMOA', 'TEETOA'], allow_multiple = True, ignore_refcalcs = False, ranked_only = False,
+            excluded_system_ids=optional_system_ids)
 
     #make new collections and remove optionals. For GDCC and TEMOA optional system is TEMOA-G3, for CB8 its CB8-G8 and CB8-G9.
     print("Making new collection set (ranked only) & removing optional host-guest systems from GDCC collection")
-    collection_gdcc_no_optional = HostGuestSubmissionCollection(submissions_temoa_teetoa, experimental_data,
-                                                                    output_directory_path='../Ranked_Accuracy/GDCC_no_optional')
-    collection_gdcc_no_optional.data = remove_optional(collection_gdcc_no_optional.data)
+    collection_gdcc_no_optional = collection_base.view('../Ranked_Accuracy/GDCC_no_optional', host_names=['GDCC'],
+                                                       excluded_system_ids=optional_system_ids)
 
     print("Making new collection set (including nonranked) & removing optional host-guest systems from GDCC collection")
-    collection_gdcc_nonranked_no_optional = HostGuestSubmissionCollection(submissions_temoa_teetoa, experimental_data, 
-            output_directory_path='../All_Accuracy/GDCC_no_optional', 
-            ignore_refcalcs = False, ranked_only = False)
-    collection_gdcc_nonranked_no_optional.data = remove_optional(collection_gdcc_nonranked_no_optional.data)
+    collection_gdcc_nonranked_no_optional = collection_base.view('../All_Accuracy/GDCC_no_optional', host_names=['GDCC'],
+            ignore_refcalcs = False, ranked_only = False, excluded_system_ids=optional_system_ids)
 
     print("Making new collection set (ranked only) & removing optional host-guest systems from TEMOA collection")
-    collection_temoa_no_optional = HostGuestSubmissionCollection(submissions_temoa, experimental_data,
-                                                                     output_directory_path='../Ranked_Accuracy/TEMOA_no_optional')
-    collection_temoa_no_optional.data = remove_optional(collection_temoa_no_optional.data)
+    collection_temoa_no_optional = collection_base.view('../Ranked_Accuracy/TEMOA_no_optional', host_names=['TEMOA'],
+                                                        excluded_system_ids=optional_system_ids)
 
     print("Making new collection set (including nonranked) & removing optional host-guest systems from TEMOA collection")
-    collection_temoa_nonranked_no_optional = HostGuestSubmissionCollection(submissions_temoa, experimental_data,
-            output_directory_path='../All_Accuracy/TEMOA_no_optional',
-            ignore_refcalcs = False, ranked_only = False)
-    collection_temoa_nonranked_no_optional.data = remove_optional(collection_temoa_nonranked_no_optional.data)
-
-    print("Removing optional host-guest systems from CB8 ranked collection")
-    collection_cb8.data = remove_optional(collection_cb8.data)
-
-    print("Removing optional host-guest systems from CB8 ranked+nonranked collection")
-    collection_cb8_nonranked.data = remove_optional(collection_cb8_nonranked.data)
-
-    print("Removing optional host-guest systems from entire ranked collection")
-    collection_all.data = remove_optional(collection_all.data)
-
-    print("Removing optional host-guest systems from entire ranked+nonranked collection")
-    collection_all_nonranked.data = remove_optional(collection_all_nonranked.data)
+    collection_temoa_nonranked_no_optional = collection_base.view('../All_Accuracy/TEMOA_no_optional', host_names=['TEMOA'],
+            ignore_refcalcs = False, ranked_only = False, excluded_system_ids=optional_system_ids)
 
 
     # =============================================================================
@@ -1240,6 +1752,10 @@ if __name__ == '__main__':
                                               latex_header_conversions=latex_header_conversions,
                                               caption=caption)
 
+        if PAIRED_COMPARISON:
+            collection.generate_paired_comparison(stats_funcs, subdirectory_path='PairedComparison',
+                                                  groupby='name', ordering_functions=ordering_functions)
+
         sns.set_context('paper', font_scale=0.7)
         collection.plot_bootstrap_distributions(stats_funcs, subdirectory_path='StatisticsPlots',
                                                 groupby='name', ordering_functions=ordering_functions,
@@ -1247,11 +1763,8 @@ if __name__ == '__main__':
                                                 stats_limits=stats_limits)
 
     # Generate molecule statistics and plots for all ranked submissions (for now only CB8 and GDCC) 
-    # Don't modify original collection_all as we'll use it later.
-    collection = copy.deepcopy(collection_all)
-    
-    # Exclude "OPTIONAL" HOST-GUEST SYSTEMS
-    collection.data = collection.data[~collection.data.system_id.isin({'TEMOA-G3', 'CB8-G8', 'CB8-G9'})]
+    # The "OPTIONAL" HOST-GUEST SYSTEMS are already excluded from collection_all.
+    collection = collection_all
     collection.generate_molecules_plot()
     collection.generate_statistics_tables(stats_funcs_molecules, 'StatisticsTables', groupby='system_id',
                                           sort_stat='MAE', ordering_functions=ordering_functions,
@@ -1261,9 +1774,7 @@ if __name__ == '__main__':
                                             latex_header_conversions=latex_header_conversions)
 
     # Generate molecule statistics and plots for all submissions (ranked and non ranked)
-    collection_nr = copy.deepcopy(collection_all_nonranked)
-    # Exclude "OPTIONAL" HOST-GUEST SYSTEMS
-    collection_nr.data = collection_nr.data[~collection_nr.data.system_id.isin({'TEMOA-G3', 'CB8-G8', 'CB8-G9'})]
+    collection_nr = collection_all_nonranked
     collection_nr.generate_molecules_plot()
     collection_nr.generate_statistics_tables(stats_funcs_molecules, 'StatisticsTables', groupby='system_id', 
             sort_stat='MAE', ordering_functions=ordering_functions, 
@@ -1558,6 +2069,9 @@ if __name__ == '__main__':
     plt.savefig('../Ranked_Accuracy/PaperImages/tightest_binders.pdf')
 
 
+    # Record the submissions analyzed by this run.
+    write_submission_fingerprints(SUBMISSIONS_FINGERPRINTS_FILE_PATH, submissions_fingerprints)
+
     #Break before making next image. Test all of the above.
     import sys
     sys.exit('Stop before generating next plot/table')
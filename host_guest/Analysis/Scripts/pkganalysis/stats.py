@@ -7,6 +7,9 @@
 # GLOBAL IMPORTS
 # =============================================================================
 
+import hashlib
+import itertools
+
 import numpy as np
 import scipy.stats
 import scipy.special
@@ -16,40 +19,256 @@ import scipy.special
 # STATISTIC ESTIMATORS
 # =============================================================================
 
+# All the estimators below implement the batched estimator protocol: data
+# can be a 2D array of shape (n_samples, 2), in which case a single statistic
+# is returned, or an array of shape (..., n_samples, 2) (e.g., a stack of
+# bootstrap samples), in which case the statistic is computed along the
+# samples axis and an array of shape data.shape[:-2] is returned.
+
+def batched_estimator(stats_func):
+    """Decorator marking stats_func as implementing the batched estimator protocol."""
+    stats_func.is_batched = True
+    return stats_func
+
+
+def is_batched_estimator(stats_func):
+    """Return True if stats_func implements the batched estimator protocol."""
+    return getattr(stats_func, 'is_batched', False)
+
+
+def _split_columns(data):
+    """Split data of shape (..., n_samples, 2) into the x and y arrays."""
+    data = np.asarray(data)
+    return data[..., 0], data[..., 1]
+
+
+def fused_estimator(statistic_name):
+    """Decorator marking stats_func as the statistic_name entry of regression_statistics().
+
+    Inside the bootstrap, all the fused estimators are evaluated with a single
+    call to regression_statistics() on the stack of bootstrap samples.
+    """
+    def _fused_estimator(stats_func):
+        stats_func.fused_statistic = statistic_name
+        return batched_estimator(stats_func)
+    return _fused_estimator
+
+
+def regression_statistics(data):
+    """Compute linear regression and error statistics from shared sufficient statistics.
+
+    The means, the centered sums of squares and cross products, and the sum
+    of the absolute errors are computed once and all statistics are derived
+    from them. Slope, intercept, and r_value are equivalent to those of
+    scipy.stats.linregress(x, y).
+
+    Parameters
+    ----------
+    data : np.ndarray
+        An array of shape (..., n_samples, 2) (see the batched estimator
+        protocol).
+
+    Returns
+    -------
+    statistics : dict
+        Dictionary with keys 'slope', 'intercept', 'r_value', 'r2', 'me',
+        'mae', and 'rmse'. Each value has shape data.shape[:-2].
+    """
+    x, y = _split_columns(data)
+    x_mean = x.mean(axis=-1)
+    y_mean = y.mean(axis=-1)
+    x_centered = x - x_mean[..., np.newaxis]
+    y_centered = y - y_mean[..., np.newaxis]
+    ssxm = (x_centered**2).mean(axis=-1)
+    ssym = (y_centered**2).mean(axis=-1)
+    ssxym = (x_centered * y_centered).mean(axis=-1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = ssxym / ssxm
+        r_value = ssxym / np.sqrt(ssxm * ssym)
+    # Like scipy, handle the degenerate cases and round-off errors.
+    r_value = np.where((ssxm == 0.0) | (ssym == 0.0), 0.0, np.clip(r_value, -1.0, 1.0))
+
+    # The mean squared error is the variance of the errors plus the squared mean error.
+    me = x_mean - y_mean
+    mse = np.maximum(ssxm + ssym - 2*ssxym, 0.0) + me**2
+    return dict(
+        slope=slope,
+        intercept=y_mean - slope*x_mean,
+        r_value=r_value,
+        r2=r_value**2,
+        me=me,
+        mae=np.abs(x - y).mean(axis=-1),
+        rmse=np.sqrt(mse),
+    )
+
+
+# Above this number of samples, kendall_tau() switches from the O(n^2)
+# pairwise comparisons to the O(n log^2 n) merge-sort algorithm.
+KENDALL_TAU_PAIRWISE_MAX_SAMPLES = 50
+
+
+@batched_estimator
 def kendall_tau(data):
-    x, y = data.T
-    correlation, p_value = scipy.stats.kendalltau(x, y)
-    return correlation
+    """Kendall's tau-b rank correlation coefficient.
+
+    This is equivalent to the correlation returned by scipy.stats.kendalltau()
+    (including the treatment of ties), but it is vectorized over the stack of
+    samples. Small samples are compared pairwise, while larger ones are
+    handled with Knight's merge-sort algorithm.
+    """
+    x, y = _split_columns(data)
+    x = x.astype(float).reshape(-1, x.shape[-1])
+    y = y.astype(float).reshape(-1, y.shape[-1])
+    if x.shape[-1] <= KENDALL_TAU_PAIRWISE_MAX_SAMPLES:
+        correlations = _kendall_tau_pairwise(x, y)
+    else:
+        correlations = _kendall_tau_merge_sort(x, y)
+        # Like scipy, propagate NaNs.
+        correlations[np.isnan(x).any(axis=-1) | np.isnan(y).any(axis=-1)] = np.nan
+    return correlations.reshape(np.shape(data)[:-2])
+
+
+def _kendall_tau_b(concordant_minus_discordant, n_samples, x_ties, y_ties):
+    """Compute tau-b from the pairs counts like scipy.stats.kendalltau()."""
+    n_pairs = n_samples * (n_samples - 1) / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tau = concordant_minus_discordant / np.sqrt(n_pairs - x_ties) / np.sqrt(n_pairs - y_ties)
+    # Scipy returns NaN when all x or y values are tied.
+    tau = np.where((x_ties == n_pairs) | (y_ties == n_pairs), np.nan, tau)
+    return np.clip(tau, -1.0, 1.0)
+
+
+def _kendall_tau_pairwise(x, y, max_block_size=2**21):
+    """Compute tau-b of each row of x and y from the matrices of pairwise signs."""
+    n_stacks, n_samples = x.shape
+    i, j = np.triu_indices(n_samples, k=1)
+    correlations = np.empty(n_stacks)
+    # Process the stacks in blocks to bound the memory of the sign matrices.
+    block_size = max(1, max_block_size // max(1, len(i)))
+    for start in range(0, n_stacks, block_size):
+        x_block, y_block = x[start:start+block_size], y[start:start+block_size]
+        x_signs = np.sign(x_block[:, i] - x_block[:, j])
+        y_signs = np.sign(y_block[:, i] - y_block[:, j])
+        correlations[start:start+block_size] = _kendall_tau_b(
+            (x_signs * y_signs).sum(axis=-1), n_samples,
+            x_ties=(x_signs == 0).sum(axis=-1), y_ties=(y_signs == 0).sum(axis=-1))
+    return correlations
+
+
+def _count_tied_pairs(sorted_values, *other_sorted_values):
+    """Count the pairs of equal entries in each row of the (lexicographically) sorted arrays."""
+    is_tied = sorted_values[:, 1:] == sorted_values[:, :-1]
+    for values in other_sorted_values:
+        is_tied &= values[:, 1:] == values[:, :-1]
+    # Each element forms a tied pair with every previous element of its run.
+    n_samples = sorted_values.shape[1]
+    indices = np.broadcast_to(np.arange(1, n_samples), is_tied.shape)
+    run_starts = np.maximum.accumulate(np.where(is_tied, 0, indices), axis=1)
+    return np.where(is_tied, indices - run_starts, 0).sum(axis=1)
+
 
+def _dense_ranks(values):
+    """Return the dense rank of the entries of each row of values."""
+    order = np.argsort(values, axis=1, kind='stable')
+    sorted_values = np.take_along_axis(values, order, axis=1)
+    sorted_ranks = np.concatenate([np.zeros((len(values), 1), dtype=int),
+                                   np.cumsum(sorted_values[:, 1:] != sorted_values[:, :-1], axis=1)], axis=1)
+    ranks = np.empty_like(sorted_ranks)
+    np.put_along_axis(ranks, order, sorted_ranks, axis=1)
+    return ranks
 
+
+def _count_inversions(ranks):
+    """Count the pairs i < j such that ranks[i] > ranks[j] in each row with a bottom-up merge sort.
+
+    At each level, the pairs of consecutive sorted runs of all rows are tagged
+    with increasing group ids so that they can be searched and merged at once
+    as a single flat sorted array.
+    """
+    n_stacks, n_samples = ranks.shape
+    positions = np.arange(n_samples)
+    inversions = np.zeros(n_stacks, dtype=np.int64)
+    runs = ranks
+    width = 1
+    while width < n_samples:
+        n_groups_per_stack = -(-n_samples // (2*width))
+        group_ids = np.arange(n_stacks)[:, np.newaxis] * n_groups_per_stack + positions // (2*width)
+        keys = group_ids * n_samples + runs
+        is_right = (positions // width) % 2 == 1
+        # The left runs are sorted and the group ids increasing so left_keys is sorted.
+        left_keys = keys[:, ~is_right].ravel()
+        right_keys, right_group_ids = keys[:, is_right], group_ids[:, is_right]
+        # For each element of a right run, count the greater elements in the left run.
+        n_left_greater = (np.searchsorted(left_keys, (right_group_ids + 1) * n_samples, side='left') -
+                          np.searchsorted(left_keys, right_keys, side='right'))
+        inversions += n_left_greater.sum(axis=1)
+        # Merge the pairs of runs.
+        runs = np.sort(keys, axis=None, kind='stable').reshape(n_stacks, n_samples) - group_ids * n_samples
+        width *= 2
+    return inversions
+
+
+def _kendall_tau_merge_sort(x, y):
+    """Compute tau-b of each row of x and y with Knight's O(n log n) algorithm."""
+    n_samples = x.shape[1]
+    # Sort by x and then by y.
+    order = np.lexsort((y, x), axis=-1)
+    x_sorted = np.take_along_axis(x, order, axis=1)
+    y_sorted = np.take_along_axis(y, order, axis=1)
+
+    # The discordant pairs are the inversions of y after sorting by x.
+    discordant = _count_inversions(_dense_ranks(y_sorted))
+
+    x_ties = _count_tied_pairs(x_sorted)
+    y_ties = _count_tied_pairs(np.sort(y, axis=1))
+    xy_ties = _count_tied_pairs(x_sorted, y_sorted)
+    n_pairs = n_samples * (n_samples - 1) // 2
+    concordant_minus_discordant = n_pairs - x_ties - y_ties + xy_ties - 2*discordant
+    return _kendall_tau_b(concordant_minus_discordant, n_samples, x_ties, y_ties)
+
+
+# The estimators below can be computed together from regression_statistics().
+
+@fused_estimator('r2')
 def r2(data):
-    x, y = data.T
-    slope, intercept, r_value, p_value, stderr = scipy.stats.linregress(x, y)
-    return r_value**2
+    return regression_statistics(data)['r2']
+
 
+@fused_estimator('r_value')
+def pearson_r(data):
+    return regression_statistics(data)['r_value']
 
+
+@fused_estimator('slope')
 def slope(data):
-    x, y = data.T
-    slope, intercept, r_value, p_value, stderr = scipy.stats.linregress(x, y)
-    return slope
+    return regression_statistics(data)['slope']
+
 
+@fused_estimator('intercept')
+def intercept(data):
+    return regression_statistics(data)['intercept']
 
+
+@fused_estimator('me')
 def me(data):
-    x, y = data.T
-    error = np.array(x) - np.array(y)
-    return error.mean()
+    x, y = _split_columns(data)
+    error = x - y
+    return error.mean(axis=-1)
 
 
+@fused_estimator('mae')
 def mae(data):
-    x, y = data.T
-    error = np.abs(np.array(x) - np.array(y))
-    return error.mean()
+    x, y = _split_columns(data)
+    error = np.abs(x - y)
+    return error.mean(axis=-1)
 
 
+@fused_estimator('rmse')
 def rmse(data):
-    x, y = data.T
-    error = np.array(x) - np.array(y)
-    rmse = np.sqrt((error**2).mean())
+    x, y = _split_columns(data)
+    error = x - y
+    rmse = np.sqrt((error**2).mean(axis=-1))
     return rmse
 
 
@@ -124,12 +343,67 @@ def mean_confidence_interval(data, confidence=0.95):
     return mean, t_statistics * sem
 
 
+# =============================================================================
+# RANDOM NUMBER GENERATION
+# =============================================================================
+
+def _stream_key_to_int(key):
+    """Convert a stream key into a non-negative integer that is stable across runs."""
+    if isinstance(key, (int, np.integer)) and key >= 0:
+        return int(key)
+    # Python's hash() is salted for strings so we use a cryptographic hash.
+    digest = hashlib.sha256(str(key).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], byteorder='little')
+
+
+def bootstrap_random_state(seed, *keys):
+    """Create an independent random number generator from a root seed and a key path.
+
+    The same seed and keys always produce the same stream of random numbers,
+    and different keys produce statistically independent streams. This makes
+    it possible to assign a stream to each bootstrap calculation (e.g., by
+    collection and group) so that the results do not depend on the order in
+    which the calculations are performed or on how they are distributed among
+    processes.
+
+    Parameters
+    ----------
+    seed : int
+        The root seed.
+    *keys : int or str
+        The path identifying the stream (e.g., collection name and group).
+
+    Returns
+    -------
+    random_state : numpy.random.Generator
+        A generator based on the Philox counter-based bit generator.
+    """
+    spawn_key = tuple(_stream_key_to_int(key) for key in keys)
+    seed_sequence = np.random.SeedSequence(entropy=seed, spawn_key=spawn_key)
+    return np.random.Generator(np.random.Philox(seed_sequence))
+
+
+def check_random_state(random_state=None):
+    """Return a numpy.random.Generator from None, an integer seed, or a Generator.
+
+    If random_state is None, a generator seeded with fresh entropy is returned
+    so results are not reproducible.
+    """
+    if random_state is None:
+        return np.random.default_rng()
+    if isinstance(random_state, np.random.Generator):
+        return random_state
+    return bootstrap_random_state(random_state)
+
+
 # =============================================================================
 # BOOTSTRAP
 # =============================================================================
 
 def compute_bootstrap_statistics(samples, stats_funcs, percentile=0.95,
-                                 n_bootstrap_samples=10000, sems=None):
+                                 n_bootstrap_samples=10000, sems=None, batched=None,
+                                 exact=None, random_state=None, streaming=False,
+                                 chunk_size=1000, ci_tolerance=None, min_bootstrap_samples=2000):
     """Compute bootstrap confidence interval for the given statistics functions.
 
     Parameters
@@ -149,6 +423,46 @@ def compute_bootstrap_statistics(samples, stats_funcs, percentile=0.95,
         distribution with its standard deviation. This must have the same
         shape of samples. Data points for which SEMs is 0.0 won't be
         re-sampled.
+    batched : bool, optional
+        If True, all the bootstrap samples are generated at once as an
+        array of shape (n_bootstrap_samples, n_samples, 2) and each estimator
+        is called only once on the whole stack. This requires all stats_funcs
+        to implement the batched estimator protocol. If False, the estimators
+        are called once per bootstrap cycle. By default, the batched mode is
+        used if all the estimators support it.
+    exact : bool, optional
+        If True, instead of drawing random bootstrap samples, all the
+        distinct bootstrap multisets are enumerated exactly once and the
+        confidence interval is computed from the percentiles of the
+        statistics weighted by the multinomial probability of each multiset.
+        If sems is given, each multiset is evaluated on independent draws of
+        the normal noise, in number proportional to its probability (see
+        _compute_exact_bootstrap_statistics()). By default, the exact
+        enumeration is used when the number of distinct multisets (see
+        n_bootstrap_multisets()) is not greater than n_bootstrap_samples.
+    random_state : numpy.random.Generator or int, optional
+        The random number generator (or its seed) used to draw the bootstrap
+        samples and the normal noise. Use bootstrap_random_state() to obtain
+        reproducible independent streams. By default, fresh entropy is used.
+    streaming : bool, optional
+        If True, the bootstrap samples are generated in chunks of chunk_size
+        and the bootstrap statistics are accumulated in a
+        BootstrapDistributionSketch instead of being stored in full. This
+        bounds the memory when n_bootstrap_samples is large. Default is False.
+    chunk_size : int, optional
+        The number of bootstrap samples generated at once in streaming and
+        adaptive mode. Default is 1000.
+    ci_tolerance : float, optional
+        If given, the bootstrap is adaptive. The bootstrap samples are generated
+        in chunks of chunk_size, and the bootstrap stops as soon as the lower
+        and upper bounds of the confidence interval of each statistic differ by
+        less than ci_tolerance times the width of the interval (e.g., 0.01 for
+        1%) from those obtained with half the samples. n_bootstrap_samples is
+        then the maximum number of bootstrap samples. This has no effect with
+        the exact enumeration.
+    min_bootstrap_samples : int, optional
+        In adaptive mode, the convergence is checked only after generating
+        at least this number of bootstrap samples. Default is 2000.
 
     Returns
     -------
@@ -156,7 +470,12 @@ def compute_bootstrap_statistics(samples, stats_funcs, percentile=0.95,
         bootstrap_statistics[i] is (statistics, confidence_interval, bootstrap_samples)
         of stats_funcs[i]. confidence_interval is a pair (lower_bound, upper_bound),
         and bootstrap_samples are the (ordered) bootstrap statistics used to compute
-        the confidence interval.
+        the confidence interval. With the exact enumeration, bootstrap_samples
+        is an ExactBootstrapDistribution, and in streaming mode it is a
+        BootstrapDistributionSketch. Both can be iterated over like the array
+        of bootstrap statistics. In all cases, len(bootstrap_samples) is the
+        number of bootstrap samples actually evaluated, and the type of
+        bootstrap_samples tells which of the modes was used.
 
     """
     # Handle case where only a single function is passed.
@@ -165,40 +484,762 @@ def compute_bootstrap_statistics(samples, stats_funcs, percentile=0.95,
     except TypeError:
         stats_funcs = [stats_funcs]
 
+    if batched is None:
+        batched = all(is_batched_estimator(stats_func) for stats_func in stats_funcs)
+    elif batched and not all(is_batched_estimator(stats_func) for stats_func in stats_funcs):
+        raise ValueError('The batched mode requires all the estimators to be batched estimators.')
+
+    if exact is None:
+        exact = is_exact_bootstrap(len(samples), n_bootstrap_samples)
+
     # Compute mean statistics.
     statistics = [stats_func(samples) for stats_func in stats_funcs]
 
+    random_state = check_random_state(random_state)
+
+    # Enumerate all bootstrap multisets. The exact distribution is already
+    # a compact summary so it is returned also in streaming mode.
+    if exact:
+        return _compute_exact_bootstrap_statistics(samples, stats_funcs, statistics, percentile,
+                                                   n_bootstrap_samples, sems, batched, random_state)
+
+    # Accumulate the bootstrap statistics chunk by chunk.
+    if streaming or ci_tolerance is not None:
+        return _compute_chunked_bootstrap_statistics(samples, stats_funcs, statistics, percentile,
+                                                     n_bootstrap_samples, sems, batched, random_state,
+                                                     chunk_size, streaming, ci_tolerance, min_bootstrap_samples)
+
     # Generate bootstrap statistics.
-    bootstrap_samples_statistics = np.zeros((len(statistics), n_bootstrap_samples))
+    bootstrap_samples_statistics = _compute_bootstrap_samples_statistics(
+        samples, stats_funcs, n_bootstrap_samples, sems, batched, random_state)
+
+    # Compute confidence intervals.
+    bootstrap_statistics = []
+    for stats_func_idx, samples_statistics in enumerate(bootstrap_samples_statistics):
+        samples_statistics.sort()
+        confidence_interval = _sorted_confidence_interval(samples_statistics, percentile)
+        bootstrap_statistics.append([statistics[stats_func_idx], confidence_interval, samples_statistics])
+
+    return bootstrap_statistics
+
+
+def _sorted_confidence_interval(sorted_samples_statistics, percentile):
+    """Return the percentile confidence interval from the sorted bootstrap statistics.
+
+    The bounds are the order statistics at the same distance from both ends of
+    sorted_samples_statistics (sorted along the first axis). With few bootstrap
+    samples, the interval is at most the range of the bootstrap statistics.
+    """
+    n_bootstrap_samples = len(sorted_samples_statistics)
+    percentile_index = int(np.floor(n_bootstrap_samples * (1 - percentile) / 2)) - 1
+    percentile_index = min(max(percentile_index, 0), (n_bootstrap_samples - 1) // 2)
+    stat_lower_percentile = sorted_samples_statistics[percentile_index]
+    stat_higher_percentile = sorted_samples_statistics[n_bootstrap_samples - 1 - percentile_index]
+    return stat_lower_percentile, stat_higher_percentile
+
+
+def _has_converged(confidence_intervals_history, n_samples, confidence_intervals, ci_tolerance):
+    """Check if the confidence intervals are stable within ci_tolerance times their width.
+
+    The intervals computed with n_samples bootstrap samples are compared to the
+    most recent ones in confidence_intervals_history, a list of (n_samples,
+    intervals) pairs, that were computed with at most half the samples. The
+    intervals are given as arrays of shape (n_statistics, 2) so that each
+    statistic is compared on its own scale.
+    """
+    previous_confidence_intervals = None
+    for n_previous_samples, intervals in confidence_intervals_history:
+        if 2 * n_previous_samples <= n_samples:
+            previous_confidence_intervals = intervals
+    if previous_confidence_intervals is None:
+        return False
+    widths = confidence_intervals[:, 1] - confidence_intervals[:, 0]
+    changes = np.abs(confidence_intervals - previous_confidence_intervals)
+    return bool(np.all(changes <= ci_tolerance * widths[:, np.newaxis]))
+
+
+def _compute_bootstrap_samples_statistics(samples, stats_funcs, n_bootstrap_samples, sems, batched,
+                                          random_state):
+    """Generate n_bootstrap_samples bootstrap samples and evaluate the estimators on them.
+
+    Returns
+    -------
+    bootstrap_samples_statistics : np.ndarray
+        bootstrap_samples_statistics[i][j] is the statistic stats_funcs[i]
+        computed on the j-th bootstrap sample.
+    """
+    if batched:
+        return _compute_batched_bootstrap_samples_statistics(
+            samples, stats_funcs, n_bootstrap_samples, sems, random_state)
+
+    bootstrap_samples_statistics = np.zeros((len(stats_funcs), n_bootstrap_samples))
     for bootstrap_sample_idx in range(n_bootstrap_samples):
         # Re-sample from a normal distribution if the SEMs are given.
         if sems is None:
             bootstrap_samples = samples
         else:
-            bootstrap_samples = resample_from_normal(samples, stds=sems)
+            bootstrap_samples = resample_from_normal(samples, stds=sems, random_state=random_state)
 
         # Re-sample with replacement.
-        samples_indices = np.random.randint(low=0, high=len(samples), size=len(samples))
+        samples_indices = random_state.integers(low=0, high=len(samples), size=len(samples))
         bootstrap_samples = bootstrap_samples[samples_indices]
 
         # Compute statistics for the bootstrap sample.
         for stats_func_idx, stats_func in enumerate(stats_funcs):
             bootstrap_samples_statistics[stats_func_idx][bootstrap_sample_idx] = stats_func(bootstrap_samples)
+    return bootstrap_samples_statistics
+
+
+def _compute_chunked_bootstrap_statistics(samples, stats_funcs, statistics, percentile, n_bootstrap_samples,
+                                          sems, batched, random_state, chunk_size, streaming, ci_tolerance,
+                                          min_bootstrap_samples):
+    """Compute the bootstrap statistics generating the bootstrap samples in chunks.
+
+    In streaming mode, the bootstrap statistics are accumulated into sketches.
+    If ci_tolerance is not None, the bootstrap stops as soon as the confidence
+    intervals of all statistics have converged within ci_tolerance times their
+    width (see _has_converged()) after at least min_bootstrap_samples samples.
+    """
+    if streaming:
+        accumulators = [BootstrapDistributionSketch() for _ in stats_funcs]
+    else:
+        accumulators = [[] for _ in stats_funcs]
+
+    def get_confidence_intervals():
+        if streaming:
+            return [sketch.confidence_interval(percentile) for sketch in accumulators]
+        return [_sorted_confidence_interval(np.sort(np.concatenate(chunks)), percentile)
+                for chunks in accumulators]
+
+    # Confidence intervals at each convergence check as (n_samples, intervals).
+    confidence_intervals_history = []
+    n_generated_samples = 0
+    while n_generated_samples < n_bootstrap_samples:
+        n_chunk_samples = min(chunk_size, n_bootstrap_samples - n_generated_samples)
+        bootstrap_samples_statistics = _compute_bootstrap_samples_statistics(
+            samples, stats_funcs, n_chunk_samples, sems, batched, random_state)
+        n_generated_samples += n_chunk_samples
+        for accumulator, samples_statistics in zip(accumulators, bootstrap_samples_statistics):
+            if streaming:
+                accumulator.update(samples_statistics)
+            else:
+                accumulator.append(samples_statistics)
+
+        # Check the convergence of the confidence intervals.
+        # The intervals are compared to those obtained with half the samples
+        # so that the check does not depend on chunk_size.
+        if ci_tolerance is not None:
+            confidence_intervals = np.array(get_confidence_intervals())
+            if (n_generated_samples >= min_bootstrap_samples and
+                    _has_converged(confidence_intervals_history, n_generated_samples,
+                                   confidence_intervals, ci_tolerance)):
+                break
+            confidence_intervals_history.append((n_generated_samples, confidence_intervals))
+
+    bootstrap_statistics = []
+    for stats_func_idx, accumulator in enumerate(accumulators):
+        if streaming:
+            confidence_interval = accumulator.confidence_interval(percentile)
+        else:
+            accumulator = np.sort(np.concatenate(accumulator))
+            confidence_interval = _sorted_confidence_interval(accumulator, percentile)
+        bootstrap_statistics.append([statistics[stats_func_idx], confidence_interval, accumulator])
+    return bootstrap_statistics
+
+
+def _compute_batched_bootstrap_samples_statistics(samples, stats_funcs, n_bootstrap_samples, sems,
+                                                  random_state):
+    """Evaluate the batched estimators on all the bootstrap samples at once.
+
+    Returns
+    -------
+    bootstrap_samples_statistics : np.ndarray
+        bootstrap_samples_statistics[i][j] is the statistic stats_funcs[i]
+        computed on the j-th bootstrap sample.
+    """
+    n_samples = len(samples)
+
+    # Draw the (n_bootstrap_samples, n_samples) matrix of re-sampling indices.
+    samples_indices = random_state.integers(low=0, high=n_samples, size=(n_bootstrap_samples, n_samples))
+
+    # Build the (n_bootstrap_samples, n_samples, 2) tensor of bootstrap samples.
+    if sems is None:
+        bootstrap_samples = samples[samples_indices]
+    else:
+        noise = generate_normal_noise(sems, n_resamples=n_bootstrap_samples, random_state=random_state)
+        bootstrap_samples = resample_from_normal(samples, stds=sems, noise=noise)
+        bootstrap_samples = np.take_along_axis(bootstrap_samples, samples_indices[:, :, np.newaxis], axis=1)
+
+    return _evaluate_estimators(bootstrap_samples, stats_funcs, batched=True)
+
+
+def _evaluate_estimators(bootstrap_samples, stats_funcs, batched):
+    """Compute the statistics on a (n_bootstrap_samples, n_samples, 2) stack of samples.
+
+    In batched mode, the fused estimators share a single call to regression_statistics().
+    """
+    bootstrap_samples_statistics = np.empty((len(stats_funcs), len(bootstrap_samples)))
+    fused_statistics = None
+    for stats_func_idx, stats_func in enumerate(stats_funcs):
+        fused_statistic = getattr(stats_func, 'fused_statistic', None)
+        if batched and fused_statistic is not None:
+            if fused_statistics is None:
+                fused_statistics = regression_statistics(bootstrap_samples)
+            bootstrap_samples_statistics[stats_func_idx] = fused_statistics[fused_statistic]
+        elif batched:
+            bootstrap_samples_statistics[stats_func_idx] = stats_func(bootstrap_samples)
+        else:
+            for bootstrap_sample_idx, bootstrap_sample in enumerate(bootstrap_samples):
+                bootstrap_samples_statistics[stats_func_idx][bootstrap_sample_idx] = stats_func(bootstrap_sample)
+    return bootstrap_samples_statistics
+
+
+# =============================================================================
+# EXACT BOOTSTRAP
+# =============================================================================
+
+def n_bootstrap_multisets(n_samples):
+    """Return the number of distinct bootstrap samples (multisets) of n_samples data points."""
+    return scipy.special.comb(2*n_samples - 1, n_samples, exact=True)
+
+
+def is_exact_bootstrap(n_samples, n_bootstrap_samples):
+    """Return True if compute_bootstrap_statistics() enumerates the bootstrap multisets by default.
+
+    This is the case when there are at most n_bootstrap_samples distinct
+    bootstrap samples of n_samples data points.
+    """
+    return n_bootstrap_multisets(n_samples) <= n_bootstrap_samples
+
+
+def enumerate_bootstrap_multisets(n_samples):
+    """Enumerate all the distinct bootstrap samples of n_samples data points.
+
+    Parameters
+    ----------
+    n_samples : int
+        The number of data points.
+
+    Returns
+    -------
+    samples_indices : np.ndarray
+        Array of shape (n_multisets, n_samples). Each row holds the (sorted)
+        indices of the data points of a distinct bootstrap sample.
+    weights : np.ndarray
+        weights[i] is the probability of drawing the multiset samples_indices[i]
+        when re-sampling with replacement (i.e., the multinomial coefficient
+        of the multiset divided by n_samples**n_samples).
+    """
+    samples_indices = np.array(list(itertools.combinations_with_replacement(range(n_samples), n_samples)),
+                               dtype=int).reshape(-1, n_samples)
+    # Count the multiplicity of each data point in each multiset.
+    counts = np.zeros((len(samples_indices), n_samples), dtype=int)
+    for column in samples_indices.T:
+        counts[np.arange(len(samples_indices)), column] += 1
+    # Use the log gamma function for numerical stability.
+    log_weights = (scipy.special.gammaln(n_samples + 1) - scipy.special.gammaln(counts + 1).sum(axis=1)
+                   - n_samples * np.log(n_samples))
+    return samples_indices, np.exp(log_weights)
+
+
+def _weighted_quantiles(sorted_values, sorted_weights, quantiles):
+    """Return the smallest values whose cumulative weight reaches the given quantiles."""
+    cumulative_weights = np.cumsum(sorted_weights)
+    cumulative_weights /= cumulative_weights[-1]
+    indices = np.searchsorted(cumulative_weights, quantiles)
+    return sorted_values[np.minimum(indices, len(sorted_values) - 1)]
+
+
+def _compute_exact_bootstrap_statistics(samples, stats_funcs, statistics, percentile,
+                                        n_bootstrap_samples, sems, batched, random_state):
+    """Compute the bootstrap statistics by enumerating all the bootstrap multisets.
+
+    If sems is given, the noise is stratified over the multisets: each
+    multiset is evaluated on max(1, round(weight * n_bootstrap_samples))
+    independent draws of the normal noise, which share the weight of the
+    multiset. The re-sampling with replacement remains exact.
+    """
+    samples_indices, weights = enumerate_bootstrap_multisets(len(samples))
+
+    if sems is None:
+        bootstrap_samples = samples[samples_indices]
+    else:
+        n_noise_draws = np.maximum(1, np.round(weights * n_bootstrap_samples)).astype(int)
+        samples_indices = np.repeat(samples_indices, n_noise_draws, axis=0)
+        weights = np.repeat(weights / n_noise_draws, n_noise_draws)
+        noise = generate_normal_noise(sems, n_resamples=len(samples_indices), random_state=random_state)
+        bootstrap_samples = resample_from_normal(samples, stds=sems, noise=noise)
+        bootstrap_samples = np.take_along_axis(bootstrap_samples, samples_indices[:, :, np.newaxis], axis=1)
+
+    bootstrap_samples_statistics = _evaluate_estimators(bootstrap_samples, stats_funcs, batched)
 
-    # Compute confidence intervals.
-    percentile_index = int(np.floor(n_bootstrap_samples * (1 - percentile) / 2)) - 1
     bootstrap_statistics = []
     for stats_func_idx, samples_statistics in enumerate(bootstrap_samples_statistics):
-        samples_statistics.sort()
-        stat_lower_percentile = samples_statistics[percentile_index]
-        stat_higher_percentile = samples_statistics[-percentile_index+1]
-        confidence_interval = (stat_lower_percentile, stat_higher_percentile)
-        bootstrap_statistics.append([statistics[stats_func_idx], confidence_interval, samples_statistics])
+        distribution = ExactBootstrapDistribution(samples_statistics, weights,
+                                                  n_representative_values=n_bootstrap_samples)
+        confidence_interval = distribution.confidence_interval(percentile)
+        bootstrap_statistics.append([statistics[stats_func_idx], confidence_interval, distribution])
 
     return bootstrap_statistics
 
 
-def resample_from_normal(samples, stds):
+class ExactBootstrapDistribution:
+    """Bootstrap distribution obtained by enumerating the bootstrap multisets.
+
+    The distribution holds the statistics of all the evaluated bootstrap
+    samples with their probabilities. Like BootstrapDistributionSketch,
+    iterating over it yields evenly-spaced quantiles of the distribution,
+    which can be used in place of the bootstrap statistics (e.g., for
+    violin plots).
+
+    Parameters
+    ----------
+    values : np.ndarray
+        The statistics computed on the evaluated bootstrap samples.
+    weights : np.ndarray
+        The probability of each bootstrap sample.
+    n_representative_values : int, optional
+        The maximum number of quantiles yielded when iterating over the
+        distribution. Default is 1000.
+
+    """
+
+    def __init__(self, values, weights, n_representative_values=1000):
+        order = np.argsort(values, kind='stable')
+        self.values = np.asarray(values, dtype=float)[order]
+        self.weights = np.asarray(weights, dtype=float)[order] / np.sum(weights)
+        self.n_representative_values = n_representative_values
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        return iter(self.representative_values())
+
+    def __array__(self, dtype=None):
+        return np.asarray(self.representative_values(), dtype=dtype)
+
+    def mean(self):
+        """The exact mean of the bootstrap statistics."""
+        return np.sum(self.values * self.weights)
+
+    def quantiles(self, quantiles):
+        """The quantiles of the bootstrap statistics."""
+        return _weighted_quantiles(self.values, self.weights, quantiles)
+
+    def confidence_interval(self, percentile=0.95):
+        """The (lower_bound, upper_bound) percentile confidence interval."""
+        lower_bound, upper_bound = self.quantiles([(1 - percentile) / 2, 1 - (1 - percentile) / 2])
+        return lower_bound, upper_bound
+
+    def representative_values(self):
+        """Evenly-spaced quantiles representing the bootstrap distribution."""
+        n_values = self.n_representative_values
+        return self.quantiles((np.arange(n_values) + 0.5) / n_values)
+
+
+# =============================================================================
+# PAIRED BOOTSTRAP
+# =============================================================================
+
+def compute_paired_bootstrap_statistics(samples, stats_funcs, n_bootstrap_samples=10000, sems=None,
+                                        random_state=None, chunk_size=1000):
+    """Bootstrap several paired series of samples with the same re-sampling indices.
+
+    All the series are re-sampled in a single vectorized pass, and their
+    bootstrap statistics can be compared pairwise with
+    compare_paired_bootstrap_statistics().
+
+    Parameters
+    ----------
+    samples : np.ndarray
+        Array of shape (n_series, n_samples, 2). samples[i][j] is the j-th data
+        point of the i-th series (e.g., the prediction of the i-th method for
+        the j-th system). In each bootstrap cycle, the same indices j are
+        re-sampled for all the series.
+    stats_funcs : list of callables
+        The statistics estimators functions with signature stat_func(samples).
+    n_bootstrap_samples : int, optional
+        The number of bootstrap samples to sample. Default is 10000.
+    sems : np.ndarray, optional
+        The standard error of the means of the samples with the same shape
+        of samples (see compute_bootstrap_statistics()).
+    random_state : numpy.random.Generator or int, optional
+        The random number generator (or its seed) used to draw the bootstrap
+        samples and the normal noise.
+    chunk_size : int, optional
+        The number of bootstrap samples generated at once. Default is 1000.
+
+    Returns
+    -------
+    statistics : np.ndarray
+        statistics[i][k] is the statistic stats_funcs[i] of the k-th series.
+    bootstrap_samples_statistics : np.ndarray
+        bootstrap_samples_statistics[i][b][k] is the statistic stats_funcs[i]
+        of the k-th series computed on the b-th bootstrap sample.
+    """
+    try:
+        len(stats_funcs)
+    except TypeError:
+        stats_funcs = [stats_funcs]
+
+    samples = np.asarray(samples)
+    n_series, n_samples = samples.shape[:2]
+    batched = all(is_batched_estimator(stats_func) for stats_func in stats_funcs)
+    random_state = check_random_state(random_state)
+
+    # Compute the statistics of all series.
+    statistics = _evaluate_estimators(samples, stats_funcs, batched)
+
+    bootstrap_samples_statistics = np.empty((len(stats_funcs), n_bootstrap_samples, n_series))
+    for chunk_start in range(0, n_bootstrap_samples, chunk_size):
+        n_chunk_samples = min(chunk_size, n_bootstrap_samples - chunk_start)
+        samples_indices = random_state.integers(low=0, high=n_samples, size=(n_chunk_samples, n_samples))
+
+        # Build the (n_chunk_samples, n_series, n_samples, 2) tensor of bootstrap samples.
+        if sems is None:
+            bootstrap_samples = samples[:, samples_indices].transpose(1, 0, 2, 3)
+        else:
+            noise = generate_normal_noise(sems, n_resamples=n_chunk_samples, random_state=random_state)
+            bootstrap_samples = resample_from_normal(samples, stds=sems, noise=noise)
+            bootstrap_samples = np.take_along_axis(
+                bootstrap_samples, samples_indices[:, np.newaxis, :, np.newaxis], axis=2)
+
+        chunk_statistics = _evaluate_estimators(bootstrap_samples.reshape(-1, n_samples, 2), stats_funcs, batched)
+        bootstrap_samples_statistics[:, chunk_start:chunk_start+n_chunk_samples] = chunk_statistics.reshape(
+            len(stats_funcs), n_chunk_samples, n_series)
+
+    return statistics, bootstrap_samples_statistics
+
+
+def compare_paired_bootstrap_statistics(statistics, bootstrap_samples_statistics, percentile=0.95,
+                                        ordering_function=None):
+    """Compare all pairs of series from their paired bootstrap distributions.
+
+    Parameters
+    ----------
+    statistics : np.ndarray
+        statistics[k] is the statistic of the k-th series.
+    bootstrap_samples_statistics : np.ndarray
+        Array of shape (n_bootstrap_samples, n_series) of bootstrap statistics
+        computed with the same re-sampling indices for all the series (see
+        compute_paired_bootstrap_statistics()).
+    percentile : float, optional
+        The bootstrap percentile of the confidence intervals. Default is 0.95.
+    ordering_function : callable, optional
+        A vectorized function such that a series is better than another if
+        ordering_function(statistic) is smaller (e.g., lambda x: -x for
+        correlation coefficients). Default is the identity.
+
+    Returns
+    -------
+    comparison : dict
+        Dictionary with keys 'delta', 'delta_lower_bound', 'delta_upper_bound',
+        and 'probability_better'. Each is an array of shape (n_series, n_series).
+        delta[i][j] is statistics[i] - statistics[j] with its percentile confidence
+        interval, and probability_better[i][j] is the fraction of bootstrap samples
+        in which series i is better than series j (ties count 1/2).
+    """
+    if ordering_function is None:
+        ordering_function = lambda x: x
+    statistics = np.asarray(statistics)
+    n_series = len(statistics)
+    ordering_values = ordering_function(bootstrap_samples_statistics)
+
+    comparison = dict(
+        delta=statistics[:, np.newaxis] - statistics[np.newaxis, :],
+        delta_lower_bound=np.empty((n_series, n_series)),
+        delta_upper_bound=np.empty((n_series, n_series)),
+        probability_better=np.empty((n_series, n_series)),
+    )
+    # Compare one series at a time with all the others to bound the memory.
+    for series_idx in range(n_series):
+        delta = bootstrap_samples_statistics[:, series_idx:series_idx+1] - bootstrap_samples_statistics
+        delta.sort(axis=0)
+        lower_bound, upper_bound = _sorted_confidence_interval(delta, percentile)
+        comparison['delta_lower_bound'][series_idx] = lower_bound
+        comparison['delta_upper_bound'][series_idx] = upper_bound
+
+        series_ordering_values = ordering_values[:, series_idx:series_idx+1]
+        comparison['probability_better'][series_idx] = (
+            (series_ordering_values < ordering_values).mean(axis=0) +
+            (series_ordering_values == ordering_values).mean(axis=0) / 2)
+    return comparison
+
+
+# =============================================================================
+# BOOTSTRAP DISTRIBUTION SKETCHES
+# =============================================================================
+
+class QuantileSketch:
+    """Mergeable streaming quantile sketch.
+
+    This implements the compactor hierarchy of Karnin, Lang, and Liberty
+    (KLL). Values are stored in levels, and a value at level h represents
+    2**h of the original values. When a level exceeds its capacity, it is
+    sorted and every other value is promoted to the next level. The memory
+    grows only logarithmically with the number of values, and the rank error
+    of the quantiles is roughly inversely proportional to the size k.
+
+    Parameters
+    ----------
+    k : int, optional
+        The capacity of the top level. Default is 2000.
+
+    """
+
+    def __init__(self, k=2000):
+        self.k = k
+        self.n_values = 0
+        self._compactors = [np.empty(0)]
+        # Alternate the compaction offset to make the rank errors cancel out.
+        self._offsets = [0]
+
+    def __len__(self):
+        return self.n_values
+
+    def update(self, values):
+        """Add the values to the sketch."""
+        values = np.asarray(values, dtype=float).ravel()
+        self._compactors[0] = np.concatenate([self._compactors[0], values])
+        self.n_values += len(values)
+        self._compress()
+
+    def merge(self, other):
+        """Add all the values summarized by another QuantileSketch."""
+        if other.k != self.k:
+            raise ValueError('Cannot merge quantile sketches of different sizes.')
+        for level, items in enumerate(other._compactors):
+            self._add_level(level)
+            self._compactors[level] = np.concatenate([self._compactors[level], items])
+        self.n_values += other.n_values
+        self._compress()
+
+    def quantiles(self, quantiles):
+        """Return the approximate quantiles of the values added so far."""
+        if self.n_values == 0:
+            raise ValueError('The quantile sketch is empty.')
+        values, weights = self.weighted_values()
+        order = np.argsort(values, kind='stable')
+        return _weighted_quantiles(values[order], weights[order], quantiles)
+
+    def weighted_values(self):
+        """Return the values retained by the sketch and the number of values each represents.
+
+        The weights sum to the number of values added to the sketch.
+        """
+        values = np.concatenate(self._compactors)
+        weights = np.concatenate([np.full(len(items), 2.0**level)
+                                  for level, items in enumerate(self._compactors)])
+        return values, weights
+
+    def _add_level(self, level):
+        while len(self._compactors) <= level:
+            self._compactors.append(np.empty(0))
+            self._offsets.append(0)
+
+    def _capacity(self, level):
+        # The capacities decrease geometrically going down the hierarchy.
+        depth = len(self._compactors) - level - 1
+        return max(2, int(np.ceil(self.k * (2/3)**depth)))
+
+    def _compress(self):
+        level = 0
+        while level < len(self._compactors):
+            items = self._compactors[level]
+            if len(items) > self._capacity(level):
+                self._add_level(level + 1)
+                items = np.sort(items)
+                # An odd value out remains at this level.
+                n_compacted = len(items) - len(items) % 2
+                promoted = items[self._offsets[level]:n_compacted:2]
+                self._offsets[level] = 1 - self._offsets[level]
+                self._compactors[level] = items[n_compacted:]
+                self._compactors[level+1] = np.concatenate([self._compactors[level+1], promoted])
+            level += 1
+
+
+class BootstrapDistributionSketch:
+    """Compact summary of a bootstrap distribution.
+
+    The sketch holds a QuantileSketch to compute the confidence intervals,
+    a histogram with exact counts, the exact minimum and maximum, and the
+    running sum to compute the exact mean. Iterating over the sketch
+    yields evenly-spaced quantiles of the distribution, which can be used
+    in place of the bootstrap statistics (e.g., for violin plots).
+
+    The histogram bins have a width that is a power of 2 and edges at
+    integer multiples of the width. When the values span more than n_bins
+    bins, the width is doubled and pairs of adjacent bins are summed. Since
+    any two grids are aligned, the histograms of two sketches can be merged
+    exactly after bringing them to the same width.
+
+    Sketches accumulated in parallel workers can be combined with merge().
+
+    Parameters
+    ----------
+    k : int, optional
+        The size of the quantile sketch. Default is 2000.
+    n_bins : int, optional
+        The maximum number of bins of the histogram. Default is 100.
+    n_representative_values : int, optional
+        The maximum number of quantiles yielded when iterating over the
+        sketch. Default is 1000.
+
+    """
+
+    def __init__(self, k=2000, n_bins=100, n_representative_values=1000):
+        self.quantile_sketch = QuantileSketch(k)
+        self.n_bins = n_bins
+        self.n_representative_values = n_representative_values
+        self.sum = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        # The histogram counts[i] is the number of values in the bin
+        # [(bin_offset + i) * bin_width, (bin_offset + i + 1) * bin_width).
+        self.bin_width = None
+        self.bin_offset = 0
+        self.counts = np.zeros(0, dtype=int)
+
+    def __len__(self):
+        return len(self.quantile_sketch)
+
+    def __iter__(self):
+        return iter(self.representative_values())
+
+    def __array__(self, dtype=None):
+        return np.asarray(self.representative_values(), dtype=dtype)
+
+    def update(self, values):
+        """Add the bootstrap statistics to the sketch."""
+        values = np.asarray(values, dtype=float).ravel()
+        if len(values) == 0:
+            return
+        self.quantile_sketch.update(values)
+        self.sum += values.sum()
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+
+        # Non-finite statistics cannot be binned.
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return
+        if self.bin_width is None:
+            min_value, max_value = values.min(), values.max()
+            # The smallest power of 2 fitting the range in n_bins bins, but
+            # not smaller than the resolution of the values.
+            self.bin_width = 2.0**np.ceil(np.log2(max(
+                (max_value - min_value) / self.n_bins,
+                np.spacing(max(abs(min_value), abs(max_value))), np.finfo(float).tiny)))
+            self.bin_offset = int(np.floor(min_value / self.bin_width))
+        bin_indices = np.floor(values / self.bin_width).astype(np.int64)
+        self._extend_histogram(bin_indices.min(), bin_indices.max())
+        # Values may have moved to a coarser bin.
+        bin_indices = np.floor(values / self.bin_width).astype(np.int64)
+        np.add.at(self.counts, bin_indices - self.bin_offset, 1)
+
+    def merge(self, other):
+        """Add all the bootstrap statistics summarized by another sketch."""
+        if len(other) == 0:
+            return
+        self.quantile_sketch.merge(other.quantile_sketch)
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+        if other.bin_width is None:
+            return
+        if self.bin_width is None:
+            self.bin_width = other.bin_width
+            self.bin_offset = other.bin_offset
+            self.counts = other.counts.copy()
+            return
+        # Bring both histograms to the same bin width.
+        other_bin_width, other_bin_offset, other_counts = other.bin_width, other.bin_offset, other.counts
+        while other_bin_width < self.bin_width:
+            other_bin_offset, other_counts = self._coarsen_counts(other_bin_offset, other_counts)
+            other_bin_width *= 2
+        while self.bin_width < other_bin_width:
+            self.bin_offset, self.counts = self._coarsen_counts(self.bin_offset, self.counts)
+            self.bin_width *= 2
+        # Merging may require a coarser width.
+        other_bin_indices = other_bin_offset + np.arange(len(other_counts))
+        other_bin_width = self.bin_width
+        self._extend_histogram(other_bin_indices[0], other_bin_indices[-1])
+        while other_bin_width < self.bin_width:
+            other_bin_indices //= 2
+            other_bin_width *= 2
+        np.add.at(self.counts, other_bin_indices - self.bin_offset, other_counts)
+
+    def mean(self):
+        """The mean of the bootstrap statistics."""
+        return self.sum / len(self)
+
+    def quantiles(self, quantiles):
+        """The approximate quantiles of the bootstrap statistics."""
+        return self.quantile_sketch.quantiles(quantiles)
+
+    def confidence_interval(self, percentile=0.95):
+        """The (lower_bound, upper_bound) percentile confidence interval."""
+        lower_bound, upper_bound = self.quantiles([(1 - percentile) / 2, 1 - (1 - percentile) / 2])
+        return lower_bound, upper_bound
+
+    def representative_values(self):
+        """Evenly-spaced quantiles representing the bootstrap distribution."""
+        n_values = min(len(self), self.n_representative_values)
+        return self.quantiles((np.arange(n_values) + 0.5) / n_values)
+
+    def histogram(self, density=False):
+        """Return the histogram of the bootstrap statistics.
+
+        The counts are exact, and the bins cover the range of all the finite
+        values added to (or merged into) the sketch with at most n_bins bins.
+
+        Returns
+        -------
+        counts : np.ndarray
+            The counts (or the probability densities if density is True) of
+            the bins.
+        bin_edges : np.ndarray
+            The len(counts) + 1 edges of the bins.
+        """
+        if self.bin_width is None:
+            raise ValueError('The bootstrap distribution sketch has no finite values.')
+        counts = self.counts
+        bin_edges = (self.bin_offset + np.arange(len(counts) + 1)) * self.bin_width
+        if density:
+            counts = counts / (counts.sum() * self.bin_width)
+        return counts, bin_edges
+
+    def _extend_histogram(self, first_bin_index, last_bin_index):
+        """Extend the histogram to the given bins, coarsening it if they do not fit in n_bins bins.
+
+        The bin indices refer to the current bin width.
+        """
+        first_bin_index = min(first_bin_index, self.bin_offset)
+        last_bin_index = max(last_bin_index, self.bin_offset + len(self.counts) - 1)
+        while last_bin_index - first_bin_index + 1 > self.n_bins:
+            self.bin_offset, self.counts = self._coarsen_counts(self.bin_offset, self.counts)
+            self.bin_width *= 2
+            first_bin_index //= 2
+            last_bin_index //= 2
+        counts = np.zeros(last_bin_index - first_bin_index + 1, dtype=int)
+        start = self.bin_offset - first_bin_index
+        counts[start:start+len(self.counts)] = self.counts
+        self.bin_offset, self.counts = int(first_bin_index), counts
+
+    @staticmethod
+    def _coarsen_counts(bin_offset, counts):
+        """Return the (bin_offset, counts) of the histogram with twice the bin width."""
+        if len(counts) == 0:
+            return bin_offset // 2, counts
+        bin_indices = (bin_offset + np.arange(len(counts))) // 2
+        new_counts = np.zeros(bin_indices[-1] - bin_indices[0] + 1, dtype=int)
+        np.add.at(new_counts, bin_indices - bin_indices[0], counts)
+        return int(bin_indices[0]), new_counts
+
+
+def resample_from_normal(samples, stds, n_resamples=None, noise=None, random_state=None):
     """Resample from a normal distribution.
 
     This handle SEMs == 0.0 that make numpy.random.normal throw an exception.
@@ -211,6 +1252,14 @@ def resample_from_normal(samples, stds):
         The standard deviations of each sample. It must have the same shape
         of samples. Samples for which the standard deviations is 0.0 are not
         re-sampled.
+    n_resamples : int, optional
+        If given, n_resamples independent re-samplings are generated with a
+        single draw and returned as an array of shape (n_resamples, *samples.shape).
+    noise : np.ndarray, optional
+        The noise to add to the samples as generated by generate_normal_noise().
+        If given, no new random number is drawn and n_resamples is ignored.
+    random_state : numpy.random.Generator or int, optional
+        The random number generator (or its seed) used to draw the noise.
 
     Returns
     -------
@@ -218,13 +1267,38 @@ def resample_from_normal(samples, stds):
         The samples resampled from a normal distribution with mean old_sample
         and standard deviation std.
     """
-    new_samples = np.empty(samples.shape, dtype=samples.dtype)
-    for sample_idx, (sample, std) in enumerate(zip(samples, stds)):
-        # Handle case where individual samples are tuples and only a
-        # subset of them has std 0.0
-        for sample_subidx, (sample_i, std_i) in enumerate(zip(sample, std)):
-            if std_i == 0.0:
-                new_samples[sample_idx][sample_subidx] = sample_i
-            else:
-                new_samples[sample_idx][sample_subidx] = np.random.normal(loc=sample_i, scale=std_i)
-    return new_samples
+    samples = np.asarray(samples)
+    if noise is None:
+        noise = generate_normal_noise(stds, n_resamples, random_state)
+    return samples + noise
+
+
+def generate_normal_noise(stds, n_resamples=None, random_state=None):
+    """Pre-generate the noise used by resample_from_normal().
+
+    Random numbers are drawn only for the entries with non-zero standard
+    deviation. The noise of the others is masked to exactly 0.0 so that,
+    for example, the experimental values remain untouched.
+
+    Parameters
+    ----------
+    stds : np.ndarray
+        The standard deviations of each sample.
+    n_resamples : int, optional
+        If given, the noise for n_resamples re-samplings is generated at once.
+    random_state : numpy.random.Generator or int, optional
+        The random number generator (or its seed) used to draw the noise.
+
+    Returns
+    -------
+    noise : np.ndarray
+        An array of shape stds.shape, or (n_resamples, *stds.shape) if
+        n_resamples is given, of normally-distributed noise.
+    """
+    random_state = check_random_state(random_state)
+    stds = np.asarray(stds, dtype=float)
+    mask = stds != 0.0
+    shape = stds.shape if n_resamples is None else (n_resamples, *stds.shape)
+    noise = np.zeros(shape)
+    noise[..., mask] = random_state.standard_normal(size=(*shape[:len(shape)-stds.ndim], mask.sum())) * stds[mask]
+    return noise
@@ -10,6 +10,12 @@
 import os
 import io
 import glob
+import json
+import collections
+import hashlib
+import zipfile
+import tempfile
+import concurrent.futures
 
 import numpy as np
 import pandas as pd
@@ -21,15 +27,566 @@ from .stats import mean_confidence_interval
 # UTILITY FUNCTIONS
 # =============================================================================
 
-def load_submissions(submission_cls, directory_path, user_map):
-    submissions = []
-    for file_path in glob.glob(os.path.join(directory_path, '*.txt')):
+def load_submissions(submission_cls, directory_path, user_map, n_workers=1, use_processes=False, lazy=False):
+    """Load all the submissions in the directory.
+
+    Submissions raising IgnoredSubmissionError are skipped. Any other error
+    (e.g., BadFormatError) is raised for the first offending file in the
+    same order used by the serial loader.
+
+    Parameters
+    ----------
+    submission_cls : type
+        The SamplSubmission subclass used to parse the files.
+    directory_path : str
+        The path to the directory containing the submission files.
+    user_map : UserMap or pandas.DataFrame
+        The user map passed to the submission constructor. All the file
+        names are checked against it before parsing, and a UserMapError
+        listing all the missing and duplicated entries is raised.
+    n_workers : int, optional
+        The number of files parsed concurrently. Default is 1 (serial).
+    use_processes : bool, optional
+        If True, the files are parsed in a pool of processes rather than
+        threads. Default is False.
+    lazy : bool, optional
+        If True, only the metadata sections are parsed, and the predictions
+        of each submission are parsed the first time they are accessed. This
+        requires submission_cls to accept the lazy keyword argument. Default
+        is False.
+
+    Returns
+    -------
+    submissions : list
+        The loaded submissions.
+    """
+    file_paths = glob.glob(os.path.join(directory_path, '*.txt'))
+
+    # Index the user map once and check all the entries at once.
+    if user_map is not None:
+        if not isinstance(user_map, UserMap):
+            user_map = UserMap(user_map)
+        user_map.validate([os.path.basename(file_path) for file_path in file_paths])
+
+    submissions = _map_files(_load_submission, [(submission_cls, file_path, user_map, lazy)
+                                                for file_path in file_paths],
+                             n_workers, use_processes)
+
+    # Remove the cached sections of the deleted or modified submission files.
+    if submission_cls.SECTIONS_CACHE_DIR_PATH is not None:
+        prune_sections_cache(submission_cls.SECTIONS_CACHE_DIR_PATH)
+    return [submission for submission in submissions if submission is not None]
+
+
+def validate_submissions(submission_cls, directory_path, user_map=None, report_file_path=None,
+                         n_workers=1, use_processes=False):
+    """Check all the submission files in a directory tree without stopping at the first error.
+
+    Each file is checked with submission_cls.validate_file() (sections,
+    numeric columns, and any check specific to submission_cls). The whole
+    tree is then checked for participants with more than one ranked
+    submission in the same directory and for the coverage of the user map.
+
+    Parameters
+    ----------
+    submission_cls : type
+        The SamplSubmission subclass used to check the files.
+    directory_path : str
+        The root of the directory tree containing the submission files.
+    user_map : UserMap or pandas.DataFrame, optional
+        If given, the report lists the files missing from or duplicated in
+        the user map, and the entries of the user map without a file.
+    report_file_path : str, optional
+        If given, the report is written to this path in JSON format.
+    n_workers : int, optional
+        The number of files checked concurrently. Default is 1 (serial).
+    use_processes : bool, optional
+        If True, the files are checked in a pool of processes rather than
+        threads. Default is False.
+
+    Returns
+    -------
+    report : dict
+        The validation report. report['valid'] is True only if no error
+        was found.
+    """
+    file_paths = sorted(glob.glob(os.path.join(directory_path, '**', '*.txt'), recursive=True))
+    file_records = _map_files(submission_cls.validate_file, [(file_path,) for file_path in file_paths],
+                              n_workers, use_processes)
+
+    # Find the participants with multiple ranked submissions for the same dataset.
+    ranked_file_names = {}
+    for record in file_records:
+        if record['ranked']:
+            key = (os.path.dirname(record['file_path']), record['participant'])
+            ranked_file_names.setdefault(key, []).append(os.path.basename(record['file_path']))
+    duplicated_ranked_submissions = [
+        {'directory_path': dir_path, 'participant': participant, 'file_names': file_names}
+        for (dir_path, participant), file_names in sorted(ranked_file_names.items()) if len(file_names) > 1
+    ]
+
+    # Check the coverage of the user map.
+    if user_map is not None:
+        if not isinstance(user_map, UserMap):
+            user_map = UserMap(user_map)
+        file_names = [os.path.basename(file_path) for file_path in file_paths]
+        missing_file_names, duplicated_file_names = user_map.check_file_names(file_names)
+        user_map_report = {
+            'missing_entries': missing_file_names,
+            'duplicated_entries': duplicated_file_names,
+            'unused_entries': sorted(set(user_map) - set(file_names)),
+        }
+        user_map_valid = len(missing_file_names) + len(duplicated_file_names) == 0
+    else:
+        user_map_report = None
+        user_map_valid = True
+
+    n_invalid_files = sum(len(record['errors']) > 0 for record in file_records)
+    report = {
+        'directory_path': os.path.abspath(directory_path),
+        'valid': n_invalid_files == 0 and len(duplicated_ranked_submissions) == 0 and user_map_valid,
+        'n_files': len(file_records),
+        'n_invalid_files': n_invalid_files,
+        'files': file_records,
+        'duplicated_ranked_submissions': duplicated_ranked_submissions,
+        'user_map': user_map_report,
+    }
+    if report_file_path is not None:
+        with open(report_file_path, 'w') as f:
+            json.dump(report, f, indent=4)
+    return report
+
+
+def fingerprint_submission_files(directory_paths):
+    """Compute the content hash of all the submission files in the directories.
+
+    Parameters
+    ----------
+    directory_paths : list of str
+        The paths to the directories containing the submission files.
+
+    Returns
+    -------
+    fingerprints : dict
+        file_path -> SHA-256 hash of the file content, where file_path is
+        the absolute path to the submission file.
+    """
+    fingerprints = {}
+    for directory_path in directory_paths:
+        for file_path in glob.glob(os.path.join(directory_path, '*.txt')):
+            with open(file_path, 'rb') as f:
+                fingerprints[os.path.abspath(file_path)] = hashlib.sha256(f.read()).hexdigest()
+    return fingerprints
+
+
+def read_submission_fingerprints(file_path):
+    """Read the fingerprints saved by a previous run (empty if there are none)."""
+    try:
+        with open(file_path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def write_submission_fingerprints(file_path, fingerprints):
+    """Save the fingerprints returned by fingerprint_submission_files() in JSON format."""
+    dir_path = os.path.dirname(file_path)
+    if dir_path != '':
+        os.makedirs(dir_path, exist_ok=True)
+    with open(file_path, 'w') as f:
+        json.dump(fingerprints, f, indent=4, sort_keys=True)
+
+
+def compare_submission_fingerprints(old_fingerprints, new_fingerprints):
+    """Find the submission files that were added, changed, or deleted between two runs.
+
+    Returns
+    -------
+    changes : collections.OrderedDict
+        A dictionary with keys 'new', 'changed', and 'deleted' mapping
+        to the sorted lists of the corresponding file paths.
+    """
+    return collections.OrderedDict([
+        ('new', sorted(set(new_fingerprints) - set(old_fingerprints))),
+        ('changed', sorted(file_path for file_path, fingerprint in new_fingerprints.items()
+                           if old_fingerprints.get(file_path, fingerprint) != fingerprint)),
+        ('deleted', sorted(set(old_fingerprints) - set(new_fingerprints))),
+    ])
+
+
+# Identifier columns of the prediction table that are stored as categoricals.
+PREDICTION_TABLE_CATEGORICAL_COLUMNS = ['sid', 'participant', 'method', 'host_name', 'category',
+                                        'system_id', 'quantity']
+
+
+def build_prediction_table(submissions):
+    """Stack the predictions of all the submissions into a single columnar table.
+
+    The table has one row for each submission, system, and predicted quantity
+    (see SamplSubmission.PREDICTION_QUANTITIES). The submissions are identified
+    by their position in the list ('submission_index'), and their metadata
+    (see SamplSubmission._get_prediction_metadata()) is repeated on each row.
+    The identifier columns are categoricals, and the predictions are stored
+    in the float64 columns 'value', 'sem', and 'model_uncertainty'.
+
+    Parameters
+    ----------
+    submissions : list of SamplSubmission
+        The submissions. Lazily-loaded submissions are parsed.
+
+    Returns
+    -------
+    prediction_table : pandas.DataFrame
+        The predictions of all the submissions.
+    """
+    # Collect the metadata once per submission and the predictions as arrays.
+    metadata = collections.defaultdict(list)
+    predictions = collections.defaultdict(list)
+    n_rows = []
+    for submission in submissions:
+        for key, value in submission._get_prediction_metadata().items():
+            metadata[key].append(value)
+        submission_predictions = submission._get_predictions()
+        for key, values in submission_predictions.items():
+            predictions[key].append(values)
+        n_rows.append(len(submission_predictions['system_id']))
+
+    # Repeat the metadata of each submission on its rows.
+    columns = {'submission_index': np.repeat(np.arange(len(n_rows)), n_rows)}
+    for key, values in metadata.items():
+        if key in PREDICTION_TABLE_CATEGORICAL_COLUMNS:
+            values = pd.Categorical(values)
+            columns[key] = pd.Categorical.from_codes(np.repeat(values.codes, n_rows), values.categories)
+        else:
+            columns[key] = np.repeat(np.array(values), n_rows)
+    for key in ['system_id', 'quantity', 'value', 'sem', 'model_uncertainty']:
+        values = np.concatenate(predictions[key]) if len(n_rows) > 0 else []
+        if key in PREDICTION_TABLE_CATEGORICAL_COLUMNS:
+            values = pd.Categorical(values)
+        columns[key] = values
+    return pd.DataFrame(columns)
+
+
+def build_group_index(values):
+    """Find the rows of each group in a column of identifiers.
+
+    The identifiers are factorized once (for categoricals, only their integer
+    codes are used), and the row positions are grouped with a stable sort so
+    that selecting a group is a gather of its rows rather than a comparison
+    over the whole column. Missing identifiers are not assigned to any group.
+
+    Parameters
+    ----------
+    values : pandas.Series or array-like
+        The group identifier of each row (e.g., a categorical column).
+
+    Returns
+    -------
+    group_index : collections.OrderedDict
+        group -> numpy.ndarray with the (sorted) positions of the rows of
+        the group. The groups are in order of first appearance.
+    """
+    codes, groups = pd.factorize(values)
+    is_assigned = codes >= 0
+    order = np.flatnonzero(is_assigned)[np.argsort(codes[is_assigned], kind='stable')]
+    boundaries = np.cumsum(np.bincount(codes[is_assigned], minlength=len(groups)))[:-1]
+    return collections.OrderedDict(zip(groups, np.split(order, boundaries)))
+
+
+def _map_files(func, arguments, n_workers=1, use_processes=False):
+    """Call func(*args) for all args in arguments, concurrently if n_workers > 1.
+
+    The results are returned in order so that errors surface as in the
+    serial loop.
+    """
+    if n_workers > 1 and len(arguments) > 1:
+        if use_processes:
+            executor_cls = concurrent.futures.ProcessPoolExecutor
+        else:
+            executor_cls = concurrent.futures.ThreadPoolExecutor
+        with executor_cls(max_workers=n_workers) as executor:
+            futures = [executor.submit(func, *args) for args in arguments]
+            return [future.result() for future in futures]
+    return [func(*args) for args in arguments]
+
+
+def _load_submission(submission_cls, file_path, user_map, lazy=False):
+    """Return the parsed submission or None if it must be ignored."""
+    try:
+        if lazy:
+            return submission_cls(file_path, user_map, lazy=True)
+        return submission_cls(file_path, user_map)
+    except IgnoredSubmissionError:
+        return None
+
+
+# =============================================================================
+# SECTIONS CACHE
+# =============================================================================
+
+# The cache files are readable by the other users like the analysis output.
+_SECTIONS_CACHE_FILE_MODE = 0o644
+
+# Errors signaling a missing, corrupted, or outdated cache file.
+_SECTIONS_CACHE_READ_ERRORS = (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile)
+
+
+def load_cached_sections(submission_cls, file_path, metadata_only=False):
+    """Load the sections of the file using the on-disk cache of submission_cls.
+
+    The sections parsed by submission_cls._parse_sections() are cached in
+    submission_cls.SECTIONS_CACHE_DIR_PATH and re-used as long as the size and
+    content of the file, and the expected format, match. Each cache file is an
+    .npz archive holding the columns of the CSV sections and, in JSON, the
+    other sections (see _write_sections_cache_file()). Nothing is unpickled.
+    If metadata_only is True and the cache misses, only the metadata is
+    parsed and nothing is cached.
+    """
+    cache_dir_path = submission_cls.SECTIONS_CACHE_DIR_PATH
+    if cache_dir_path is None:
+        return _parse_sections(submission_cls, file_path, metadata_only)
+
+    with open(file_path, 'rb') as f:
+        content = f.read()
+    cache_key = {
+        'submission_cls': '{}.{}'.format(submission_cls.__module__, submission_cls.__qualname__),
+        'size': len(content),
+        'content_hash': hashlib.sha256(content).hexdigest(),
+        # Invalidate the cache if the expected format changes.
+        'format': repr((sorted(submission_cls.SECTIONS), submission_cls.CSV_SECTIONS)),
+    }
+
+    # The cache file is identified by the content so that it survives moving the files.
+    cache_file_name = hashlib.sha256(json.dumps(cache_key, sort_keys=True).encode()).hexdigest() + '.npz'
+    cache_file_path = os.path.join(cache_dir_path, cache_file_name)
+    source = _get_sections_cache_source(file_path)
+    try:
+        cached_key, cached_source, sections = _read_sections_cache_file(cache_file_path)
+    except _SECTIONS_CACHE_READ_ERRORS:
+        cached_key = None
+    if cached_key == cache_key:
+        # Record where the file was moved (or when it was touched) so that
+        # the cache file is not pruned (see prune_sections_cache()).
+        if cached_source != source:
+            _update_sections_cache_file(cache_file_path, cache_key, source, sections)
+        return sections
+    # Do not cache incomplete sections.
+    if metadata_only:
+        return _parse_sections(submission_cls, file_path, metadata_only)
+
+    sections = _parse_sections(submission_cls, file_path)
+    _update_sections_cache_file(cache_file_path, cache_key, source, sections)
+    return sections
+
+
+def prune_sections_cache(cache_dir_path):
+    """Remove the cache files of submission files that were deleted or modified.
+
+    Unreadable cache files and the pickle files used by older versions of
+    the cache are removed as well.
+    """
+    for cache_file_path in glob.glob(os.path.join(cache_dir_path, '*.p')):
+        os.remove(cache_file_path)
+    for cache_file_path in glob.glob(os.path.join(cache_dir_path, '*.npz')):
         try:
-            submission = submission_cls(file_path, user_map)
-        except IgnoredSubmissionError:
+            with np.load(cache_file_path, allow_pickle=False) as cache_file:
+                source = json.loads(str(cache_file['metadata']))['source']
+            is_stale = _get_sections_cache_source(source['file_path']) != source
+        except _SECTIONS_CACHE_READ_ERRORS:
+            is_stale = True
+        if is_stale:
+            try:
+                os.remove(cache_file_path)
+            except FileNotFoundError:
+                # Pruned concurrently.
+                pass
+
+
+def _parse_sections(submission_cls, file_path, metadata_only=False):
+    """Call submission_cls._parse_sections() passing metadata_only only if it is set."""
+    if metadata_only:
+        return submission_cls._parse_sections(file_path, metadata_only=True)
+    return submission_cls._parse_sections(file_path)
+
+
+def _get_sections_cache_source(file_path):
+    """Return the path, size, and modification time of the submission file."""
+    stat = os.stat(file_path)
+    return {'file_path': os.path.abspath(file_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _update_sections_cache_file(cache_file_path, cache_key, source, sections):
+    """Write the cache file atomically as submissions may be loaded concurrently.
+
+    The sections are cached only if they are restored exactly.
+    """
+    cache_dir_path = os.path.dirname(cache_file_path)
+    os.makedirs(cache_dir_path, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=cache_dir_path, suffix='.tmp', delete=False) as f:
+        temp_file_path = f.name
+    try:
+        _write_sections_cache_file(temp_file_path, cache_key, source, sections)
+        if _are_sections_equal(_read_sections_cache_file(temp_file_path)[2], sections):
+            os.chmod(temp_file_path, _SECTIONS_CACHE_FILE_MODE)
+            os.replace(temp_file_path, cache_file_path)
+    except _SECTIONS_CACHE_READ_ERRORS + (TypeError,):
+        # E.g., sections that cannot be stored without pickle like a MultiIndex.
+        pass
+    finally:
+        if os.path.exists(temp_file_path):
+            os.remove(temp_file_path)
+
+
+def _write_sections_cache_file(cache_file_path, cache_key, source, sections):
+    """Store the sections in an .npz archive.
+
+    The 'metadata' entry is a JSON document with the cache key, the source
+    of the submission file (see _get_sections_cache_source()), the sections
+    that are lists of lines, and the layout of the CSV sections, whose index
+    and columns are stored as separate arrays. Text columns are stored as
+    strings with a mask of the missing values.
+    """
+    metadata = {
+        'key': cache_key,
+        'source': source,
+        'sections': {},
+        'csv_sections': {},
+    }
+    arrays = {}
+    for section_idx, (section_name, section) in enumerate(sections.items()):
+        if not isinstance(section, pd.DataFrame):
+            metadata['sections'][section_name] = list(section)
             continue
-        submissions.append(submission)
-    return submissions
+        array_names = ['section{}_index'.format(section_idx)]
+        arrays.update(_encode_sections_cache_array(array_names[0], section.index.to_numpy()))
+        for column_idx, column_name in enumerate(section.columns):
+            array_names.append('section{}_column{}'.format(section_idx, column_idx))
+            arrays.update(_encode_sections_cache_array(array_names[-1], section[column_name].to_numpy()))
+        metadata['csv_sections'][section_name] = {
+            'index_name': section.index.name,
+            'columns': list(section.columns),
+            'arrays': array_names,
+        }
+    with open(cache_file_path, 'wb') as f:
+        np.savez(f, metadata=np.array(json.dumps(metadata)), **arrays)
+
+
+def _read_sections_cache_file(cache_file_path):
+    """Return the cache key, the source, and the sections stored by _write_sections_cache_file()."""
+    with np.load(cache_file_path, allow_pickle=False) as cache_file:
+        metadata = json.loads(str(cache_file['metadata']))
+        sections = dict(metadata['sections'])
+        for section_name, layout in metadata['csv_sections'].items():
+            index_array_name, *column_array_names = layout['arrays']
+            columns = {column_name: _decode_sections_cache_array(cache_file, array_name)
+                       for column_name, array_name in zip(layout['columns'], column_array_names)}
+            index = pd.Index(_decode_sections_cache_array(cache_file, index_array_name), name=layout['index_name'])
+            sections[section_name] = pd.DataFrame(columns, index=index, columns=layout['columns'])
+    return metadata['key'], metadata['source'], sections
+
+
+def _encode_sections_cache_array(array_name, values):
+    """Return the arrays storing the values without pickle."""
+    if values.dtype.kind in 'biuf':
+        return {array_name: values}
+    is_na = pd.isna(values)
+    if not all(isinstance(value, str) for value in values[~is_na]):
+        raise TypeError('Only text columns can be stored in the sections cache.')
+    return {array_name + '_text': np.array(['' if na else value for value, na in zip(values, is_na)], dtype=str),
+            array_name + '_na': is_na}
+
+
+def _decode_sections_cache_array(cache_file, array_name):
+    """Return the values stored by _encode_sections_cache_array()."""
+    if array_name in cache_file.files:
+        return cache_file[array_name]
+    values = cache_file[array_name + '_text'].astype(object)
+    values[cache_file[array_name + '_na']] = np.nan
+    return values
+
+
+def _are_sections_equal(sections, other_sections):
+    """Check that two sets of parsed sections are identical, including the dtypes."""
+    if sections.keys() != other_sections.keys():
+        return False
+    for section_name, section in sections.items():
+        other_section = other_sections[section_name]
+        if isinstance(section, pd.DataFrame):
+            try:
+                pd.testing.assert_frame_equal(section, other_section)
+            except AssertionError:
+                return False
+        elif list(section) != list(other_section):
+            return False
+    return True
+
+
+# =============================================================================
+# CSV PARSING
+# =============================================================================
+
+# Strings parsed as NaN (the default of pandas.read_csv()).
+_CSV_NA_VALUES = frozenset(['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan',
+                            '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None',
+                            'n/a', 'nan', 'null'])
+
+# Strings parsed as booleans by pandas.read_csv().
+_CSV_BOOL_VALUES = frozenset(['True', 'TRUE', 'true', 'False', 'FALSE', 'false'])
+
+
+def _parse_csv_lines(lines, names, index_col=None):
+    """Parse the lines of a CSV section into a DataFrame.
+
+    Rows are split directly into typed columns (int64, float64, bool, or
+    strings) with the same type inference of pandas.read_csv(). Lines that
+    the simple tokenizer cannot handle (quoted fields or a wrong number of
+    fields) and columns whose type it cannot infer like pandas (see
+    _convert_csv_column()) are delegated to pandas.read_csv().
+    """
+    n_columns = len(names)
+    rows = [line.split(',') for line in lines]
+    columns = None
+    if all(len(row) == n_columns for row in rows) and not any('"' in line for line in lines):
+        # Transpose the rows into columns and skip the spaces after the delimiters.
+        columns = {name: _convert_csv_column([field.lstrip(' ') for field in column])
+                   for name, column in zip(names, zip(*rows))}
+    if columns is None or any(column is None for column in columns.values()):
+        csv_str = io.StringIO('\n'.join(lines))
+        return pd.read_csv(csv_str, names=names, index_col=index_col, skipinitialspace=True)
+
+    if index_col is None:
+        return pd.DataFrame(columns, columns=list(names))
+    index = pd.Index(columns.pop(index_col), name=index_col)
+    return pd.DataFrame(columns, index=index, columns=[name for name in names if name != index_col])
+
+
+def _convert_csv_column(values):
+    """Convert a list of strings into an array of the inferred type.
+
+    Return None if the type inferred by pandas.read_csv() may be different:
+    booleans with missing values, integers out of the int64 range, and
+    numbers with underscores (which numpy accepts, but pandas does not).
+    """
+    is_na = [value in _CSV_NA_VALUES for value in values]
+    has_underscores = any('_' in value for value in values)
+    if not any(is_na):
+        try:
+            column = np.array(values, dtype=np.int64)
+        except OverflowError:
+            return None
+        except ValueError:
+            pass
+        else:
+            return None if has_underscores else column
+        if all(value in _CSV_BOOL_VALUES for value in values):
+            return np.array([value[0] in 'Tt' for value in values])
+    elif not all(is_na) and all(na or value in _CSV_BOOL_VALUES for value, na in zip(values, is_na)):
+        return None
+    try:
+        column = np.array(['nan' if na else value for value, na in zip(values, is_na)], dtype=np.float64)
+    except ValueError:
+        return np.array([np.nan if na else value for value, na in zip(values, is_na)], dtype=object)
+    return None if has_underscores else column
 
 
 # =============================================================================
@@ -103,6 +660,88 @@ class BadFormatError(Exception):
     pass
 
 
+class UserMapError(Exception):
+    """Exception used to signal missing or duplicated entries in the user map."""
+    pass
+
+
+class UserMap:
+    """The map between submission file names and submission IDs.
+
+    The map is indexed by file name on construction so that looking up the
+    submission ID of a file does not require scanning the whole table.
+
+    Parameters
+    ----------
+    user_map : pandas.DataFrame
+        A table with a 'sid' and a 'file_name' column.
+
+    Attributes
+    ----------
+    duplicated_file_names : set
+        The file names that appear in more than one entry.
+
+    """
+
+    def __init__(self, user_map):
+        file_names = user_map['file_name'].astype(str)
+        sids = user_map['sid'].astype(str)
+        self.duplicated_file_names = set(file_names[file_names.duplicated()])
+        self._sids = dict(zip(file_names, sids))
+
+    @classmethod
+    def from_csv(cls, file_path):
+        """Read the user map from a CSV file with or without the 'sid,file_name' header."""
+        user_map = pd.read_csv(file_path, header=None, names=['sid', 'file_name'],
+                               dtype=str, skipinitialspace=True)
+        if len(user_map) > 0 and tuple(user_map.iloc[0]) == ('sid', 'file_name'):
+            user_map = user_map.iloc[1:]
+        return cls(user_map)
+
+    def __len__(self):
+        return len(self._sids)
+
+    def __iter__(self):
+        return iter(self._sids)
+
+    def __contains__(self, file_name):
+        return file_name in self._sids
+
+    def get_sid(self, file_name):
+        """Return the submission ID of the file.
+
+        Raises
+        ------
+        UserMapError
+            If the file name is missing or appears more than once.
+
+        """
+        if file_name in self.duplicated_file_names:
+            raise UserMapError('Multiple user map entries for {}.'.format(file_name))
+        try:
+            return self._sids[file_name]
+        except KeyError:
+            raise UserMapError('No user map entry for {}.'.format(file_name))
+
+    def check_file_names(self, file_names):
+        """Return the sorted lists of missing and duplicated file names."""
+        file_names = set(file_names)
+        missing_file_names = sorted(file_names - self._sids.keys())
+        duplicated_file_names = sorted(file_names & self.duplicated_file_names)
+        return missing_file_names, duplicated_file_names
+
+    def validate(self, file_names):
+        """Raise a UserMapError listing all the missing and duplicated file names."""
+        missing_file_names, duplicated_file_names = self.check_file_names(file_names)
+        errors = []
+        if len(missing_file_names) > 0:
+            errors.append('missing entries for {}'.format(', '.join(missing_file_names)))
+        if len(duplicated_file_names) > 0:
+            errors.append('multiple entries for {}'.format(', '.join(duplicated_file_names)))
+        if len(errors) > 0:
+            raise UserMapError('Invalid user map: {}.'.format('; '.join(errors)))
+
+
 class SamplSubmission:
     """A generic SAMPL submission.
 
@@ -110,11 +749,23 @@ class SamplSubmission:
     ----------
     file_path : str
         The path to the submission file.
+    user_map : UserMap or pandas.DataFrame or None
+        The map used to assign the submission ID. A DataFrame is indexed
+        on the fly, so pass a UserMap when loading many submissions.
 
     Raises
     ------
     IgnoredSubmission
         If the submission ID is among the ignored submissions.
+    UserMapError
+        If the file is missing or duplicated in the user map.
+
+    Attributes
+    ----------
+    data
+        The predictions. If the submission was loaded lazily, only the
+        metadata sections are parsed on construction and the predictions
+        are parsed on first access (see _build_data()).
 
     """
 
@@ -129,19 +780,30 @@ class SamplSubmission:
     # Sections in CSV format with kwargs to pass to pandas.read_csv().
     CSV_SECTIONS = {}
 
+    # Columns of the CSV sections that must be numeric.
+    NUMERIC_CSV_COLUMNS = {}
+
+    # Columns of the predicted quantities in the prediction table (see
+    # build_prediction_table()): quantity -> (value, SEM, model uncertainty).
+    PREDICTION_QUANTITIES = {}
+
+    # Directory where the parsed sections are cached (None disables the cache).
+    SECTIONS_CACHE_DIR_PATH = None
+
     def __init__(self, file_path, user_map):
         file_name = os.path.basename(file_path)
         file_prefix = os.path.splitext(file_name)[0]
         self.file_name = file_name
 
+        # The predictions are built by _build_data() when first accessed.
+        self._file_path = file_path
+        self._data = None
+
         # Store user map information.
         if user_map is not None:
-            user_map_record = user_map[user_map.file_name == self.file_name]
-
-            assert len(user_map_record) == 1
-            user_map_record = user_map_record.iloc[0]
-
-            self.sid = str(user_map_record.sid)
+            if not isinstance(user_map, UserMap):
+                user_map = UserMap(user_map)
+            self.sid = user_map.get_sid(self.file_name)
         else:
             self.sid = None
 
@@ -149,20 +811,122 @@ class SamplSubmission:
         if self.sid in self.TEST_SUBMISSIONS:
             raise IgnoredSubmissionError('This submission has been used for tests.')
 
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = self._build_data(self._load_sections(self._file_path))
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+
+    def _build_data(self, sections):
+        """Build the predictions from the sections parsed with _load_sections()."""
+        raise NotImplementedError('{} does not support lazy loading.'.format(self.__class__.__name__))
+
+    def _get_predictions(self):
+        """Return the predictions as arrays with one entry for each system and quantity.
+
+        The keys are 'system_id', 'quantity', 'value', 'sem', and
+        'model_uncertainty' (see PREDICTION_QUANTITIES). Non-numeric
+        values are converted to NaN.
+        """
+        predictions = {key: [] for key in ['system_id', 'quantity', 'value', 'sem', 'model_uncertainty']}
+        for quantity, column_names in self.PREDICTION_QUANTITIES.items():
+            data = self._get_quantity_data(quantity)
+            predictions['system_id'].append(data.index.to_numpy(dtype=object))
+            predictions['quantity'].append(np.full(len(data), quantity, dtype=object))
+            for key, column_name in zip(['value', 'sem', 'model_uncertainty'], column_names):
+                values = pd.to_numeric(data[column_name], errors='coerce')
+                predictions[key].append(values.to_numpy(dtype=np.float64))
+        return {key: np.concatenate(values) for key, values in predictions.items()}
+
+    def _get_quantity_data(self, quantity):
+        """Return the DataFrame holding the predictions of the quantity."""
+        return self.data
+
+    def _get_prediction_metadata(self):
+        """Return the metadata repeated on each row of the prediction table."""
+        return {'sid': self.sid}
+
+    @classmethod
+    def validate_file(cls, file_path):
+        """Check the format of the submission file without raising.
+
+        The file is always parsed, and nothing is written to the sections cache.
+
+        Returns
+        -------
+        record : dict
+            The 'file_path', the 'name', 'participant', and 'ranked'
+            metadata of the submission (None if they could not be read),
+            and the list of 'errors' found in the file.
+        """
+        record = {'file_path': file_path, 'name': None, 'participant': None, 'ranked': None}
+        try:
+            # Parse the file without the cache so that validating has no side effects.
+            sections = cls._parse_sections(file_path)
+        except BadFormatError as e:
+            errors = [str(e)]
+        except Exception as e:
+            # E.g., a row with the wrong number of fields.
+            errors = ['In file {}, {}: {}'.format(file_path, type(e).__name__, str(e).strip())]
+        else:
+            for key, section_name in [('name', 'Name'), ('participant', 'Participant name'),
+                                      ('ranked', 'Ranked')]:
+                if section_name in sections:
+                    record[key] = sections[section_name][0].strip()
+            if record['ranked'] is not None:
+                record['ranked'] = record['ranked'] == 'True'
+            errors = cls._validate_sections(file_path, sections)
+        record['errors'] = errors
+        return record
+
+    @classmethod
+    def _validate_sections(cls, file_path, sections):
+        """Return the list of errors found in the parsed sections."""
+        errors = []
+        for section_name, column_names in cls.NUMERIC_CSV_COLUMNS.items():
+            section = sections[section_name]
+            for column_name in column_names:
+                if not pd.api.types.is_numeric_dtype(section[column_name]):
+                    errors.append('In file {}, non-numeric values in column {} of section {}.'.format(
+                        file_path, column_name, section_name))
+        return errors
+
     @classmethod
     def _read_lines(cls, file_path):
-        """Generator to read the file and discard blank lines and comments."""
+        """Generator to read the file and discard blank lines and comments.
+
+        The file is read with a single call and split in memory.
+        """
         with open(file_path, 'r', encoding='utf-8-sig') as f:
-            for line in f:
-                # Strip whitespaces.
-                line = line.strip()
-                # Don't return blank lines and comments.
-                if line != '' and line[0] != '#':
-                    yield line
+            content = f.read()
+        for line in content.splitlines():
+            # Strip whitespaces.
+            line = line.strip()
+            # Don't return blank lines and comments.
+            if line != '' and line[0] != '#':
+                yield line
 
     @classmethod
-    def _load_sections(cls, file_path):
-        """Load the data in the file and separate it by sections."""
+    def _load_sections(cls, file_path, metadata_only=False):
+        """Load the data in the file and separate it by sections.
+
+        If SECTIONS_CACHE_DIR_PATH is set, the parsed sections are cached on disk
+        (see load_cached_sections()). If metadata_only is True, the CSV sections
+        may be omitted.
+        """
+        return load_cached_sections(cls, file_path, metadata_only)
+
+    @classmethod
+    def _parse_sections(cls, file_path, metadata_only=False):
+        """Parse the file and separate the data by sections.
+
+        If metadata_only is True, the CSV sections are not parsed and are
+        not included in the returned sections.
+        """
         sections = {}
         current_section = None
         for line in cls._read_lines(file_path):
@@ -182,9 +946,13 @@ class SamplSubmission:
 
         # Create a Pandas dataframe from the CSV format.
         for section_name, pandas_kwargs in cls.CSV_SECTIONS.items():
-            csv_str = io.StringIO('\n'.join(sections[section_name]))
-            section = pd.read_csv(csv_str, skipinitialspace=True, **pandas_kwargs)
-            sections[section_name] = section
+            if metadata_only:
+                del sections[section_name]
+            elif set(pandas_kwargs) <= {'names', 'index_col'}:
+                sections[section_name] = _parse_csv_lines(sections[section_name], **pandas_kwargs)
+            else:
+                csv_str = io.StringIO('\n'.join(sections[section_name]))
+                sections[section_name] = pd.read_csv(csv_str, skipinitialspace=True, **pandas_kwargs)
         return sections
 
     @classmethod
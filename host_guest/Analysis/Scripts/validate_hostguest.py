@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+"""Check all the host-guest submission files before running the analysis.
+
+The whole Submissions/ tree is checked concurrently, and all the problems
+found (missing sections, non-numeric predictions, missing required
+systems, multiple ranked submissions from the same participant, and
+files missing from the user map) are written to a single JSON report.
+The script exits with a non-zero status if any problem was found.
+"""
+
+
+# =============================================================================
+# GLOBAL IMPORTS
+# =============================================================================
+
+import sys
+import argparse
+
+from pkganalysis.submission import UserMap, validate_submissions
+from analyze_hostguest import HostGuestSubmission, N_LOAD_WORKERS
+
+
+# =============================================================================
+# CONSTANTS
+# =============================================================================
+
+# Paths to input data.
+HOST_GUEST_SUBMISSIONS_DIR_PATH = '../Submissions/'
+USER_MAP_FILE_PATH = '../SAMPL8-user-map-HG.csv'
+
+# Path to the validation report.
+VALIDATION_REPORT_FILE_PATH = '../validation_report.json'
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--submissions', default=HOST_GUEST_SUBMISSIONS_DIR_PATH,
+                        help='Root of the submissions tree (default: %(default)s).')
+    parser.add_argument('--user-map', default=USER_MAP_FILE_PATH,
+                        help='Path to the user map CSV file (default: %(default)s).')
+    parser.add_argument('--report', default=VALIDATION_REPORT_FILE_PATH,
+                        help='Path to the JSON report (default: %(default)s).')
+    parser.add_argument('--workers', type=int, default=N_LOAD_WORKERS,
+                        help='Number of files checked concurrently (default: %(default)s).')
+    args = parser.parse_args()
+
+    user_map = UserMap.from_csv(args.user_map)
+    report = validate_submissions(HostGuestSubmission, args.submissions, user_map,
+                                  report_file_path=args.report, n_workers=args.workers)
+
+    # Print a summary of the problems.
+    for record in report['files']:
+        for error in record['errors']:
+            print('Error:', error)
+    for duplicate in report['duplicated_ranked_submissions']:
+        print('Error: {} submitted multiple ranked submissions: {}.'.format(
+            duplicate['participant'], ', '.join(duplicate['file_names'])))
+    for key in ['missing_entries', 'duplicated_entries']:
+        if len(report['user_map'][key]) > 0:
+            print('Error: User map {}: {}.'.format(key.replace('_', ' '), ', '.join(report['user_map'][key])))
+    print('Checked {} files, {} with errors. Report written to {}.'.format(
+        report['n_files'], report['n_invalid_files'], args.report))
+
+    sys.exit(0 if report['valid'] else 1)
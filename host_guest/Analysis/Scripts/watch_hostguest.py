@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+"""Re-run the host-guest analysis every time the submissions change.
+
+The CB8 and GDCC submission directories are polled, and analyze_hostguest.py
+is run again as soon as a submission file is added, changed, or deleted
+with respect to the last complete run. The analysis itself is incremental:
+only the bootstrap statistics, table rows, and correlation plots of the
+affected submissions are recomputed.
+"""
+
+
+# =============================================================================
+# GLOBAL IMPORTS
+# =============================================================================
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+from pkganalysis.submission import (fingerprint_submission_files, read_submission_fingerprints,
+                                    compare_submission_fingerprints)
+from analyze_hostguest import (HOST_GUEST_CB8_SUBMISSIONS_DIR_PATH, HOST_GUEST_GDCC_SUBMISSIONS_DIR_PATH,
+                               SUBMISSIONS_FINGERPRINTS_FILE_PATH)
+
+
+# =============================================================================
+# CONSTANTS
+# =============================================================================
+
+# Seconds between two checks of the submission directories.
+POLLING_INTERVAL = 60
+
+ANALYSIS_SCRIPT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'analyze_hostguest.py')
+
+# The analysis is run from its directory, so its relative paths are resolved from there.
+ANALYSIS_DIR_PATH = os.path.dirname(ANALYSIS_SCRIPT_PATH)
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--interval', type=float, default=POLLING_INTERVAL,
+                        help='Seconds between two checks of the submissions (default: %(default)s).')
+    parser.add_argument('--once', action='store_true',
+                        help='Run the analysis only if the submissions changed, then exit.')
+    args = parser.parse_args()
+
+    directory_paths = [os.path.join(ANALYSIS_DIR_PATH, directory_path) for directory_path in
+                       [HOST_GUEST_CB8_SUBMISSIONS_DIR_PATH, HOST_GUEST_GDCC_SUBMISSIONS_DIR_PATH]]
+    fingerprints_file_path = os.path.join(ANALYSIS_DIR_PATH, SUBMISSIONS_FINGERPRINTS_FILE_PATH)
+    last_fingerprints = None
+    while True:
+        fingerprints = fingerprint_submission_files(directory_paths)
+        # Compare to the last complete run. If the analysis failed, wait for
+        # another change before trying again.
+        if fingerprints != last_fingerprints:
+            changes = compare_submission_fingerprints(
+                read_submission_fingerprints(fingerprints_file_path), fingerprints)
+            if any(len(file_paths) > 0 for file_paths in changes.values()):
+                print('Detected {} new, {} changed, and {} deleted submissions.'.format(
+                    *[len(changes[change]) for change in ['new', 'changed', 'deleted']]))
+                subprocess.run([sys.executable, ANALYSIS_SCRIPT_PATH],
+                               cwd=ANALYSIS_DIR_PATH)
+            last_fingerprints = fingerprints
+
+        if args.once:
+            break
+        time.sleep(args.interval)
@@ -4,9 +4,12 @@
 # GLOBAL IMPORTS
 # =============================================================================
 import os
+import sys
 import glob
 import io
+import logging
 import collections
+import hashlib
 import pickle
 import pandas as pd
 import numpy as np
@@ -16,6 +19,11 @@ import scipy.stats
 from pylab import rcParams
 import math
 
+# The parsing utilities are shared with the pKa analysis in physical_properties/.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from sampl_io import (IgnoredSubmissionError, BadFormatError, UserMap, parse_csv_lines,
+                      load_cached_sections, load_submissions_files, build_prediction_table)
+
 
 
 # =============================================================================
@@ -27,50 +35,314 @@ LOGD_SUBMISSIONS_DIR_PATH = './Submissions'
 EXPERIMENTAL_DATA_FILE_PATH = '../SAMPL8-logD_experimental_values.csv'
 USER_MAP_FILE_PATH = '../SAMPL8-logD-user-map.csv'
 
+# Root seed of the bootstrap random number streams. Each submission gets its
+# own independent stream so that the confidence intervals are reproducible.
+# Set to None to use fresh entropy.
+BOOTSTRAP_SEED = 8
+
+# Number of threads used to parse the submission files concurrently.
+N_LOAD_WORKERS = 4
+
+# Directory where the parsed submission files are cached between runs
+# (None disables the cache). It is in this script's directory so that the
+# cache does not depend on the working directory.
+SUBMISSIONS_CACHE_DIR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'SubmissionsCache')
+
+# Maximum number of bootstrap samples used to compute the statistics.
+N_BOOTSTRAP_SAMPLES = 10000
+
+# If not None, the bootstrap stops as soon as the bounds of the confidence interval
+# of each statistic differ by less than this fraction of its width (e.g., 0.01)
+# from those obtained with half the samples. The convergence is checked every
+# 1000 samples after the first 2000 samples.
+BOOTSTRAP_CI_TOLERANCE = None
+
+# Verbosity of the analysis. 'INFO' reports a summary of each stage, and
+# 'DEBUG' also reports the parsed sections and the tables of each stage.
+LOG_LEVEL = 'INFO'
+
+logger = logging.getLogger(__name__)
+
 # =============================================================================
 # STATS FUNCTIONS
 # =============================================================================
 
+def _split_columns(data):
+    """Split data of shape (..., n_samples, 2) into the x and y arrays."""
+    data = np.asarray(data)
+    return data[..., 0], data[..., 1]
+
+
+def batched_estimator(stats_func):
+    """Decorator marking stats_func as accepting a stack of samples of shape (..., n_samples, 2)."""
+    stats_func.is_batched = True
+    return stats_func
+
+
+def fused_estimator(statistic_name):
+    """Decorator marking stats_func as the statistic_name entry of regression_statistics().
+
+    compute_bootstrap_statistics() evaluates all the fused estimators with a
+    single call to regression_statistics() on a stack of bootstrap samples.
+    """
+    def _fused_estimator(stats_func):
+        stats_func.fused_statistic = statistic_name
+        return stats_func
+    return _fused_estimator
+
+
+def regression_statistics(data):
+    """Compute linear regression and error statistics from shared sufficient statistics.
+
+    data has shape (..., n_samples, 2) and each returned statistic has shape
+    data.shape[:-2]. Slope, intercept, and r_value are equivalent to those of
+    scipy.stats.linregress(x, y).
+    """
+    x, y = _split_columns(data)
+    x_mean = x.mean(axis=-1)
+    y_mean = y.mean(axis=-1)
+    x_centered = x - x_mean[..., np.newaxis]
+    y_centered = y - y_mean[..., np.newaxis]
+    ssxm = (x_centered**2).mean(axis=-1)
+    ssym = (y_centered**2).mean(axis=-1)
+    ssxym = (x_centered * y_centered).mean(axis=-1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = ssxym / ssxm
+        r_value = ssxym / np.sqrt(ssxm * ssym)
+    # Like scipy, handle the degenerate cases and round-off errors.
+    r_value = np.where((ssxm == 0.0) | (ssym == 0.0), 0.0, np.clip(r_value, -1.0, 1.0))
+
+    # The mean squared error is the variance of the errors plus the squared mean error.
+    me = x_mean - y_mean
+    mse = np.maximum(ssxm + ssym - 2*ssxym, 0.0) + me**2
+    return dict(
+        slope=slope,
+        intercept=y_mean - slope*x_mean,
+        r_value=r_value,
+        r2=r_value**2,
+        me=me,
+        mae=np.abs(x - y).mean(axis=-1),
+        rmse=np.sqrt(mse),
+    )
+
+
+@fused_estimator('r2')
 def r2(data):
-    x, y = data.T
-    slope, intercept, r_value, p_value, stderr = scipy.stats.linregress(x, y)
-    return r_value**2
+    return regression_statistics(data)['r2']
 
 
+@fused_estimator('slope')
 def slope(data):
-    x, y = data.T
-    slope, intercept, r_value, p_value, stderr = scipy.stats.linregress(x, y)
-    return slope
+    return regression_statistics(data)['slope']
+
+
+@fused_estimator('intercept')
+def intercept(data):
+    return regression_statistics(data)['intercept']
 
 
+@fused_estimator('me')
 def me(data):
-    x, y = data.T
-    error = np.array(x) - np.array(y)
-    return error.mean()
+    x, y = _split_columns(data)
+    error = x - y
+    return error.mean(axis=-1)
 
 
+@fused_estimator('mae')
 def mae(data):
-    x, y = data.T
-    error = np.abs(np.array(x) - np.array(y))
-    return error.mean()
+    x, y = _split_columns(data)
+    error = np.abs(x - y)
+    return error.mean(axis=-1)
 
 
+@fused_estimator('rmse')
 def rmse(data):
-    x, y = data.T
-    error = np.array(x) - np.array(y)
-    rmse = np.sqrt((error**2).mean())
+    x, y = _split_columns(data)
+    error = x - y
+    rmse = np.sqrt((error**2).mean(axis=-1))
     return rmse
 
+# Above this number of samples, kendall_tau() switches from the O(n^2)
+# pairwise comparisons to the O(n log^2 n) merge-sort algorithm.
+KENDALL_TAU_PAIRWISE_MAX_SAMPLES = 50
+
+
+@batched_estimator
 def kendall_tau(data):
-    x, y = data.T
-    correlation, p_value = scipy.stats.kendalltau(x, y)
-    return correlation
+    """Kendall's tau-b rank correlation coefficient.
+
+    This is equivalent to the correlation returned by scipy.stats.kendalltau()
+    (including the treatment of ties), but it is vectorized over the stack of
+    samples. Small samples are compared pairwise, while larger ones are
+    handled with Knight's merge-sort algorithm.
+    """
+    x, y = _split_columns(data)
+    x = x.astype(float).reshape(-1, x.shape[-1])
+    y = y.astype(float).reshape(-1, y.shape[-1])
+    if x.shape[-1] <= KENDALL_TAU_PAIRWISE_MAX_SAMPLES:
+        correlations = _kendall_tau_pairwise(x, y)
+    else:
+        correlations = _kendall_tau_merge_sort(x, y)
+        # Like scipy, propagate NaNs.
+        correlations[np.isnan(x).any(axis=-1) | np.isnan(y).any(axis=-1)] = np.nan
+    return correlations.reshape(np.shape(data)[:-2])
+
+
+def _kendall_tau_b(concordant_minus_discordant, n_samples, x_ties, y_ties):
+    """Compute tau-b from the pairs counts like scipy.stats.kendalltau()."""
+    n_pairs = n_samples * (n_samples - 1) / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tau = concordant_minus_discordant / np.sqrt(n_pairs - x_ties) / np.sqrt(n_pairs - y_ties)
+    # Scipy returns NaN when all x or y values are tied.
+    tau = np.where((x_ties == n_pairs) | (y_ties == n_pairs), np.nan, tau)
+    return np.clip(tau, -1.0, 1.0)
+
+
+def _kendall_tau_pairwise(x, y, max_block_size=2**21):
+    """Compute tau-b of each row of x and y from the matrices of pairwise signs."""
+    n_stacks, n_samples = x.shape
+    i, j = np.triu_indices(n_samples, k=1)
+    correlations = np.empty(n_stacks)
+    # Process the stacks in blocks to bound the memory of the sign matrices.
+    block_size = max(1, max_block_size // max(1, len(i)))
+    for start in range(0, n_stacks, block_size):
+        x_block, y_block = x[start:start+block_size], y[start:start+block_size]
+        x_signs = np.sign(x_block[:, i] - x_block[:, j])
+        y_signs = np.sign(y_block[:, i] - y_block[:, j])
+        correlations[start:start+block_size] = _kendall_tau_b(
+            (x_signs * y_signs).sum(axis=-1), n_samples,
+            x_ties=(x_signs == 0).sum(axis=-1), y_ties=(y_signs == 0).sum(axis=-1))
+    return correlations
+
+
+def _count_tied_pairs(sorted_values, *other_sorted_values):
+    """Count the pairs of equal entries in each row of the (lexicographically) sorted arrays."""
+    is_tied = sorted_values[:, 1:] == sorted_values[:, :-1]
+    for values in other_sorted_values:
+        is_tied &= values[:, 1:] == values[:, :-1]
+    # Each element forms a tied pair with every previous element of its run.
+    n_samples = sorted_values.shape[1]
+    indices = np.broadcast_to(np.arange(1, n_samples), is_tied.shape)
+    run_starts = np.maximum.accumulate(np.where(is_tied, 0, indices), axis=1)
+    return np.where(is_tied, indices - run_starts, 0).sum(axis=1)
+
+
+def _dense_ranks(values):
+    """Return the dense rank of the entries of each row of values."""
+    order = np.argsort(values, axis=1, kind='stable')
+    sorted_values = np.take_along_axis(values, order, axis=1)
+    sorted_ranks = np.concatenate([np.zeros((len(values), 1), dtype=int),
+                                   np.cumsum(sorted_values[:, 1:] != sorted_values[:, :-1], axis=1)], axis=1)
+    ranks = np.empty_like(sorted_ranks)
+    np.put_along_axis(ranks, order, sorted_ranks, axis=1)
+    return ranks
+
+
+def _count_inversions(ranks):
+    """Count the pairs i < j such that ranks[i] > ranks[j] in each row with a bottom-up merge sort.
+
+    At each level, the pairs of consecutive sorted runs of all rows are tagged
+    with increasing group ids so that they can be searched and merged at once
+    as a single flat sorted array.
+    """
+    n_stacks, n_samples = ranks.shape
+    positions = np.arange(n_samples)
+    inversions = np.zeros(n_stacks, dtype=np.int64)
+    runs = ranks
+    width = 1
+    while width < n_samples:
+        n_groups_per_stack = -(-n_samples // (2*width))
+        group_ids = np.arange(n_stacks)[:, np.newaxis] * n_groups_per_stack + positions // (2*width)
+        keys = group_ids * n_samples + runs
+        is_right = (positions // width) % 2 == 1
+        # The left runs are sorted and the group ids increasing so left_keys is sorted.
+        left_keys = keys[:, ~is_right].ravel()
+        right_keys, right_group_ids = keys[:, is_right], group_ids[:, is_right]
+        # For each element of a right run, count the greater elements in the left run.
+        n_left_greater = (np.searchsorted(left_keys, (right_group_ids + 1) * n_samples, side='left') -
+                          np.searchsorted(left_keys, right_keys, side='right'))
+        inversions += n_left_greater.sum(axis=1)
+        # Merge the pairs of runs.
+        runs = np.sort(keys, axis=None, kind='stable').reshape(n_stacks, n_samples) - group_ids * n_samples
+        width *= 2
+    return inversions
+
+
+def _kendall_tau_merge_sort(x, y):
+    """Compute tau-b of each row of x and y with Knight's O(n log n) algorithm."""
+    n_samples = x.shape[1]
+    # Sort by x and then by y.
+    order = np.lexsort((y, x), axis=-1)
+    x_sorted = np.take_along_axis(x, order, axis=1)
+    y_sorted = np.take_along_axis(y, order, axis=1)
+
+    # The discordant pairs are the inversions of y after sorting by x.
+    discordant = _count_inversions(_dense_ranks(y_sorted))
+
+    x_ties = _count_tied_pairs(x_sorted)
+    y_ties = _count_tied_pairs(np.sort(y, axis=1))
+    xy_ties = _count_tied_pairs(x_sorted, y_sorted)
+    n_pairs = n_samples * (n_samples - 1) // 2
+    concordant_minus_discordant = n_pairs - x_ties - y_ties + xy_ties - 2*discordant
+    return _kendall_tau_b(concordant_minus_discordant, n_samples, x_ties, y_ties)
 
 
-def compute_bootstrap_statistics(samples, stats_funcs, percentile=0.95, n_bootstrap_samples=1000):
-    """Compute bootstrap confidence interval for the given statistics functions."""
+# =============================================================================
+# RANDOM NUMBER GENERATION
+# =============================================================================
+
+def _stream_key_to_int(key):
+    """Convert a stream key into a non-negative integer that is stable across runs."""
+    if isinstance(key, (int, np.integer)) and key >= 0:
+        return int(key)
+    # Python's hash() is salted for strings so we use a cryptographic hash.
+    digest = hashlib.sha256(str(key).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], byteorder='little')
+
+
+def bootstrap_random_state(seed, *keys):
+    """Create an independent Philox random number generator from a root seed and a key path.
+
+    The same seed and keys (e.g., submission file name and statistic) always
+    produce the same stream, and different keys produce independent streams.
+    """
+    spawn_key = tuple(_stream_key_to_int(key) for key in keys)
+    seed_sequence = np.random.SeedSequence(entropy=seed, spawn_key=spawn_key)
+    return np.random.Generator(np.random.Philox(seed_sequence))
+
+
+def check_random_state(random_state=None):
+    """Return a numpy.random.Generator from None (fresh entropy), an integer seed, or a Generator."""
+    if random_state is None:
+        return np.random.default_rng()
+    if isinstance(random_state, np.random.Generator):
+        return random_state
+    return bootstrap_random_state(random_state)
+
+
+# =============================================================================
+# BOOTSTRAP
+# =============================================================================
+
+def compute_bootstrap_statistics(samples, stats_funcs, percentile=0.95, n_bootstrap_samples=1000,
+                                 random_state=None, ci_tolerance=None, chunk_size=1000, min_bootstrap_samples=2000):
+    """Compute bootstrap confidence interval for the given statistics functions.
+
+    If ci_tolerance is given, the convergence of the confidence intervals is
+    checked every chunk_size bootstrap samples once min_bootstrap_samples have
+    been generated, and the bootstrap stops when the bounds of each statistic
+    differ by less than ci_tolerance times the width of its interval from those
+    obtained with half the bootstrap samples. The
+    number of bootstrap samples actually used is len(bootstrap_samples).
+
+    The fused estimators (see fused_estimator()) are computed at once for all
+    the bootstrap samples of a chunk with a single regression_statistics() call,
+    and the batched estimators (see batched_estimator()) are called once per chunk.
+    """
     # Handle case where only a single function is passed.
     #print("SAMPLES:\n", samples)
+    random_state = check_random_state(random_state)
 
     try:
         len(stats_funcs)
@@ -82,23 +354,78 @@ def compute_bootstrap_statistics(samples, stats_funcs, percentile=0.95, n_bootst
 
     # Generate bootstrap statistics.
     bootstrap_samples_statistics = np.zeros((len(statistics), n_bootstrap_samples))
-    for bootstrap_sample_idx in range(n_bootstrap_samples):
-        samples_indices = np.random.randint(low=0, high=len(samples), size=len(samples))
+    confidence_intervals_history = []
+    for chunk_start in range(0, n_bootstrap_samples, chunk_size):
+        n_generated_samples = min(chunk_start + chunk_size, n_bootstrap_samples)
+        samples_indices = random_state.integers(low=0, high=len(samples),
+                                                size=(n_generated_samples - chunk_start, len(samples)))
+        bootstrap_samples = samples[samples_indices]
+
+        fused_statistics = None
         for stats_func_idx, stats_func in enumerate(stats_funcs):
-            bootstrap_samples_statistics[stats_func_idx][bootstrap_sample_idx] = stats_func(samples[samples_indices])
+            fused_statistic = getattr(stats_func, 'fused_statistic', None)
+            if fused_statistic is not None:
+                if fused_statistics is None:
+                    fused_statistics = regression_statistics(bootstrap_samples)
+                bootstrap_samples_statistics[stats_func_idx][chunk_start:n_generated_samples] = fused_statistics[fused_statistic]
+            elif getattr(stats_func, 'is_batched', False):
+                bootstrap_samples_statistics[stats_func_idx][chunk_start:n_generated_samples] = stats_func(bootstrap_samples)
+            else:
+                for bootstrap_sample_idx, bootstrap_sample in enumerate(bootstrap_samples):
+                    bootstrap_samples_statistics[stats_func_idx][chunk_start + bootstrap_sample_idx] = stats_func(bootstrap_sample)
+
+        # Adaptive bootstrap: stop when the confidence intervals have converged.
+        if ci_tolerance is not None:
+            confidence_intervals = np.array([
+                _sorted_confidence_interval(np.sort(samples_statistics[:n_generated_samples]), percentile)
+                for samples_statistics in bootstrap_samples_statistics])
+            if (n_generated_samples >= min_bootstrap_samples and
+                    _has_converged(confidence_intervals_history, n_generated_samples,
+                                   confidence_intervals, ci_tolerance)):
+                bootstrap_samples_statistics = bootstrap_samples_statistics[:, :n_generated_samples]
+                break
+            confidence_intervals_history.append((n_generated_samples, confidence_intervals))
 
     # Compute confidence intervals.
-    percentile_index = int(np.floor(n_bootstrap_samples * (1 - percentile) / 2)) - 1
     bootstrap_statistics = []
     for stats_func_idx, samples_statistics in enumerate(bootstrap_samples_statistics):
         samples_statistics.sort()
-        stat_lower_percentile = samples_statistics[percentile_index]
-        stat_higher_percentile = samples_statistics[-percentile_index+1]
-        confidence_interval = (stat_lower_percentile, stat_higher_percentile)
+        confidence_interval = _sorted_confidence_interval(samples_statistics, percentile)
         bootstrap_statistics.append([statistics[stats_func_idx], confidence_interval, samples_statistics])
 
     return bootstrap_statistics
 
+
+def _sorted_confidence_interval(sorted_samples_statistics, percentile):
+    """Return the percentile confidence interval from the sorted bootstrap statistics.
+
+    The bounds are the order statistics at the same distance from both ends.
+    With few bootstrap samples, the interval is at most their range.
+    """
+    n_bootstrap_samples = len(sorted_samples_statistics)
+    percentile_index = int(np.floor(n_bootstrap_samples * (1 - percentile) / 2)) - 1
+    percentile_index = min(max(percentile_index, 0), (n_bootstrap_samples - 1) // 2)
+    stat_lower_percentile = sorted_samples_statistics[percentile_index]
+    stat_higher_percentile = sorted_samples_statistics[n_bootstrap_samples - 1 - percentile_index]
+    return stat_lower_percentile, stat_higher_percentile
+
+
+def _has_converged(confidence_intervals_history, n_samples, confidence_intervals, ci_tolerance):
+    """Check if the confidence intervals changed by less than ci_tolerance times their width.
+
+    The comparison is with the most recent (n_samples, intervals) entry of
+    confidence_intervals_history computed with at most half the samples.
+    """
+    previous_confidence_intervals = None
+    for n_previous_samples, intervals in confidence_intervals_history:
+        if 2 * n_previous_samples <= n_samples:
+            previous_confidence_intervals = intervals
+    if previous_confidence_intervals is None:
+        return False
+    widths = confidence_intervals[:, 1] - confidence_intervals[:, 0]
+    changes = np.abs(confidence_intervals - previous_confidence_intervals)
+    return bool(np.all(changes <= ci_tolerance * widths[:, np.newaxis]))
+
 # =============================================================================
 # STATS FUNCTIONS FOR QQ-PLOT AND ERROR SLOPE CALCULATION
 #
@@ -180,9 +507,11 @@ def fracfound_vs_error(calc, expt, dcalc, dexpt, integral_range, integral):
 
 
 # Copied from David L. Mobley's scripts written for SAMPL4 analysis (added calculation uncertainty)
-def bootstrap_exptnoise(calc1, expt1, exptunc1, returnunc=False):
+def bootstrap_exptnoise(calc1, expt1, exptunc1, returnunc=False, random_state=None):
     """Take two datasets (equal length) of calculated and experimental values. Construct new datasets of equal length by picking, with replacement, a set of indices to use from both sets. Return the two new datasets. To take into account experimental uncertainties, random noise is added to the experimental set, distributed according to gaussians with variance taken from the experimental uncertainties. Approach suggested by J. Chodera.
-Optionally, 'returnunc = True', which returns a third value -- experimental uncertainties corresponding to the data points actually used."""
+Optionally, 'returnunc = True', which returns a third value -- experimental uncertainties corresponding to the data points actually used.
+Optionally, 'random_state' is the numpy.random.Generator (or seed) used to draw indices and noise."""
+    random_state = check_random_state(random_state)
 
     # Make everything an array just in case
     calc = np.array(calc1)
@@ -191,8 +520,8 @@ Optionally, 'returnunc = True', which returns a third value -- experimental unce
     npoints = len(calc)
 
     # Pick random datapoint indices
-    idx = np.random.randint(0, npoints,
-                            npoints)  # Create an array consisting of npoints indices, where each index runs from 0 up to npoints.
+    idx = random_state.integers(0, npoints,
+                                npoints)  # Create an array consisting of npoints indices, where each index runs from 0 up to npoints.
 
     # Construct initial new datasets
     newcalc = calc[idx]
@@ -200,8 +529,8 @@ Optionally, 'returnunc = True', which returns a third value -- experimental unce
     newuncExp = exptunc[idx]
 
     # Add noise to experimental set
-    noise = np.random.normal(0.,
-                             exptunc)  # For each data point, draw a random number from a normal distribution centered at 0, with standard devaitions given by exptunc
+    noise = random_state.normal(0.,
+                                exptunc)  # For each data point, draw a random number from a normal distribution centered at 0, with standard devaitions given by exptunc
     newexpt += noise
 
     if not returnunc:
@@ -210,7 +539,7 @@ Optionally, 'returnunc = True', which returns a third value -- experimental unce
         return newcalc, newexpt, newuncExp
 
 # Modified from  David L. Mobley's scripts written for SAMPL4 analysis (added bootstrapped values to the list of returned values )
-def getQQdata(calc, expt, dcalc, dexpt, boot_its):
+def getQQdata(calc, expt, dcalc, dexpt, boot_its, random_state=None):
     """
     Takes calculated and experimental values and their uncertainties
     Parameters
@@ -225,7 +554,9 @@ def getQQdata(calc, expt, dcalc, dexpt, boot_its):
     Y: array of y axis values for QQ-plot
     slope: Error Slope (ES) of line fit to QQ-plot
     slopes: Erros Slope (ES) of line fit to QQ-plot of bootstrapped datapoints
+    random_state: numpy.random.Generator or seed used for the bootstrap (optional)
     """
+    random_state = check_random_state(random_state)
     integral_range, integral = compute_range_table()
     X, Y = fracfound_vs_error(calc, expt, dcalc, dexpt, integral_range, integral)
     xtemp = X[:, np.newaxis]
@@ -233,7 +564,8 @@ def getQQdata(calc, expt, dcalc, dexpt, boot_its):
     slope = coeff[0]
     slopes = []
     for it in range(boot_its):
-        n_calc, n_expt, n_dexpt = bootstrap_exptnoise(calc, expt, dexpt, returnunc=True)
+        n_calc, n_expt, n_dexpt = bootstrap_exptnoise(calc, expt, dexpt, returnunc=True,
+                                                           random_state=random_state)
         nX, nY = fracfound_vs_error(n_calc, n_expt, dcalc, n_dexpt, integral_range, integral)
         a, _, _, _ = np.linalg.lstsq(xtemp, nY,rcond=-1)
         slopes.append(a[0])
@@ -569,22 +901,18 @@ def name_to_filename(id):
 # UTILITY CLASSES
 # =============================================================================
 
-class IgnoredSubmissionError(Exception):
-    """Exception used to signal a submission that must be ignored."""
-    pass
-
-
-class BadFormatError(Exception):
-    """Exception used to signal a submission with unexpected formatting."""
-    pass
-
-
 class SamplSubmission:
     """A generic SAMPL submission.
     Parameters
     ----------
     file_path : str
         The path to the submission file.
+    user_map : UserMap or pandas.DataFrame or None
+        The map used to assign the submission ID (sid). A DataFrame is
+        indexed on the fly, so pass a UserMap when loading many submissions.
+    lazy : bool, optional
+        If True, only the metadata sections are parsed, and the predictions
+        are parsed when self.data is first accessed (see _build_data()).
     Raises
     ------
     IgnoredSubmission
@@ -600,13 +928,37 @@ class SamplSubmission:
     # Sections in CSV format with columns names.
     CSV_SECTIONS = {}
 
-    def __init__(self, file_path, user_map):
+    # Columns of the predicted quantities in the prediction table (see
+    # sampl_io.build_prediction_table()): quantity -> (value, SEM, model uncertainty).
+    PREDICTION_QUANTITIES = {}
+
+    # Other columns of the predictions carried in the prediction table: table column -> data column.
+    PREDICTION_SYSTEM_COLUMNS = {}
+
+    # Directory where the parsed sections are cached (None disables the cache).
+    SECTIONS_CACHE_DIR_PATH = None
+
+    def __init__(self, file_path, user_map, lazy=False):
         file_name = os.path.splitext(os.path.basename(file_path))[0]
         file_data = file_name.split('-')
 
+        # Store user map information. Files without a unique entry have no submission ID.
+        sid_file_name = os.path.basename(file_path)
+        if user_map is not None and not isinstance(user_map, UserMap):
+            user_map = UserMap(user_map)
+        if (user_map is not None and sid_file_name in user_map and
+                sid_file_name not in user_map.duplicated_file_names):
+            self.sid = user_map.get_sid(sid_file_name)
+        else:
+            self.sid = None
+
+        # The predictions are built by _build_data() when first accessed.
+        self._file_path = file_path
+        self._data = None
+
         # Load predictions.
-        sections = self._load_sections(file_path)  # From parent-class.
-        print(sections)
+        sections = self._load_sections(file_path, metadata_only=lazy)  # From parent-class.
+        logger.debug('Sections of %s: %s', file_path, sections)
         #self.data = sections['Predictions']  # This is a list
         #self.data = pd.DataFrame(data=self.data) # Now a DataFrame
         #self.name = sections['Name'][0] #want this to take the place of the 5 letter code
@@ -618,23 +970,63 @@ class SamplSubmission:
         self.reference_submission = False
         #if self.method_name in self.REF_SUBMISSIONS:
         if "REF" in self.method_name or "NULL" in self.method_name:
-            print("REF found: ", self.method_name)
+            logger.debug('Reference submission found: %s', self.method_name)
             self.reference_submission = True
 
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = self._build_data(self._load_sections(self._file_path))
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+
+    def _build_data(self, sections):
+        """Build the predictions from the sections parsed with _load_sections()."""
+        raise NotImplementedError('{} does not support lazy loading.'.format(self.__class__.__name__))
+
+    def _get_quantity_data(self, quantity):
+        """Return the DataFrame holding the predictions of the quantity."""
+        return self.data
+
+    def _get_prediction_metadata(self):
+        """Return the metadata repeated on each row of the prediction table."""
+        return {'sid': self.sid}
+
     @classmethod
     def _read_lines(cls, file_path):
-        """Generator to read the file and discard blank lines and comments."""
+        """Generator to read the file and discard blank lines and comments.
+
+        The file is read with a single call and split in memory.
+        """
         with open(file_path, 'r', encoding='utf-8-sig') as f:
-            for line in f:
-                # Strip whitespaces.
-                line = line.strip()
-                # Don't return blank lines and comments.
-                if line != '' and line[0] != '#':
-                    yield line
+            content = f.read()
+        for line in content.splitlines():
+            # Strip whitespaces.
+            line = line.strip()
+            # Don't return blank lines and comments.
+            if line != '' and line[0] != '#':
+                yield line
 
     @classmethod
-    def _load_sections(cls, file_path):
-        """Load the data in the file and separate it by sections."""
+    def _load_sections(cls, file_path, metadata_only=False):
+        """Load the data in the file and separate it by sections.
+
+        If SECTIONS_CACHE_DIR_PATH is set, the parsed sections are cached on disk
+        (see sampl_io.load_cached_sections()). If metadata_only is True, the CSV
+        sections may be omitted.
+        """
+        return load_cached_sections(cls, file_path, metadata_only)
+
+    @classmethod
+    def _parse_sections(cls, file_path, metadata_only=False):
+        """Parse the file and separate the data by sections.
+
+        If metadata_only is True, the CSV sections are not parsed and are
+        not included in the returned sections.
+        """
         #print("file_path",file_path)
         sections = {}
         current_section = None
@@ -659,14 +1051,15 @@ class SamplSubmission:
         # Create a Pandas dataframe from the CSV format.
         for section_name in cls.CSV_SECTIONS:
             #print(section_name)
-            csv_str = io.StringIO('\n'.join(sections[section_name]))
+            if metadata_only:
+                del sections[section_name]
+                continue
             columns = cls.CSV_SECTIONS[section_name]
             #print(columns)
             id_column = columns[0]
             #print(id_column)
             #print("trying", sections)
-            section = pd.read_csv(csv_str, index_col=id_column, names=columns, skipinitialspace=True)
-            #section = pd.read_csv(csv_str, names=columns, skipinitialspace=True)
+            section = parse_csv_lines(sections[section_name], names=columns, index_col=id_column)
             sections[section_name] = section
         return sections
 
@@ -697,6 +1090,9 @@ class logDSubmission(SamplSubmission):
     ----------
     file_path : str
         The path to the submission file
+    lazy : bool, optional
+        If True, the predictions are parsed only when self.data is first
+        accessed. Default is False.
     Raises
     ------
     IgnoredSubmission
@@ -729,6 +1125,11 @@ class logDSubmission(SamplSubmission):
                     "TBME-water predictions": ("Molecule ID", "ID tag", "logD mean", "logD SEM", "logD model uncertainty"),
                     "Cyclohexane-DMF predictions": ("Molecule ID", "ID tag", "logD mean", "logD SEM", "logD model uncertainty")}
 
+    PREDICTION_QUANTITIES = {section_name: ("logD mean", "logD SEM", "logD model uncertainty")
+                             for section_name in CSV_SECTIONS}
+
+    SECTIONS_CACHE_DIR_PATH = SUBMISSIONS_CACHE_DIR_PATH
+
     #CSV_SECTIONS = {"Octanol-water predictions": {'names': ("Molecule ID", "ID tag", "logD mean", "logD SEM", "logD model uncertainty"),
     #                    'index_col': "Molecule ID"},
     #                "Cyclohexane-water predictions": {'names': ("Molecule ID", "ID tag", "logD mean", "logD SEM", "logD model uncertainty"),
@@ -745,24 +1146,18 @@ class logDSubmission(SamplSubmission):
     #                    'index_col': "Molecule ID"},
     #                }
 
-    def __init__(self, file_path, user_map):
-        super().__init__(file_path, user_map)
+    def __init__(self, file_path, user_map, lazy=False):
+        super().__init__(file_path, user_map, lazy=lazy)
 
         file_name = os.path.splitext(os.path.basename(file_path))[0]
         file_data = file_name.split('-')
-        print(file_name)
-
-
-        # Load predictions for all different solvent systems
-        self.data = {}
-        sections = self._load_sections(file_path)  # From parent-class.
-        self.data['Octanol-water predictions'] = sections['Octanol-water predictions']  # This is a pandas DataFrame.
-        self.data['Cyclohexane-water predictions'] = sections['Cyclohexane-water predictions']  # This is a pandas DataFrame.
-        self.data['Ethyl acetate-water predictions'] = sections['Ethyl acetate-water predictions']  # This is a pandas DataFrame.
-        self.data['Heptane-water predictions'] = sections['Heptane-water predictions']  # This is a pandas DataFrame.
-        self.data['MEK-water predictions'] = sections['MEK-water predictions']  # This is a pandas DataFrame.
-        self.data['TBME-water predictions'] = sections['TBME-water predictions']  # This is a pandas DataFrame.
-        self.data['Cyclohexane-DMF predictions'] = sections['Cyclohexane-DMF predictions']  # This is a pandas DataFrame.
+        logger.debug('Loading submission %s', file_name)
+
+
+        # Load predictions for all different solvent systems. In lazy mode, only the metadata is parsed now.
+        sections = self._load_sections(file_path, metadata_only=lazy)  # From parent-class.
+        if not lazy:
+            self.data = self._build_data(sections)
         #self.participant = sections['Participant name'][0].strip()
         self.method_name = sections['Name'][0]
         self.category = sections['Category'][0] # New section for logD challenge.
@@ -774,24 +1169,47 @@ class logDSubmission(SamplSubmission):
         if "REF" in self.method_name or "NULL" in self.method_name:
             self.reference_submission = True
 
-
-
-
-    def compute_logD_statistics(self, predicted_data, experimental_data, stats_funcs):
+    def _build_data(self, sections):
+        data = {}
+        data['Octanol-water predictions'] = sections['Octanol-water predictions']  # This is a pandas DataFrame.
+        data['Cyclohexane-water predictions'] = sections['Cyclohexane-water predictions']  # This is a pandas DataFrame.
+        data['Ethyl acetate-water predictions'] = sections['Ethyl acetate-water predictions']  # This is a pandas DataFrame.
+        data['Heptane-water predictions'] = sections['Heptane-water predictions']  # This is a pandas DataFrame.
+        data['MEK-water predictions'] = sections['MEK-water predictions']  # This is a pandas DataFrame.
+        data['TBME-water predictions'] = sections['TBME-water predictions']  # This is a pandas DataFrame.
+        data['Cyclohexane-DMF predictions'] = sections['Cyclohexane-DMF predictions']  # This is a pandas DataFrame.
+        return data
+
+    def _get_quantity_data(self, quantity):
+        return self.data[quantity]
+
+    def _get_prediction_metadata(self):
+        return {
+            'sid': self.sid,
+            'method': self.method_name,
+            'category': self.category,
+            'ranked': self.ranked,
+            'reference_submission': self.reference_submission,
+        }
+
+    def compute_logD_statistics(self, predicted_data, experimental_data, stats_funcs, random_state=None,
+                                n_bootstrap_samples=N_BOOTSTRAP_SAMPLES, ci_tolerance=BOOTSTRAP_CI_TOLERANCE):
         data = self._create_comparison_dataframe('logD mean', predicted_data, experimental_data)
 
         # Create lists of stats functions to pass to compute_bootstrap_statistics.
         stats_funcs_names, stats_funcs = zip(*stats_funcs.items())
         #bootstrap_statistics = compute_bootstrap_statistics(data.as_matrix(), stats_funcs, n_bootstrap_samples=10000) #10000
 
-        bootstrap_statistics = compute_bootstrap_statistics(data.to_numpy(), stats_funcs, n_bootstrap_samples=10000)
+        bootstrap_statistics = compute_bootstrap_statistics(data.to_numpy(), stats_funcs,
+                                                            n_bootstrap_samples=n_bootstrap_samples,
+                                                            random_state=random_state, ci_tolerance=ci_tolerance)
 
         # Return statistics as dict preserving the order.
         return collections.OrderedDict((stats_funcs_names[i],
                                         bootstrap_statistics[i])
                                         for i in range(len(stats_funcs)))
 
-    def compute_logD_model_uncertainty_statistics(self,predicted_data,experimental_data):
+    def compute_logD_model_uncertainty_statistics(self,predicted_data,experimental_data, random_state=None):
 
         # Create a dataframe for data necessary for error slope analysis
         expt_logD_series = experimental_data["logD mean"]
@@ -818,7 +1236,8 @@ class logDSubmission(SamplSubmission):
         dexpt = data_mod_unc.loc[:, "logD SEM (expt)"].values
         n_bootstrap_samples = 1000 #1000
 
-        X, Y, error_slope, error_slope_std, slopes = getQQdata(calc, expt, dcalc, dexpt, boot_its=n_bootstrap_samples)
+        X, Y, error_slope, error_slope_std, slopes = getQQdata(calc, expt, dcalc, dexpt, boot_its=n_bootstrap_samples,
+                                                                random_state=random_state)
 
         QQplot_data = [X, Y, error_slope]
 
@@ -844,41 +1263,67 @@ class logDSubmission(SamplSubmission):
 # =============================================================================
 
 
-def load_submissions(directory_path, user_map):
+def build_group_index(values):
+    """Find the rows of each group in a column of identifiers.
+
+    The identifiers are factorized once (for categoricals, only their integer
+    codes are used), and the row positions are grouped with a stable sort so
+    that selecting a group is a gather of its rows rather than a comparison
+    over the whole column. Missing identifiers are not assigned to any group.
+
+    Returns
+    -------
+    group_index : collections.OrderedDict
+        group -> numpy.ndarray with the (sorted) positions of the rows of
+        the group. The groups are in order of first appearance.
+    """
+    codes, groups = pd.factorize(values)
+    is_assigned = codes >= 0
+    order = np.flatnonzero(is_assigned)[np.argsort(codes[is_assigned], kind='stable')]
+    boundaries = np.cumsum(np.bincount(codes[is_assigned], minlength=len(groups)))[:-1]
+    return collections.OrderedDict(zip(groups, np.split(order, boundaries)))
+
+
+def load_submissions(directory_path, user_map, n_workers=1, use_processes=False, lazy=False):
     """Load submissions from a specified directory using a specified user map.
     Optional argument:
         ref_ids: List specifying submission IDs (alphanumeric, typically) of
         reference submissions which are to be ignored/analyzed separately.
+    If n_workers is greater than 1, the files are parsed concurrently in a
+    pool of threads (or processes if use_processes is True). Submissions
+    raising IgnoredSubmissionError are skipped, and other errors (e.g.,
+    BadFormatError) are raised for the first offending file as in the serial
+    loader.
+    If lazy is True, only the metadata is parsed up front, and the
+    predictions are parsed when first accessed.
     Returns: submissions
     """
-    submissions = []
-    for file_path in glob.glob(os.path.join(directory_path, '*.csv')):
-        try:
-            submission = logDSubmission(file_path, user_map)
-
-        except IgnoredSubmissionError:
-            continue
-        submissions.append(submission)
-    print(submissions)
+    submissions = load_submissions_files(logDSubmission, glob.glob(os.path.join(directory_path, '*.csv')),
+                                         user_map, n_workers, use_processes, lazy=lazy)
+    logger.info('Loaded %d submissions from %s', len(submissions), directory_path)
     return submissions
 
 
 
-def load_ranked_submissions(directory_path, user_map):
+def load_ranked_submissions(directory_path, user_map, n_workers=1, use_processes=False):
     """
     Load submissions from a specified directory using a specified user map.
     Optional argument:
         ref_ids: List specifying submission IDs (alphanumeric, typically) of
         reference submissions which are to be ignored/analyzed separately.
+    If n_workers is greater than 1, the files are parsed concurrently in a
+    pool of threads (or processes if use_processes is True). Submissions
+    raising IgnoredSubmissionError are skipped, and other errors (e.g.,
+    BadFormatError) are raised for the first offending file as in the serial
+    loader.
+    Only the metadata is parsed to select the ranked submissions, and their
+    predictions are parsed when first accessed.
     Returns: submissions
     """
     submissions = []
 
-    for file_path in glob.glob(os.path.join(directory_path, '*.csv')):
-        try:
-            submission = logDSubmission(file_path, user_map)
-        except IgnoredSubmissionError:
-            continue
+    for submission in load_submissions_files(logDSubmission, glob.glob(os.path.join(directory_path, '*.csv')),
+                                             user_map, n_workers, use_processes, lazy=True):
         # only continue if submission is ranked
         if not submission.ranked:
             continue
@@ -890,7 +1335,8 @@ def load_ranked_submissions(directory_path, user_map):
     method_names = []
     for submission in submissions:
         method_names.append(submission.method_name)
-    print("Ranked submissions: \n", method_names)
+    logger.info('Loaded %d ranked submissions from %s', len(submissions), directory_path)
+    logger.debug('Ranked submissions: %s', method_names)
 
     return submissions
 
@@ -904,65 +1350,66 @@ class logDSubmissionCollection:
     LOGP_CORRELATION_PLOT_BY_LOGP_PATH_DIR = 'error_for_each_logD.pdf'
     ABSOLUTE_ERROR_VS_LOGP_PLOT_PATH_DIR = 'AbsoluteErrorPlots'
 
+    # Columns of self.data stored as categoricals.
+    IDENTIFIER_COLUMNS = ['method_name', 'category']
+
 
     def __init__(self, submissions, experimental_data, output_directory_path, logD_submission_collection_file_path,
-    ignore_refcalcs = True, ranked_only = True, allow_multiple = True):
+    ignore_refcalcs = True, ranked_only = True, allow_multiple = True, section_name = 'Octanol-water predictions'):
         # Build collection dataframe from the beginning.
-        # Build full logD collection table.
+        # Build full logD collection table from the predictions of the
+        # solvent system section_name in the prediction table.
+        prediction_table = build_prediction_table(submissions)
+        prediction_table = prediction_table[prediction_table['quantity'] == section_name]
 
-        data = []
+        if ignore_refcalcs:
+            prediction_table = prediction_table[~prediction_table['reference_submission']]
+        if ranked_only:
+            prediction_table = prediction_table[prediction_table['ranked']]
 
         # Participant names we've found so far; tracked to ensure no one has more than one
         # ranked submission
         self.method_names_ranked = []
 
-        # Submissions for logD.
-        for submission in submissions:
-            if submission.reference_submission and ignore_refcalcs:
-                continue
-
-            if ranked_only and not submission.ranked:
-                continue
-            # Store names associated with ranked submission, skip if they submitted multiple (only if we need to check for duplicate authors)
-            if submission.ranked and not allow_multiple:
-                if not submission.method_name in self.method_names_ranked:
-                    self.method_names_ranked.append(submission.method_name)
-                else:
-                    print(f"Error: {submission.method_name} submitted multiple ranked submissions.")
-                    continue
-
-
-            for mol_ID, series in submission.data.iterrows():
-                logD_mean_exp = experimental_data.loc[mol_ID, 'logD mean']
-                logD_SEM_exp = experimental_data.loc[mol_ID, 'logD SEM']
-
-                logD_mean_pred = submission.data.loc[mol_ID, "logD mean"]
-                logD_SEM_pred = submission.data.loc[mol_ID, "logD SEM"]
-                print("logD_mean_pred \n",logD_mean_pred)
-
-                logD_model_uncertainty =  submission.data.loc[mol_ID, "logD model uncertainty"]
-                ranked = submission.ranked
-
-                data.append({
-                    'method_name': submission.method_name,
-                    #'participant': submission.participant,
-                    #'file name': submission.file_name,
-                    'category': submission.category,
-                    'Molecule ID': mol_ID,
-                    'logD (calc)': logD_mean_pred,
-                    'logD SEM (calc)': logD_SEM_pred,
-                    'logD (exp)': logD_mean_exp,
-                    'logD SEM (exp)': logD_SEM_exp,
-                    '$\Delta$logD error (calc - exp)': logD_mean_pred - logD_mean_exp,
-                    'logD model uncertainty': logD_model_uncertainty
-                })
-
-        # Transform into Pandas DataFrame.
+        # Skip the later ranked submissions of the same method (only if we need to check for duplicate authors).
+        if not allow_multiple:
+            ranked_submissions = prediction_table.loc[prediction_table['ranked'], ['submission_index', 'method']]
+            ranked_submissions = ranked_submissions.drop_duplicates('submission_index')
+            is_duplicated = ranked_submissions['method'].duplicated().to_numpy()
+            self.method_names_ranked = list(ranked_submissions['method'][~is_duplicated])
+            for method_name in ranked_submissions['method'][is_duplicated]:
+                logger.error('%s submitted multiple ranked submissions.', method_name)
+            duplicated_indices = ranked_submissions['submission_index'][is_duplicated]
+            prediction_table = prediction_table[~prediction_table['submission_index'].isin(duplicated_indices)]
+
+        # Join the experimental data on the molecule IDs.
+        mol_IDs = prediction_table['system_id'].to_numpy(dtype=object)
+        logD_mean_exp = experimental_data.loc[mol_IDs, 'logD mean'].to_numpy()
+        logD_SEM_exp = experimental_data.loc[mol_IDs, 'logD SEM'].to_numpy()
+        logD_mean_pred = prediction_table['value'].to_numpy()
+
+        data = collections.OrderedDict([
+            ('method_name', prediction_table['method'].to_numpy(dtype=object)),
+            ('category', prediction_table['category'].to_numpy(dtype=object)),
+            ('Molecule ID', mol_IDs),
+            ('logD (calc)', logD_mean_pred),
+            ('logD SEM (calc)', prediction_table['sem'].to_numpy()),
+            ('logD (exp)', logD_mean_exp),
+            ('logD SEM (exp)', logD_SEM_exp),
+            ('$\Delta$logD error (calc - exp)', logD_mean_pred - logD_mean_exp),
+            ('logD model uncertainty', prediction_table['model_uncertainty'].to_numpy())
+        ])
+
+        # Transform into Pandas DataFrame. The identifier columns are stored as categoricals.
         self.data = pd.DataFrame(data=data)
+        for column in self.IDENTIFIER_COLUMNS:
+            if column in self.data:
+                self.data[column] = self.data[column].astype('category')
         self.output_directory_path = output_directory_path
 
-        print("\n SubmissionCollection: \n")
-        print(self.data)
+        logger.info('Collected %d predictions of %d methods', len(self.data),
+                    self.data.method_name.nunique() if len(self.data) > 0 else 0)
+        logger.debug('Submission collection:\n%s', self.data)
 
         # Create general output directory.
         os.makedirs(self.output_directory_path, exist_ok=True)
@@ -975,15 +1422,14 @@ class logDSubmissionCollection:
         output_dir_path = os.path.join(self.output_directory_path,
                                        self.LOGP_CORRELATION_PLOT_BY_METHOD_PATH_DIR)
         os.makedirs(output_dir_path, exist_ok=True)
-        print("self.data \n",self.data)
-        print(print("self.data.method_name\n",self.data.method_name))
-        for method_name in self.data.method_name.unique():
+        logger.info('Generating logD correlation plots in %s', output_dir_path)
+        for method_name, rows in build_group_index(self.data.method_name).items():
             # Skip NULL0 submission
             if "NULL" in method_name:
                 continue
 
-            data = self.data[self.data.method_name == method_name]
-            print("data \n",data)
+            data = self.data.iloc[rows]
+            logger.debug('Correlation plot data of %s:\n%s', method_name, data)
             title = '{}'.format(method_name)
 
             plt.close('all')
@@ -1000,13 +1446,13 @@ class logDSubmissionCollection:
         output_dir_path = os.path.join(self.output_directory_path,
                                        self.LOGP_CORRELATION_PLOT_WITH_SEM_BY_METHOD_PATH_DIR)
         os.makedirs(output_dir_path, exist_ok=True)
-        for method_name in self.data.method_name.unique():
+        for method_name, rows in build_group_index(self.data.method_name).items():
 
             # Skip NULL0 submission
             if "NULL" in method_name:
                 continue
 
-            data = self.data[self.data.method_name == method_name]
+            data = self.data.iloc[rows]
             title = '{}'.format(method_name)
 
             plt.close('all')
@@ -1044,8 +1490,8 @@ class logDSubmissionCollection:
         self.data.loc[:, "absolute error"] = np.absolute(self.data.loc[:, "$\Delta$logD error (calc - exp)"])
 
         # Create a separate plot for each submission.
-        for method_name in self.data.method_name.unique():
-            data = self.data[self.data.method_name == method_name]
+        for method_name, rows in build_group_index(self.data.method_name).items():
+            data = self.data.iloc[rows]
             title = '{}'.format(method_name)
 
             plt.close('all')
@@ -1057,7 +1503,8 @@ class logDSubmissionCollection:
 
 def generate_statistics_tables(submissions, predicted_data, stats_funcs, directory_path, file_base_name,
                                 sort_stat=None, ordering_functions=None,
-                                latex_header_conversions=None, ignore_refcalcs = True):
+                                latex_header_conversions=None, ignore_refcalcs = True, bootstrap_seed=BOOTSTRAP_SEED,
+                                n_bootstrap_samples=N_BOOTSTRAP_SAMPLES, bootstrap_ci_tolerance=BOOTSTRAP_CI_TOLERANCE):
     stats_names = list(stats_funcs.keys())
     ci_suffixes = ('', '_lower_bound', '_upper_bound')
 
@@ -1085,13 +1532,26 @@ def generate_statistics_tables(submissions, predicted_data, stats_funcs, directo
         if submission.reference_submission and ignore_refcalcs:
             continue
 
-        print('\rGenerating bootstrap statistics for submission {} ({}/{})'
-                  ''.format(method_name, i + 1, len(submissions)), end='')
+        logger.debug('Generating bootstrap statistics for submission %s (%d/%d)',
+                     method_name, i + 1, len(submissions))
+
+        # Each submission and statistic has its own reproducible random stream.
+        if bootstrap_seed is None:
+            statistics_random_state, error_slope_random_state = None, None
+        else:
+            statistics_random_state = bootstrap_random_state(bootstrap_seed, file_name, 'statistics')
+            error_slope_random_state = bootstrap_random_state(bootstrap_seed, file_name, 'ES')
 
-        bootstrap_statistics = submission.compute_logD_statistics(predicted_data,experimental_data, stats_funcs)
+        bootstrap_statistics = submission.compute_logD_statistics(predicted_data,experimental_data, stats_funcs,
+                                                                  random_state=statistics_random_state,
+                                                                  n_bootstrap_samples=n_bootstrap_samples,
+                                                                  ci_tolerance=bootstrap_ci_tolerance)
+        # The adaptive bootstrap may have stopped before n_bootstrap_samples.
+        n_used_bootstrap_samples = max(len(bootstrap_samples) for _, _, bootstrap_samples in bootstrap_statistics.values())
 
         # Compute error slope
-        error_slope_bootstrap_statistics, QQplot_data = submission.compute_logD_model_uncertainty_statistics(predicted_data,experimental_data)
+        error_slope_bootstrap_statistics, QQplot_data = submission.compute_logD_model_uncertainty_statistics(
+            predicted_data,experimental_data, random_state=error_slope_random_state)
         #print("error_slope_bootstrap_statistics:\n")
         #print(error_slope_bootstrap_statistics)
 
@@ -1123,12 +1583,12 @@ def generate_statistics_tables(submissions, predicted_data, stats_funcs, directo
         escaped_name = file_name.replace('_', '\_')
         statistics_latex.append({'ID': method_name, 'name': escaped_name, 'category': category, 'type':type, **record_latex})'''
 
+        record_csv['n_bootstrap_samples'] = n_used_bootstrap_samples
         statistics_csv.append({'method name': method_name, 'file name': file_name, 'category': category, 'type': type, **record_csv})
         escaped_name = file_name.replace('_', '\_')
         statistics_latex.append({'method name': method_name, 'file name': escaped_name, 'category': category, 'type':type, **record_latex})
-    print()
-    print("statistics_csv:\n",statistics_csv)
-    print()
+    logger.info('Generated bootstrap statistics for %d submissions', len(statistics_csv))
+    logger.debug('Statistics:\n%s', statistics_csv)
 
 
     # Write QQplot_dict to a JSON file for plotting later
@@ -1161,7 +1621,7 @@ def generate_statistics_tables(submissions, predicted_data, stats_funcs, directo
     '''statistics_csv = statistics_csv[['name', "category", "type"] + stats_names_csv + ["ES", "ES_lower_bound", "ES_upper_bound"] ]
     statistics_latex = statistics_latex[['ID', 'name'] + stats_names_latex + ["ES"]] ## Add error slope(ES)'''
 
-    statistics_csv = statistics_csv[['file name', "category", "type"] + stats_names_csv + ["ES", "ES_lower_bound", "ES_upper_bound"] ]
+    statistics_csv = statistics_csv[['file name', "category", "type"] + stats_names_csv + ["ES", "ES_lower_bound", "ES_upper_bound", "n_bootstrap_samples"] ]
     statistics_latex = statistics_latex[['method name', 'file name', "category", "type"] + stats_names_latex + ["ES"]] ## Add error slope(ES)
 
     # Create CSV and JSON tables (correct LaTex syntax in column names).
@@ -1195,7 +1655,9 @@ def generate_statistics_tables(submissions, predicted_data, stats_funcs, directo
                 '- m: slope of the line fit to predicted vs experimental logD values\n\n'
                 '- $\\tau$:  Kendall rank correlation coefficient\n\n'
                 '- ES: error slope calculated from the QQ Plots of model uncertainty predictions\n\n'
-                '- Mean and 95\% confidence intervals of RMSE, MAE, ME, R2, and m were calculated by bootstrapping with 10000 samples.\n\n'
+                '- Mean and 95\% confidence intervals of RMSE, MAE, ME, R2, and m were calculated by bootstrapping with '
+                + ('{} samples.\n\n'.format(n_bootstrap_samples) if bootstrap_ci_tolerance is None else
+                   'up to {} samples (see the n\\_bootstrap\\_samples column of the CSV table).\n\n'.format(n_bootstrap_samples)) +
                 '- 95\% confidence intervals of ES were calculated by bootstrapping with 1000 samples.'
                 #'- Some logD predictions were submitted after the submission deadline to be used as a reference method.\n\n'
                 '\end{document}\n')
@@ -1227,7 +1689,7 @@ def generate_performance_comparison_plots(statistics_filename, directory_path, i
         # Read statistics table
         statistics_file_path = os.path.join(directory_path, statistics_filename)
         df_statistics = pd.read_csv(statistics_file_path)
-        print("\n df_statistics \n", df_statistics)
+        logger.debug('Statistics of %s:\n%s', statistics_file_path, df_statistics)
 
         # RMSE comparison plot
         barplot_with_CI_errorbars(df=df_statistics, x_label="method name", y_label="RMSE", y_lower_label="RMSE_lower_bound",
@@ -1348,7 +1810,7 @@ def generate_performance_comparison_plots(statistics_filename, directory_path, i
 
 
         for category in category_list:
-            print("category: ",category)
+            logger.debug('Generating performance comparison plots for category %s', category)
             #print("df_statistics.columns:\n", df_statistics.columns)
 
             # Take subsection of dataframe for each category
@@ -1510,7 +1972,7 @@ def generate_QQplots_for_model_uncertainty(input_file_name, directory_path):
     #           yLabel="Fraction of predictions within range", fileName=QQplot_output_filename,
     #           uncLabel='Model Unc.', leg=[0.05, 0.95, "upper left", 1], ax1=None)
 
-    print("QQ Plots for model uncertainty generated.")
+    logger.info('QQ Plots for model uncertainty generated.')
 
 
 # =============================================================================
@@ -1519,6 +1981,8 @@ def generate_QQplots_for_model_uncertainty(input_file_name, directory_path):
 
 if __name__ == '__main__':
 
+    logging.basicConfig(level=LOG_LEVEL, format='%(levelname)s: %(message)s')
+
     sns.set_style('whitegrid')
     sns.set_context('paper')
 
@@ -1538,8 +2002,7 @@ if __name__ == '__main__':
     #print("Experimental data: \n", experimental_data)
 
     # Import user map.
-    with open(USER_MAP_FILE_PATH, 'r') as f:
-        user_map = pd.read_csv(f)
+    user_map = UserMap.from_csv(USER_MAP_FILE_PATH)
 
     # Configuration: statistics to compute.
     stats_funcs = collections.OrderedDict([
@@ -1569,8 +2032,7 @@ if __name__ == '__main__':
     # ==========================================================================================
 
     # Load submissions data.
-    submissions_logD = load_submissions(LOGD_SUBMISSIONS_DIR_PATH, user_map)
-    print("done w/ submissions_logD")
+    submissions_logD = load_submissions(LOGD_SUBMISSIONS_DIR_PATH, user_map, n_workers=N_LOAD_WORKERS, lazy=True)
 
     # Perform the analysis
     #output_directory_path='./analysis_outputs_all_submissions'
@@ -1622,7 +2084,7 @@ if __name__ == '__main__':
     #==========================================================================================
 
     # Load submissions data.
-    #ranked_submissions_logD = load_ranked_submissions(LOGD_SUBMISSIONS_DIR_PATH, user_map)
+    #ranked_submissions_logD = load_ranked_submissions(LOGD_SUBMISSIONS_DIR_PATH, user_map, n_workers=N_LOAD_WORKERS)
 
     # Perform the analysis
     #output_directory_path='./analysis_outputs_ranked_submissions'
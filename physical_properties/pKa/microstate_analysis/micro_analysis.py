@@ -1,5 +1,7 @@
 import os
+import sys
 import glob
+import collections
 import io
 import pandas as pd
 import numpy as np
@@ -9,6 +11,11 @@ from pylab import rcParams
 from matplotlib import cm
 import joypy
 
+# The parsing utilities are shared with the logD analysis in physical_properties/.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from sampl_io import (IgnoredSubmissionError, BadFormatError, UserMap, parse_csv_lines,
+                      load_cached_sections, load_submissions_files, build_prediction_table)
+
 
 
 # =============================================================================
@@ -19,27 +26,28 @@ import joypy
 pKa_SUBMISSIONS_DIR_PATH = '../relative_microstate_free_energy_predictions/'
 USER_MAP_FILE_PATH = '../SAMPL8-pKa-user-map.csv'
 
+# Number of threads used to parse the submission files concurrently.
+N_LOAD_WORKERS = 4
+
+# Directory where the parsed submission files are cached between runs
+# (None disables the cache). It is in this script's directory so that the
+# cache does not depend on the working directory.
+SUBMISSIONS_CACHE_DIR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'SubmissionsCache')
+
 
 # =============================================================================
 # UTILITY CLASSES
 # =============================================================================
 
-class IgnoredSubmissionError(Exception):
-    """Exception used to signal a submission that must be ignored."""
-    pass
-
-
-class BadFormatError(Exception):
-    """Exception used to signal a submission with unexpected formatting."""
-    pass
-
-
 class SamplSubmission:
     """A generic SAMPL submission.
     Parameters
     ----------
     file_path : str
         The path to the submission file.
+    user_map : UserMap or pandas.DataFrame or None
+        The map used to assign the submission ID (sid). A DataFrame is
+        indexed on the fly, so pass a UserMap when loading many submissions.
     Raises
     ------
     IgnoredSubmission
@@ -52,10 +60,30 @@ class SamplSubmission:
     # Sections in CSV format with columns names.
     CSV_SECTIONS = {}
 
+    # Columns of the predicted quantities in the prediction table (see
+    # sampl_io.build_prediction_table()): quantity -> (value, SEM, model uncertainty).
+    PREDICTION_QUANTITIES = {}
+
+    # Other columns of the predictions carried in the prediction table: table column -> data column.
+    PREDICTION_SYSTEM_COLUMNS = {}
+
+    # Directory where the parsed sections are cached (None disables the cache).
+    SECTIONS_CACHE_DIR_PATH = None
+
     def __init__(self, file_path, user_map):
         file_name = os.path.splitext(os.path.basename(file_path))[0]
         file_data = file_name.split('-')
 
+        # Store user map information. Files without a unique entry have no submission ID.
+        sid_file_name = os.path.basename(file_path)
+        if user_map is not None and not isinstance(user_map, UserMap):
+            user_map = UserMap(user_map)
+        if (user_map is not None and sid_file_name in user_map and
+                sid_file_name not in user_map.duplicated_file_names):
+            self.sid = user_map.get_sid(sid_file_name)
+        else:
+            self.sid = None
+
         # Load predictions.
         sections = self._load_sections(file_path)  # From parent-class.
         self.data = sections['Predictions']  # This is a list
@@ -72,20 +100,41 @@ class SamplSubmission:
             print("REF found: ", self.method_name)
             self.reference_submission = True
 
+    def _get_quantity_data(self, quantity):
+        """Return the DataFrame holding the predictions of the quantity."""
+        return self.data
+
+    def _get_prediction_metadata(self):
+        """Return the metadata repeated on each row of the prediction table."""
+        return {'sid': self.sid}
+
     @classmethod
     def _read_lines(cls, file_path):
-        """Generator to read the file and discard blank lines and comments."""
+        """Generator to read the file and discard blank lines and comments.
+
+        The file is read with a single call and split in memory.
+        """
         with open(file_path, 'r', encoding='utf-8-sig') as f:
-            for line in f:
-                # Strip whitespaces.
-                line = line.strip()
-                # Don't return blank lines and comments.
-                if line != '' and line[0] != '#':
-                    yield line
+            content = f.read()
+        for line in content.splitlines():
+            # Strip whitespaces.
+            line = line.strip()
+            # Don't return blank lines and comments.
+            if line != '' and line[0] != '#':
+                yield line
 
     @classmethod
     def _load_sections(cls, file_path):
-        """Load the data in the file and separate it by sections."""
+        """Load the data in the file and separate it by sections.
+
+        If SECTIONS_CACHE_DIR_PATH is set, the parsed sections are cached on disk
+        (see sampl_io.load_cached_sections()).
+        """
+        return load_cached_sections(cls, file_path)
+
+    @classmethod
+    def _parse_sections(cls, file_path):
+        """Parse the file and separate the data by sections."""
         #print("file_path",file_path)
         sections = {}
         current_section = None
@@ -118,8 +167,11 @@ class SamplSubmission:
         # Create a Pandas dataframe from the CSV format.
         for section_name, pandas_kwargs in cls.CSV_SECTIONS.items():
             try:
-                csv_str = io.StringIO('\n'.join(sections[section_name]))
-                section = pd.read_csv(csv_str, skipinitialspace=True, **pandas_kwargs)
+                if set(pandas_kwargs) <= {'names', 'index_col'}:
+                    section = parse_csv_lines(sections[section_name], **pandas_kwargs)
+                else:
+                    csv_str = io.StringIO('\n'.join(sections[section_name]))
+                    section = pd.read_csv(csv_str, skipinitialspace=True, **pandas_kwargs)
                 sections[section_name] = section
             except:
                 print(f"Error loading {section_name}, continuing without.") #If it's not there, don't save
@@ -173,6 +225,12 @@ class pKaSubmission(SamplSubmission):
     CSV_SECTIONS = {'Predictions': {'names': ('System ID', 'Alternate State','formal charge', '$\Delta\Delta $G', 
         'SEM $\Delta \Delta $G', 'd$\Delta \Delta$G', 'SMILES'),'index_col': 'System ID'}}
 
+    PREDICTION_QUANTITIES = {'relative free energy': CSV_SECTIONS['Predictions']['names'][3:6]}
+
+    PREDICTION_SYSTEM_COLUMNS = {'reference_state': 'Alternate State', 'total_charge': 'formal charge'}
+
+    SECTIONS_CACHE_DIR_PATH = SUBMISSIONS_CACHE_DIR_PATH
+
     def __init__(self, file_path, user_map):
         super().__init__(file_path, user_map)
 
@@ -188,34 +246,52 @@ class pKaSubmission(SamplSubmission):
         self.organization = sections['Participant organization'][0].strip()
         self.ranked = sections['Ranked'][0].strip() =='True'
 
+    def _get_prediction_metadata(self):
+        return {
+            'sid': self.sid,
+            'participant': self.participant,
+            'method': self.method_name,
+            'file_name': self.file_name,
+            'category': self.category,
+            'ranked': self.ranked,
+        }
+
 
 # =============================================================================
 # UTILITY FUNCTIONS
 # =============================================================================
 
 
-def load_submissions(directory_path, user_map):
+def load_submissions(directory_path, user_map, n_workers=1, use_processes=False):
     """Load submissions from a specified directory using a specified user map.
     Optional argument:
         ref_ids: List specifying submission IDs (alphanumeric, typically) of
         reference submissions which are to be ignored/analyzed separately.
+    If n_workers is greater than 1, the files are parsed concurrently in a
+    pool of threads (or processes if use_processes is True). Submissions
+    raising IgnoredSubmissionError are skipped, and other errors (e.g.,
+    BadFormatError) are raised for the first offending file as in the serial
+    loader.
     Returns: submissions
     """
-    submissions = []
-    for file_path in glob.glob(os.path.join(directory_path, '*.csv')):
-        try:
-            submission = pKaSubmission(file_path, user_map)
-
-        except IgnoredSubmissionError:
-            continue
-        submissions.append(submission)
-    return submissions
+    return load_submissions_files(pKaSubmission, glob.glob(os.path.join(directory_path, '*.csv')), user_map,
+                                  n_workers, use_processes)
 
 
 
 class pKaSubmissionCollection:
     """A collection of pKa submissions."""
 
+    # Submissions converted to kcal/mol.
+    KCAL_MOL_CONVERSION_FILE_NAMES = ["pKa-ECRISM-1", "pKa-VA-2-charge-correction", "pKa_RodriguezPaluch_SMD_1",
+                                      "pKa_RodriguezPaluch_SMD_2", "pKa_RodriguezPaluch_SMD_3"]
+
+    # Submissions which seem to be in kJ/mol.
+    KJ_MOL_FILE_NAMES = ["pka-nhlbi-1c"]
+
+    # Submissions whose sign is corrected.
+    SIGN_ERROR_FILE_NAMES = ["pKa-VA-2-charge-correction", "pka-nhlbi-1c", "pKa_RodriguezPaluch_SMD_1",
+                             "pKa_RodriguezPaluch_SMD_2", "pKa_RodriguezPaluch_SMD_3"]
 
     def __init__(self, submissions, output_directory_path, pKa_submission_collection_file_path, no_outliers = True):
 
@@ -226,90 +302,48 @@ class pKaSubmissionCollection:
         C_unit = 1 / beta * np.log(10)
 
         # Build collection dataframe from the beginning.
-        # Build full pKa collection table.
-
-        data = []
-
-        # Submissions for pKa.
-        for submission in submissions_RFE:
-            #print(submission.file_name)
-            if "RFE-NHLBI-TZVP-QM" in submission.method_name and no_outliers:
-                continue
-            #print(submission.method_name)
-            #print(submission.data.keys())
-
-            for mol_ID, series in submission.data.iterrows():
-                ref_state = submission.data.loc[mol_ID, "Alternate State"]
-
-                RFE_mean_pred_original = submission.data.loc[mol_ID, '$\Delta\Delta $G']
-                #print(RFE_mean_pred_original)
-                RFE_SEM_pred_original = submission.data.loc[mol_ID, 'SEM $\Delta \Delta $G']
-                total_charge = submission.data.loc[mol_ID, 'formal charge']
-                #print(total_charge)
-                RFE_model_uncertainty_original =  submission.data.loc[mol_ID, 'd$\Delta \Delta$G']
-
-                '''# correct sign + unit
-                if submission.file_name in ["pKa-VA-2", "pKa_RodriguezPaluch_SMD_1", "pKa_RodriguezPaluch_SMD_2", "pKa_RodriguezPaluch_SMD_3"]:
-                    sign_error = "yes"
-                    RFE_mean_pred = RFE_mean_pred_original*-1
-
-                    RFE_mean_pred = RFE_mean_pred*1.36 #convert submission to kcal/mol
-                    RFE_SEM_pred = RFE_SEM_pred_original*1.36
-                    RFE_model_uncertainty = RFE_model_uncertainty_original*1.36'''
-
-                # Convert submissions to kcal/mol
-                if submission.file_name in ["pKa-ECRISM-1", "pKa-VA-2-charge-correction", "pKa_RodriguezPaluch_SMD_1", "pKa_RodriguezPaluch_SMD_2", "pKa_RodriguezPaluch_SMD_3"]:
-                    RFE_mean_pred = RFE_mean_pred_original*C_unit #convert submission to kcal/mol
-                    RFE_SEM_pred = RFE_SEM_pred_original*C_unit
-                    RFE_model_uncertainty = RFE_SEM_pred_original*C_unit
-
-                # fix submission which seems to be in kJ/mol
-                if submission.file_name in ["pka-nhlbi-1c"]:
-                    # correct free energies into kcal/mol
-                    # submission seemed to have used C_units = 5.69 for kJ/mol, so can divide by 4.186 to get kcal/mol
-
-                    #sign_error = "yes"
-                    #RFE_mean_pred = RFE_mean_pred_original*-1
-
-                    RFE_mean_pred = RFE_mean_pred_original/4.186
-                    RFE_SEM_pred = RFE_SEM_pred_original/4.186
-                    RFE_model_uncertainty = RFE_model_uncertainty_original/4.186
-
-
-                #If single transition states are opposite in sign from macro pKa, we assume they made a sign error
-                if submission.file_name in [ "pKa-VA-2-charge-correction", "pka-nhlbi-1c", "pKa_RodriguezPaluch_SMD_1","pKa_RodriguezPaluch_SMD_2", "pKa_RodriguezPaluch_SMD_3"]:
-                    RFE_mean_pred = RFE_mean_pred*-1 #fix sign error
-                    submission.data.loc[mol_ID, "relative free energy"] = RFE_mean_pred
-                    sign_error = "yes"
-
-                    data.append({
-                        'method name': submission.method_name,
-                        'file name': submission.file_name,
-                        'reference state': ref_state,
-                        'ID tag': mol_ID,
-                        'total charge': total_charge,
-                        'sign correction?': sign_error,
-                        'Relative microstate free energy prediction': RFE_mean_pred,
-                        'Relative microstate free energy SEM': RFE_SEM_pred,
-                        'model uncertainty': RFE_model_uncertainty,
-                        'Relative microstate free energy prediction (original)': RFE_mean_pred_original,
-                        'Relative microstate free energy SEM (original)': RFE_SEM_pred_original,
-                        'model uncertainty (original)': RFE_model_uncertainty_original
-                    })
-                else:
-                    sign_error = "no"
-                    data.append({
-                        'method name': submission.method_name,
-                        'file name': submission.file_name,
-                        'reference state': ref_state,
-                        'ID tag': mol_ID ,
-                        'total charge': total_charge,
-                        'sign correction?': sign_error,
-                        'Relative microstate free energy prediction': RFE_mean_pred_original,
-                        'Relative microstate free energy SEM': RFE_SEM_pred_original,
-                        'model uncertainty': RFE_model_uncertainty_original
-                    })
-
+        # Build full pKa collection table from the prediction table.
+        prediction_table = build_prediction_table(submissions)
+        if no_outliers:
+            is_outlier = prediction_table['method'].astype(str).str.contains("RFE-NHLBI-TZVP-QM", regex=False)
+            prediction_table = prediction_table[~is_outlier.to_numpy()]
+
+        file_names = prediction_table['file_name']
+        RFE_mean_pred_original = prediction_table['value'].to_numpy()
+        RFE_SEM_pred_original = prediction_table['sem'].to_numpy()
+        RFE_model_uncertainty_original = prediction_table['model_uncertainty'].to_numpy()
+
+        # Convert submissions to kcal/mol
+        is_converted = file_names.isin(self.KCAL_MOL_CONVERSION_FILE_NAMES).to_numpy()
+        # fix submission which seems to be in kJ/mol
+        # submission seemed to have used C_units = 5.69 for kJ/mol, so can divide by 4.186 to get kcal/mol
+        is_kJ_mol = file_names.isin(self.KJ_MOL_FILE_NAMES).to_numpy()
+        RFE_mean_pred = np.select([is_converted, is_kJ_mol], [RFE_mean_pred_original*C_unit, RFE_mean_pred_original/4.186],
+                                  RFE_mean_pred_original)
+        RFE_SEM_pred = np.select([is_converted, is_kJ_mol], [RFE_SEM_pred_original*C_unit, RFE_SEM_pred_original/4.186],
+                                 RFE_SEM_pred_original)
+        RFE_model_uncertainty = np.select([is_converted, is_kJ_mol], [RFE_SEM_pred_original*C_unit, RFE_model_uncertainty_original/4.186],
+                                          RFE_model_uncertainty_original)
+
+        #If single transition states are opposite in sign from macro pKa, we assume they made a sign error
+        # The other submissions are reported as submitted.
+        is_sign_error = file_names.isin(self.SIGN_ERROR_FILE_NAMES).to_numpy()
+
+        data = collections.OrderedDict([
+            ('method name', prediction_table['method'].to_numpy(dtype=object)),
+            ('file name', file_names.to_numpy(dtype=object)),
+            ('reference state', prediction_table['reference_state'].to_numpy()),
+            ('ID tag', prediction_table['system_id'].to_numpy(dtype=object)),
+            ('total charge', prediction_table['total_charge'].to_numpy()),
+            ('sign correction?', np.where(is_sign_error, "yes", "no")),
+            ('Relative microstate free energy prediction', np.where(is_sign_error, -RFE_mean_pred, RFE_mean_pred_original)),
+            ('Relative microstate free energy SEM', np.where(is_sign_error, RFE_SEM_pred, RFE_SEM_pred_original)),
+            ('model uncertainty', np.where(is_sign_error, RFE_model_uncertainty, RFE_model_uncertainty_original)),
+        ])
+        if is_sign_error.any():
+            data['Relative microstate free energy prediction (original)'] = np.where(is_sign_error, RFE_mean_pred_original, np.nan)
+            data['Relative microstate free energy SEM (original)'] = np.where(is_sign_error, RFE_SEM_pred_original, np.nan)
+            data['model uncertainty (original)'] = np.where(is_sign_error, RFE_model_uncertainty_original, np.nan)
 
         # Transform into Pandas DataFrame.
         self.data = pd.DataFrame(data=data)
@@ -338,8 +372,7 @@ if __name__ == '__main__':
 
 
     # Import user map.
-    with open(USER_MAP_FILE_PATH, 'r') as f:
-        user_map = pd.read_csv(f)
+    user_map = UserMap.from_csv(USER_MAP_FILE_PATH)
 
     def read_collection_file(collection_file_path):
         """
@@ -484,7 +517,7 @@ if __name__ == '__main__':
 
 
     # Load submissions data.
-    submissions_RFE = load_submissions(pKa_SUBMISSIONS_DIR_PATH, user_map)
+    submissions_RFE = load_submissions(pKa_SUBMISSIONS_DIR_PATH, user_map, n_workers=N_LOAD_WORKERS)
 
 
     collection_logP = pKaSubmissionCollection(submissions_RFE, output_directory_path, pKa_submission_collection_file_path, no_outliers = False)
@@ -529,7 +562,7 @@ if __name__ == '__main__':
 
 
     # Load submissions data.
-    submissions_RFE = load_submissions(pKa_SUBMISSIONS_DIR_PATH, user_map)
+    submissions_RFE = load_submissions(pKa_SUBMISSIONS_DIR_PATH, user_map, n_workers=N_LOAD_WORKERS)
 
 
     collection_logP_no_outllier = pKaSubmissionCollection(submissions_RFE, output_directory_path, pKa_submission_collection_file_path, no_outliers = True)
@@ -0,0 +1,497 @@
+#!/usr/bin/env python
+
+"""Utilities to parse the submissions of the SAMPL8 physical property challenges.
+
+This module is shared by logD/analysis/logD_analysis.py and
+pKa/microstate_analysis/micro_analysis.py, which add this directory to
+sys.path to import it.
+"""
+
+
+# =============================================================================
+# GLOBAL IMPORTS
+# =============================================================================
+
+import os
+import io
+import glob
+import json
+import logging
+import collections
+import hashlib
+import zipfile
+import tempfile
+import concurrent.futures
+
+import numpy as np
+import pandas as pd
+
+
+logger = logging.getLogger(__name__)
+
+
+# =============================================================================
+# UTILITY CLASSES
+# =============================================================================
+
+class IgnoredSubmissionError(Exception):
+    """Exception used to signal a submission that must be ignored."""
+    pass
+
+
+class BadFormatError(Exception):
+    """Exception used to signal a submission with unexpected formatting."""
+    pass
+
+
+class UserMapError(Exception):
+    """Exception used to signal missing or duplicated entries in the user map."""
+    pass
+
+
+class UserMap:
+    """The map between submission file names and submission IDs.
+    The map is indexed by file name on construction so that looking up the
+    submission ID of a file does not require scanning the whole table.
+    Parameters
+    ----------
+    user_map : pandas.DataFrame
+        A table with a 'sid' and a 'file_name' column.
+    Attributes
+    ----------
+    duplicated_file_names : set
+        The file names that appear in more than one entry.
+    """
+
+    def __init__(self, user_map):
+        file_names = user_map['file_name'].astype(str)
+        sids = user_map['sid'].astype(str)
+        self.duplicated_file_names = set(file_names[file_names.duplicated()])
+        self._sids = dict(zip(file_names, sids))
+
+    @classmethod
+    def from_csv(cls, file_path):
+        """Read the user map from a CSV file with or without the 'sid,file_name' header."""
+        user_map = pd.read_csv(file_path, header=None, names=['sid', 'file_name'],
+                               dtype=str, skipinitialspace=True)
+        if len(user_map) > 0 and tuple(user_map.iloc[0]) == ('sid', 'file_name'):
+            user_map = user_map.iloc[1:]
+        return cls(user_map)
+
+    def __len__(self):
+        return len(self._sids)
+
+    def __contains__(self, file_name):
+        return file_name in self._sids
+
+    def get_sid(self, file_name):
+        """Return the submission ID of the file.
+        Raises UserMapError if the file name is missing or appears more than once.
+        """
+        if file_name in self.duplicated_file_names:
+            raise UserMapError('Multiple user map entries for {}.'.format(file_name))
+        try:
+            return self._sids[file_name]
+        except KeyError:
+            raise UserMapError('No user map entry for {}.'.format(file_name))
+
+    def check_file_names(self, file_names):
+        """Return the sorted lists of missing and duplicated file names."""
+        file_names = set(file_names)
+        missing_file_names = sorted(file_names - self._sids.keys())
+        duplicated_file_names = sorted(file_names & self.duplicated_file_names)
+        return missing_file_names, duplicated_file_names
+
+
+# =============================================================================
+# CSV PARSING
+# =============================================================================
+
+# Strings parsed as NaN (the default of pandas.read_csv()).
+_CSV_NA_VALUES = frozenset(['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan',
+                            '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None',
+                            'n/a', 'nan', 'null'])
+
+# Strings parsed as booleans by pandas.read_csv().
+_CSV_BOOL_VALUES = frozenset(['True', 'TRUE', 'true', 'False', 'FALSE', 'false'])
+
+
+def parse_csv_lines(lines, names, index_col=None):
+    """Parse the lines of a CSV section into a DataFrame.
+
+    Rows are split directly into typed columns (int64, float64, bool, or
+    strings) with the same type inference of pandas.read_csv(). Lines that
+    the simple tokenizer cannot handle (quoted fields or a wrong number of
+    fields) and columns whose type it cannot infer like pandas (see
+    _convert_csv_column()) are delegated to pandas.read_csv().
+    """
+    n_columns = len(names)
+    rows = [line.split(',') for line in lines]
+    columns = None
+    if all(len(row) == n_columns for row in rows) and not any('"' in line for line in lines):
+        # Transpose the rows into columns and skip the spaces after the delimiters.
+        columns = {name: _convert_csv_column([field.lstrip(' ') for field in column])
+                   for name, column in zip(names, zip(*rows))}
+    if columns is None or any(column is None for column in columns.values()):
+        csv_str = io.StringIO('\n'.join(lines))
+        return pd.read_csv(csv_str, names=names, index_col=index_col, skipinitialspace=True)
+
+    data = pd.DataFrame(columns, columns=list(names))
+    if index_col is not None:
+        data.set_index(index_col, inplace=True)
+    return data
+
+
+def _convert_csv_column(values):
+    """Convert a list of strings into an array of the inferred type.
+
+    Return None if the type inferred by pandas.read_csv() may be different:
+    booleans with missing values, integers out of the int64 range, and
+    numbers with underscores (which numpy accepts, but pandas does not).
+    """
+    is_na = [value in _CSV_NA_VALUES for value in values]
+    has_underscores = any('_' in value for value in values)
+    if not any(is_na):
+        try:
+            column = np.array(values, dtype=np.int64)
+        except OverflowError:
+            return None
+        except ValueError:
+            pass
+        else:
+            return None if has_underscores else column
+        if all(value in _CSV_BOOL_VALUES for value in values):
+            return np.array([value[0] in 'Tt' for value in values])
+    elif not all(is_na) and all(na or value in _CSV_BOOL_VALUES for value, na in zip(values, is_na)):
+        return None
+    try:
+        column = np.array(['nan' if na else value for value, na in zip(values, is_na)], dtype=np.float64)
+    except ValueError:
+        return np.array([np.nan if na else value for value, na in zip(values, is_na)], dtype=object)
+    return None if has_underscores else column
+
+
+# =============================================================================
+# SECTIONS CACHE
+# =============================================================================
+
+# The cache files are readable by the other users like the analysis output.
+_SECTIONS_CACHE_FILE_MODE = 0o644
+
+# Errors signaling a missing, corrupted, or outdated cache file.
+_SECTIONS_CACHE_READ_ERRORS = (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile)
+
+
+def load_cached_sections(submission_cls, file_path, metadata_only=False):
+    """Load the sections of the file using the on-disk cache of submission_cls.
+
+    The sections parsed by submission_cls._parse_sections() are cached in
+    submission_cls.SECTIONS_CACHE_DIR_PATH and re-used as long as the size and
+    content of the file, and the expected format, match. Each cache file is an
+    .npz archive holding the columns of the CSV sections and, in JSON, the
+    other sections (see _write_sections_cache_file()). Nothing is unpickled.
+    If metadata_only is True and the cache misses, only the metadata is
+    parsed and nothing is cached.
+    """
+    cache_dir_path = submission_cls.SECTIONS_CACHE_DIR_PATH
+    if cache_dir_path is None:
+        return _parse_sections(submission_cls, file_path, metadata_only)
+
+    with open(file_path, 'rb') as f:
+        content = f.read()
+    cache_key = {
+        'submission_cls': '{}.{}'.format(submission_cls.__module__, submission_cls.__qualname__),
+        'size': len(content),
+        'content_hash': hashlib.sha256(content).hexdigest(),
+        # Invalidate the cache if the expected format changes.
+        'format': repr((sorted(submission_cls.SECTIONS), submission_cls.CSV_SECTIONS)),
+    }
+
+    # The cache file is identified by the content so that it survives moving the files.
+    cache_file_name = hashlib.sha256(json.dumps(cache_key, sort_keys=True).encode()).hexdigest() + '.npz'
+    cache_file_path = os.path.join(cache_dir_path, cache_file_name)
+    source = _get_sections_cache_source(file_path)
+    try:
+        cached_key, cached_source, sections = _read_sections_cache_file(cache_file_path)
+    except _SECTIONS_CACHE_READ_ERRORS:
+        cached_key = None
+    if cached_key == cache_key:
+        # Record where the file was moved (or when it was touched) so that
+        # the cache file is not pruned (see prune_sections_cache()).
+        if cached_source != source:
+            _update_sections_cache_file(cache_file_path, cache_key, source, sections)
+        return sections
+    # Do not cache incomplete sections.
+    if metadata_only:
+        return _parse_sections(submission_cls, file_path, metadata_only)
+
+    sections = _parse_sections(submission_cls, file_path)
+    _update_sections_cache_file(cache_file_path, cache_key, source, sections)
+    return sections
+
+
+def prune_sections_cache(cache_dir_path):
+    """Remove the cache files of submission files that were deleted or modified.
+
+    Unreadable cache files and the pickle files used by older versions of
+    the cache are removed as well.
+    """
+    for cache_file_path in glob.glob(os.path.join(cache_dir_path, '*.p')):
+        os.remove(cache_file_path)
+    for cache_file_path in glob.glob(os.path.join(cache_dir_path, '*.npz')):
+        try:
+            with np.load(cache_file_path, allow_pickle=False) as cache_file:
+                source = json.loads(str(cache_file['metadata']))['source']
+            is_stale = _get_sections_cache_source(source['file_path']) != source
+        except _SECTIONS_CACHE_READ_ERRORS:
+            is_stale = True
+        if is_stale:
+            try:
+                os.remove(cache_file_path)
+            except FileNotFoundError:
+                # Pruned concurrently.
+                pass
+
+
+def _parse_sections(submission_cls, file_path, metadata_only=False):
+    """Call submission_cls._parse_sections() passing metadata_only only if it is set."""
+    if metadata_only:
+        return submission_cls._parse_sections(file_path, metadata_only=True)
+    return submission_cls._parse_sections(file_path)
+
+
+def _get_sections_cache_source(file_path):
+    """Return the path, size, and modification time of the submission file."""
+    stat = os.stat(file_path)
+    return {'file_path': os.path.abspath(file_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _update_sections_cache_file(cache_file_path, cache_key, source, sections):
+    """Write the cache file atomically as submissions may be loaded concurrently.
+
+    The sections are cached only if they are restored exactly.
+    """
+    cache_dir_path = os.path.dirname(cache_file_path)
+    os.makedirs(cache_dir_path, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=cache_dir_path, suffix='.tmp', delete=False) as f:
+        temp_file_path = f.name
+    try:
+        _write_sections_cache_file(temp_file_path, cache_key, source, sections)
+        if _are_sections_equal(_read_sections_cache_file(temp_file_path)[2], sections):
+            os.chmod(temp_file_path, _SECTIONS_CACHE_FILE_MODE)
+            os.replace(temp_file_path, cache_file_path)
+    except _SECTIONS_CACHE_READ_ERRORS + (TypeError,):
+        # E.g., sections that cannot be stored without pickle like a MultiIndex.
+        pass
+    finally:
+        if os.path.exists(temp_file_path):
+            os.remove(temp_file_path)
+
+
+def _write_sections_cache_file(cache_file_path, cache_key, source, sections):
+    """Store the sections in an .npz archive.
+
+    The 'metadata' entry is a JSON document with the cache key, the source
+    of the submission file (see _get_sections_cache_source()), the sections
+    that are lists of lines, and the layout of the CSV sections, whose index
+    and columns are stored as separate arrays. Text columns are stored as
+    strings with a mask of the missing values.
+    """
+    metadata = {
+        'key': cache_key,
+        'source': source,
+        'sections': {},
+        'csv_sections': {},
+    }
+    arrays = {}
+    for section_idx, (section_name, section) in enumerate(sections.items()):
+        if not isinstance(section, pd.DataFrame):
+            metadata['sections'][section_name] = list(section)
+            continue
+        array_names = ['section{}_index'.format(section_idx)]
+        arrays.update(_encode_sections_cache_array(array_names[0], section.index.to_numpy()))
+        for column_idx, column_name in enumerate(section.columns):
+            array_names.append('section{}_column{}'.format(section_idx, column_idx))
+            arrays.update(_encode_sections_cache_array(array_names[-1], section[column_name].to_numpy()))
+        metadata['csv_sections'][section_name] = {
+            'index_name': section.index.name,
+            'columns': list(section.columns),
+            'arrays': array_names,
+        }
+    with open(cache_file_path, 'wb') as f:
+        np.savez(f, metadata=np.array(json.dumps(metadata)), **arrays)
+
+
+def _read_sections_cache_file(cache_file_path):
+    """Return the cache key, the source, and the sections stored by _write_sections_cache_file()."""
+    with np.load(cache_file_path, allow_pickle=False) as cache_file:
+        metadata = json.loads(str(cache_file['metadata']))
+        sections = dict(metadata['sections'])
+        for section_name, layout in metadata['csv_sections'].items():
+            index_array_name, *column_array_names = layout['arrays']
+            columns = {column_name: _decode_sections_cache_array(cache_file, array_name)
+                       for column_name, array_name in zip(layout['columns'], column_array_names)}
+            index = pd.Index(_decode_sections_cache_array(cache_file, index_array_name), name=layout['index_name'])
+            sections[section_name] = pd.DataFrame(columns, index=index, columns=layout['columns'])
+    return metadata['key'], metadata['source'], sections
+
+
+def _encode_sections_cache_array(array_name, values):
+    """Return the arrays storing the values without pickle."""
+    if values.dtype.kind in 'biuf':
+        return {array_name: values}
+    is_na = pd.isna(values)
+    if not all(isinstance(value, str) for value in values[~is_na]):
+        raise TypeError('Only text columns can be stored in the sections cache.')
+    return {array_name + '_text': np.array(['' if na else value for value, na in zip(values, is_na)], dtype=str),
+            array_name + '_na': is_na}
+
+
+def _decode_sections_cache_array(cache_file, array_name):
+    """Return the values stored by _encode_sections_cache_array()."""
+    if array_name in cache_file.files:
+        return cache_file[array_name]
+    values = cache_file[array_name + '_text'].astype(object)
+    values[cache_file[array_name + '_na']] = np.nan
+    return values
+
+
+def _are_sections_equal(sections, other_sections):
+    """Check that two sets of parsed sections are identical, including the dtypes."""
+    if sections.keys() != other_sections.keys():
+        return False
+    for section_name, section in sections.items():
+        other_section = other_sections[section_name]
+        if isinstance(section, pd.DataFrame):
+            try:
+                pd.testing.assert_frame_equal(section, other_section)
+            except AssertionError:
+                return False
+        elif list(section) != list(other_section):
+            return False
+    return True
+
+
+# =============================================================================
+# LOADING
+# =============================================================================
+
+def load_submissions_files(submission_cls, file_paths, user_map, n_workers=1, use_processes=False,
+                           **submission_kwargs):
+    """Parse the submission files, optionally in parallel, skipping the ignored submissions.
+
+    Each file is parsed with submission_cls(file_path, user_map, **submission_kwargs).
+    If n_workers is greater than 1, the files are parsed concurrently in a
+    pool of threads (or processes if use_processes is True). Submissions
+    raising IgnoredSubmissionError are skipped, and other errors (e.g.,
+    BadFormatError) are raised for the first offending file as in the serial
+    loader.
+    """
+    # Index the user map once and report all the unmapped files at once.
+    if user_map is not None:
+        if not isinstance(user_map, UserMap):
+            user_map = UserMap(user_map)
+        missing_file_names, duplicated_file_names = user_map.check_file_names(
+            [os.path.basename(file_path) for file_path in file_paths])
+        if len(missing_file_names) > 0:
+            logger.warning('No user map entry for %s', ', '.join(missing_file_names))
+        if len(duplicated_file_names) > 0:
+            logger.warning('Multiple user map entries for %s', ', '.join(duplicated_file_names))
+
+    if n_workers > 1 and len(file_paths) > 1:
+        if use_processes:
+            executor_cls = concurrent.futures.ProcessPoolExecutor
+        else:
+            executor_cls = concurrent.futures.ThreadPoolExecutor
+        with executor_cls(max_workers=n_workers) as executor:
+            futures = [executor.submit(_load_submission, submission_cls, file_path, user_map, submission_kwargs)
+                       for file_path in file_paths]
+            # Collect the results in order so that errors surface as in the serial loader.
+            submissions = [future.result() for future in futures]
+    else:
+        submissions = [_load_submission(submission_cls, file_path, user_map, submission_kwargs)
+                       for file_path in file_paths]
+
+    # Remove the cached sections of the deleted or modified submission files.
+    if submission_cls.SECTIONS_CACHE_DIR_PATH is not None:
+        prune_sections_cache(submission_cls.SECTIONS_CACHE_DIR_PATH)
+    return [submission for submission in submissions if submission is not None]
+
+
+def _load_submission(submission_cls, file_path, user_map, submission_kwargs):
+    """Return the parsed submission or None if it must be ignored."""
+    try:
+        return submission_cls(file_path, user_map, **submission_kwargs)
+    except IgnoredSubmissionError:
+        return None
+
+
+# =============================================================================
+# PREDICTION TABLE
+# =============================================================================
+
+# Identifier columns of the prediction table that are stored as categoricals.
+PREDICTION_TABLE_CATEGORICAL_COLUMNS = ['sid', 'participant', 'method', 'category', 'file_name',
+                                        'system_id', 'quantity']
+
+
+def build_prediction_table(submissions):
+    """Stack the predictions of all the submissions into a single columnar table.
+
+    The table has one row for each submission, system, and predicted quantity.
+    The submission classes declare the predicted quantities as
+    PREDICTION_QUANTITIES = {quantity: (value, SEM, model uncertainty columns)},
+    whose DataFrame is returned by submission._get_quantity_data(quantity),
+    and the other columns of that DataFrame to carry along as
+    PREDICTION_SYSTEM_COLUMNS = {table column: data column}. The submissions
+    are identified by their position in the list ('submission_index'), and
+    their metadata (see submission._get_prediction_metadata()) is repeated on
+    each row. The identifier columns are categoricals, and the predictions are
+    stored in the float64 columns 'value', 'sem', and 'model_uncertainty'
+    (non-numeric values are converted to NaN).
+
+    Parameters
+    ----------
+    submissions : list of SamplSubmission
+        The submissions. Lazily-loaded submissions are parsed.
+
+    Returns
+    -------
+    prediction_table : pandas.DataFrame
+        The predictions of all the submissions.
+    """
+    # Collect the metadata once per submission and the predictions as arrays.
+    metadata = collections.defaultdict(list)
+    predictions = collections.defaultdict(list)
+    n_rows = []
+    for submission in submissions:
+        for key, value in submission._get_prediction_metadata().items():
+            metadata[key].append(value)
+        submission_n_rows = 0
+        for quantity, column_names in submission.PREDICTION_QUANTITIES.items():
+            data = submission._get_quantity_data(quantity)
+            predictions['system_id'].append(data.index.to_numpy(dtype=object))
+            predictions['quantity'].append(np.full(len(data), quantity, dtype=object))
+            for key, column_name in zip(['value', 'sem', 'model_uncertainty'], column_names):
+                values = pd.to_numeric(data[column_name], errors='coerce')
+                predictions[key].append(values.to_numpy(dtype=np.float64))
+            for key, column_name in submission.PREDICTION_SYSTEM_COLUMNS.items():
+                predictions[key].append(data[column_name].to_numpy(dtype=object))
+            submission_n_rows += len(data)
+        n_rows.append(submission_n_rows)
+
+    # Repeat the metadata of each submission on its rows.
+    columns = {'submission_index': np.repeat(np.arange(len(n_rows)), n_rows)}
+    for key, values in metadata.items():
+        if key in PREDICTION_TABLE_CATEGORICAL_COLUMNS:
+            values = pd.Categorical(values)
+            columns[key] = pd.Categorical.from_codes(np.repeat(values.codes, n_rows), values.categories)
+        else:
+            columns[key] = np.repeat(np.array(values), n_rows)
+    prediction_keys = ['system_id', 'quantity', 'value', 'sem', 'model_uncertainty']
+    for key in prediction_keys + [key for key in predictions if key not in prediction_keys]:
+        values = np.concatenate(predictions[key]) if len(n_rows) > 0 else []
+        if key in PREDICTION_TABLE_CATEGORICAL_COLUMNS:
+            values = pd.Categorical(values)
+        columns[key] = values
+    return pd.DataFrame(columns)